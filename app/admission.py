@@ -0,0 +1,218 @@
+# app/admission.py
+"""Admission control in front of agent turns: global concurrency limit, per-user rate limit, bounded queue.
+
+A turn is admitted in two steps:
+
+1. `controller.admit(user_id, lane)` runs synchronously on arrival. It either returns a Ticket or raises
+   Rejected (429 with Retry-After) if the user is over their token bucket or the wait queue is full.
+2. `ticket.slot()` waits for one of ADMIT_MAX_CONCURRENT slots. Queued interactive turns are granted
+   before queued batch turns. It raises Rejected (503) if the ticket's deadline passes first.
+
+Cheap requests (health, metrics, state reads and writes, scenarios) never take a ticket, so they are
+never stuck behind agent turns. Batch items use the "batch" lane: they are never rejected and never
+time out, but they only get slots that no interactive turn is waiting for, up to ADMIT_BATCH_MAX.
+"""
+import os, time, asyncio, heapq, itertools
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from . import metrics
+from .executor import executor, TURN_WORKERS
+
+# ---------- Config via env ----------
+ADMISSION_ENABLED    = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMIT_MAX_CONCURRENT = int(os.getenv("ADMIT_MAX_CONCURRENT", str(TURN_WORKERS)))   # agent turns running at once
+ADMIT_QUEUE_MAX      = int(os.getenv("ADMIT_QUEUE_MAX", str(2 * TURN_WORKERS)))     # interactive turns waiting
+ADMIT_QUEUE_TIMEOUT  = float(os.getenv("ADMIT_QUEUE_TIMEOUT_SEC", "15"))            # max wait for a slot
+ADMIT_BATCH_MAX      = int(os.getenv("ADMIT_BATCH_MAX", str(max(1, ADMIT_MAX_CONCURRENT // 2))))
+USER_TURNS_PER_MIN   = float(os.getenv("USER_TURNS_PER_MIN", "30"))                 # 0 disables the per-user limit
+USER_TURN_BURST      = float(os.getenv("USER_TURN_BURST", "6"))
+
+LANES = ("interactive", "batch")   # in priority order
+_PRIORITY = {lane: i for i, lane in enumerate(LANES)}
+
+class Rejected(Exception):
+    """Not admitted; the runtime answers `status` with a Retry-After header."""
+
+    def __init__(self, reason: str, status: int, retry_after: float):
+        super().__init__(f"{reason}; retry after {retry_after:.0f}s")
+        self.reason = reason
+        self.status = status
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+class _Bucket:
+    __slots__ = ("tokens", "at")
+
+    def __init__(self, tokens: float, at: float):
+        self.tokens, self.at = tokens, at
+
+class Ticket:
+    """One admitted turn. Counts toward the queue until it holds a slot; release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", user_id: str, lane: str, deadline: Optional[float]):
+        self.controller, self.user_id, self.lane, self.deadline = controller, user_id, lane, deadline
+        self.started_at = 0.0
+        self.running = False
+        self.released = False
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.controller._acquire(self)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+class AdmissionController:
+    """Slots, lanes and per-user buckets. Used from the event loop only, so no locks."""
+
+    def __init__(self, limit: int = ADMIT_MAX_CONCURRENT, queue_max: int = ADMIT_QUEUE_MAX,
+                 queue_timeout: float = ADMIT_QUEUE_TIMEOUT, batch_max: int = ADMIT_BATCH_MAX,
+                 rate_per_min: float = USER_TURNS_PER_MIN, burst: float = USER_TURN_BURST):
+        self.limit, self.queue_max, self.queue_timeout = max(1, limit), queue_max, queue_timeout
+        self.batch_max = max(1, batch_max)
+        self.rate, self.burst = rate_per_min / 60.0, max(1.0, burst)
+        self._running = {lane: 0 for lane in LANES}
+        self._queued = {lane: 0 for lane in LANES}        # admitted, not yet holding a slot
+        self._waiters: List[Any] = []                     # heap of (priority, seq, future, ticket)
+        self._seq = itertools.count()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._hold_ewma = 5.0                             # seconds a slot is held, for Retry-After estimates
+        self._stats = {"admitted": 0, "rejected_rate": 0, "rejected_queue": 0, "expired": 0}
+
+    def resize(self, limit: int, batch_max: Optional[int] = None):
+        """Grow or shrink the slot counts (the batch CLI raises them to its --concurrency)."""
+        self.limit = max(1, limit)
+        self.batch_max = max(1, batch_max if batch_max is not None else self.batch_max)
+        self._grant()
+
+    # ----- step 1: on arrival -----
+    def admit(self, user_id: str, lane: str = "interactive") -> Ticket:
+        if lane == "interactive" and ADMISSION_ENABLED:
+            if self._queued["interactive"] >= self.queue_max:
+                self._stats["rejected_queue"] += 1
+                raise Rejected("server busy", 429, self._queue_wait_estimate())
+            self._take_token(user_id)
+        deadline = time.monotonic() + self.queue_timeout if lane == "interactive" else None
+        self._queued[lane] += 1
+        self._stats["admitted"] += 1
+        return Ticket(self, user_id, lane, deadline)
+
+    def _take_token(self, user_id: str):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        b = self._buckets.get(user_id)
+        if b is None:
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            b = self._buckets[user_id] = _Bucket(self.burst, now)
+        b.tokens = min(self.burst, b.tokens + (now - b.at) * self.rate)
+        b.at = now
+        if b.tokens < 1:
+            self._stats["rejected_rate"] += 1
+            raise Rejected("rate limit exceeded", 429, (1 - b.tokens) / self.rate)
+        b.tokens -= 1
+
+    def _prune(self, now: float):
+        # A bucket that would have refilled completely carries no information.
+        full = [u for u, b in self._buckets.items() if b.tokens + (now - b.at) * self.rate >= self.burst]
+        for u in full:
+            del self._buckets[u]
+
+    def _queue_wait_estimate(self) -> float:
+        """Seconds until the current queue has drained: queued turns x mean slot hold / slots."""
+        return self._hold_ewma * self._queued["interactive"] / self.limit
+
+    # ----- step 2: waiting for a slot -----
+    def _can_run(self, lane: str) -> bool:
+        if sum(self._running.values()) >= self.limit:
+            return False
+        return lane != "batch" or self._running["batch"] < self.batch_max
+
+    async def _acquire(self, t: Ticket):
+        if t.released:
+            raise RuntimeError("ticket already released")
+        if not ADMISSION_ENABLED or (not self._waiters_ahead(t.lane) and self._can_run(t.lane)):
+            self._start(t)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_PRIORITY[t.lane], next(self._seq), fut, t))
+        timeout = None if t.deadline is None else max(0.0, t.deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()     # _grant skips cancelled waiters
+                self._stats["expired"] += 1
+                t.release()
+                raise Rejected("timed out waiting for capacity", 503, self._queue_wait_estimate()) from None
+        except BaseException:
+            if not fut.done():
+                fut.cancel()
+            raise
+        # Granted (possibly at the very moment the deadline passed; the slot is ours either way).
+
+    def _waiters_ahead(self, lane: str) -> bool:
+        """A queued turn of the same or higher priority exists (keeps FIFO within a lane)."""
+        return any(not w[2].done() and w[0] <= _PRIORITY[lane] for w in self._waiters)
+
+    def _start(self, t: Ticket):
+        self._queued[t.lane] -= 1
+        self._running[t.lane] += 1
+        t.running = True
+        t.started_at = time.monotonic()
+
+    def _release(self, t: Ticket):
+        if t.running:
+            self._running[t.lane] -= 1
+            self._hold_ewma += 0.1 * (time.monotonic() - t.started_at - self._hold_ewma)
+            self._grant()
+        else:
+            self._queued[t.lane] -= 1   # left the queue without running (deadline, disconnect, error)
+
+    def _grant(self):
+        # Highest priority first, FIFO within a lane; batch is the lowest lane, so stopping at the
+        # first waiter that cannot run never passes over one that could.
+        while self._waiters:
+            _, _, fut, t = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_run(t.lane):
+                break
+            heapq.heappop(self._waiters)
+            self._start(t)
+            fut.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        for lane in LANES:
+            out[f"{lane}_running"] = self._running[lane]
+            out[f"{lane}_queued"] = self._queued[lane]
+        out.update(limit=self.limit, queue_max=self.queue_max, users_tracked=len(self._buckets))
+        return out
+
+controller = AdmissionController()
+metrics.register_stats("admission", controller.stats)
+
+async def submit(ticket: Ticket, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """executor.submit behind a ticket: the user's earlier turns first, then a slot, then the pool.
+
+    Waiting for the user's own earlier turns happens before taking a slot, so a user with several turns
+    queued holds at most one slot. The ticket is released however this ends.
+    """
+    try:
+        async with executor.ordered(ticket.user_id):
+            async with ticket.slot():
+                return await executor.run(fn, *args, **kwargs)
+    finally:
+        ticket.release()
@@ -1,13 +1,25 @@
-import os, uuid, json, time, datetime as dt
+import os, uuid, json, time, asyncio, threading, datetime as dt
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator
 from decimal import Decimal
 import boto3
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from .tools_rag import rag_search
 
 # Strands
 from strands import Agent, tool
 from strands.models import BedrockModel
 from .log_s3 import put_json, _ts, sha256
+from .encoding import dumps_str
+from .executor import TURN_WORKERS
+from .state_cache import StateCache
+from .sessions import SessionPool, DynamoHistoryStore, SESSION_PERSIST
+from .context import RollingSummaryManager
+from .resilience import ResilientModel, dependency
+from . import scenarios
+from . import startup
+from . import metrics
 
 def logged_tool(fn):
     """Decorator that logs each tool call to S3 under 'code/'."""
@@ -25,28 +37,53 @@ def logged_tool(fn):
             "ts": ts,
             "args": {k: v for k, v in bound.arguments.items()},
         }
-        t0 = _time.time()
+        t0 = _time.perf_counter()
         try:
             result = fn(*args, **kwargs)
-            call_payload["duration_ms"] = int((_time.time() - t0) * 1000)
+            call_payload["duration_ms"] = int((_time.perf_counter() - t0) * 1000)
             call_payload["result"] = result
             put_json(user_id, "code", call_payload, ts=ts, key_suffix=fn.__name__)
+            metrics.record_tool(user_id, fn.__name__, ts, list(bound.arguments), call_payload["duration_ms"], True)
             return result
         except Exception as e:
-            call_payload["duration_ms"] = int((_time.time() - t0) * 1000)
+            call_payload["duration_ms"] = int((_time.perf_counter() - t0) * 1000)
             call_payload["error"] = repr(e)
             put_json(user_id, "code", call_payload, ts=ts, key_suffix=fn.__name__)
+            metrics.record_tool(user_id, fn.__name__, ts, list(bound.arguments), call_payload["duration_ms"], False)
             raise
     return wrapper
 
-AWS_REGION       = os.getenv("AWS_REGION", boto3.Session().region_name or "us-west-2")
+AWS_REGION       = os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION") or boto3.Session().region_name or "us-west-2"
 BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-3-7-sonnet-20250219-v1:0")
 DDB_TABLE        = os.getenv("STATE_TABLE", "SmallBizAgentState")
+PREFETCH_STATE   = os.getenv("PREFETCH_STATE", "1") == "1"   # state goes into the turn prompt; no get_state round-trip
+# Bedrock prompt-cache checkpoints after the tool specs and the system prompt ("default" = 5 min TTL; empty = off).
+BEDROCK_CACHE_TOOLS  = os.getenv("BEDROCK_CACHE_TOOLS", "default")
+BEDROCK_CACHE_PROMPT = os.getenv("BEDROCK_CACHE_PROMPT", "default")
+MODEL_CACHE_CONFIG   = {k: v for k, v in (("cache_tools", BEDROCK_CACHE_TOOLS), ("cache_prompt", BEDROCK_CACHE_PROMPT)) if v}
+MODEL_FALLBACK_ID    = os.getenv("MODEL_FALLBACK_ID", "")   # served while the primary model's circuit is open
+# Time to first streamed event, adaptive between these bounds (see resilience.py).
+MODEL_TTFT_MS        = (float(os.getenv("MODEL_TTFT_MIN_MS", "5000")), float(os.getenv("MODEL_TTFT_MAX_MS", "60000")))
 
-dynamo = boto3.resource("dynamodb", region_name=AWS_REGION)
+# ---------- Lazy AWS handles (nothing touches the network at import) ----------
+_INIT_LOCK = threading.Lock()
+_TABLE_LOCK = threading.Lock()   # ensure_table may wait minutes for a new table; nothing else waits on it
+_DYNAMO = None
+_TABLE = None
+_MODEL = None
+
+def _dynamo():
+    global _DYNAMO
+    if _DYNAMO is None:
+        with _INIT_LOCK:
+            if _DYNAMO is None:
+                with startup.timed("init_ms", "dynamodb.resource"):
+                    _DYNAMO = boto3.resource("dynamodb", region_name=AWS_REGION)
+    return _DYNAMO
 
 def ensure_table(table_name: str = DDB_TABLE):
-    c = boto3.client("dynamodb", region_name=AWS_REGION)
+    dynamo = _dynamo()
+    c = dynamo.meta.client
     try:
         c.describe_table(TableName=table_name)
         return dynamo.Table(table_name)
@@ -69,24 +106,104 @@ def ensure_table(table_name: str = DDB_TABLE):
             time.sleep(1.0)
         return dynamo.Table(table_name)
 
-table = ensure_table(DDB_TABLE)
+def _table():
+    """State table handle; ensure_table runs once, on first use (or during warm-up)."""
+    global _TABLE
+    if _TABLE is None:
+        _dynamo()
+        with _TABLE_LOCK:
+            if _TABLE is None:
+                with startup.timed("init_ms", "dynamodb.table"):
+                    _TABLE = ensure_table(DDB_TABLE)
+    return _TABLE
+
+def _get_model() -> ResilientModel:
+    """The one (breaker-wrapped) BedrockModel shared by every session."""
+    global _MODEL
+    if _MODEL is None:
+        with _INIT_LOCK:
+            if _MODEL is None:
+                with startup.timed("init_ms", "bedrock.model"):
+                    model = BedrockModel(model_id=BEDROCK_MODEL_ID, region_name=AWS_REGION, **MODEL_CACHE_CONFIG)
+                    fallback = (BedrockModel(model_id=MODEL_FALLBACK_ID, region_name=AWS_REGION, **MODEL_CACHE_CONFIG)
+                                if MODEL_FALLBACK_ID else None)
+                    _MODEL = resilient_model(model, fallback)
+    return _MODEL
+
+def resilient_model(model, fallback=None) -> ResilientModel:
+    return ResilientModel(model, dependency("bedrock.model", *MODEL_TTFT_MS, hedge=False), fallback)
 
 def _pk(user_id: str) -> str: return f"USER#{user_id}"
 def _num(x): return None if x is None else Decimal(str(x))
 def _utcnow(): return dt.datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
-# ---------- define model BEFORE building Agent ----------
-def _get_model():
-    # Create a Bedrock model with your configured region/model id
-    return BedrockModel(model_id=BEDROCK_MODEL_ID, region_name=AWS_REGION)
 
-@tool
-@logged_tool
-def get_state(user_id: str) -> dict:
-    """Load saved context for a user (business_idea, budget_finance, todos)."""
-    resp = table.query(KeyConditionExpression=Key("pk").eq(_pk(user_id)))
+# ---------- State cache (write-through, versioned) ----------
+# Every write bumps a per-user counter item (sk=STATE#VERSION) so any replica can tell its cached copy is stale.
+# Single-item and transactional writes bump it in the same TransactWriteItems call, so a write never lands
+# without its bump; add_todos (BatchWriteItem, not transactional) bumps it afterwards.
+VERSION_SK = "STATE#VERSION"
+state_cache = StateCache()
+
+def _version_bump(user_id: str) -> dict:
+    return {"Update": {
+        "TableName": DDB_TABLE,
+        "Key": {"pk": _pk(user_id), "sk": VERSION_SK},
+        "UpdateExpression": "ADD #v :one",
+        "ExpressionAttributeNames": {"#v": "version"},
+        "ExpressionAttributeValues": {":one": 1},
+    }}
+
+def _transact(user_id: str, items: list):
+    """Write `items` (TransactWriteItems entries) and bump the user's version atomically."""
+    _table().meta.client.transact_write_items(TransactItems=[*items, _version_bump(user_id)])
+
+def _bump_version(user_id: str) -> int:
+    resp = _table().update_item(
+        Key={"pk": _pk(user_id), "sk": VERSION_SK},
+        UpdateExpression="ADD #v :one",
+        ExpressionAttributeNames={"#v": "version"},
+        ExpressionAttributeValues={":one": 1},
+        ReturnValues="UPDATED_NEW",
+    )
+    return int(resp["Attributes"]["version"])
+
+def _current_version(user_id: str) -> int:
+    resp = _table().get_item(
+        Key={"pk": _pk(user_id), "sk": VERSION_SK},
+        ProjectionExpression="#v",
+        ExpressionAttributeNames={"#v": "version"},
+        ConsistentRead=True,
+    )
+    return int((resp.get("Item") or {}).get("version", 0))
+
+# Only the attributes get_state reads; skips e.g. timestamps and the (large) SESSION#HISTORY messages blob.
+_STATE_ATTRS = ["sk", "business_name", "idea", "market", "customer_count", "revenue_per_customer",
+                "cost_per_customer", "task", "due_date", "progress", "version"]
+_STATE_PROJECTION = ", ".join(f"#a{i}" for i in range(len(_STATE_ATTRS)))
+DONE_PROGRESS = {"done", "completed", "complete"}
+UPCOMING_DAYS = int(os.getenv("STATE_UPCOMING_DAYS", "14"))
+
+def _query_items(user_id: str):
+    """All items under USER#<id>, following LastEvaluatedKey across pages."""
+    kwargs = {
+        "KeyConditionExpression": Key("pk").eq(_pk(user_id)),
+        "ProjectionExpression": _STATE_PROJECTION,
+        # Fresh dict per call: boto3 merges the key-condition placeholders into it.
+        "ExpressionAttributeNames": {f"#a{i}": a for i, a in enumerate(_STATE_ATTRS)},
+    }
+    while True:
+        resp = _table().query(**kwargs)
+        yield from resp.get("Items", [])
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+def _load_state(user_id: str) -> tuple:
+    """Read the user's state straight from DynamoDB; returns (state, version)."""
     state = {"business_idea": None, "budget_finance": None, "todos": []}
-    for it in resp.get("Items", []):
+    version = 0
+    for it in _query_items(user_id):
         sk = it["sk"]
         if sk == "STATE#BUSINESS_IDEA":
             state["business_idea"] = {
@@ -107,32 +224,97 @@ def get_state(user_id: str) -> dict:
                 "due_date": it.get("due_date"),
                 "progress": it.get("progress"),
             })
+        elif sk == VERSION_SK:
+            version = int(it.get("version", 0))
+    return state, version
+
+def _written(user_id: str, mutate, bumped: bool = True):
+    """After a successful write: update (or drop) the cached state.
+
+    `bumped` says the write's own transaction bumped the version; otherwise it is bumped here. The write
+    has landed either way, so a failure now only costs this replica its cached copy.
+    """
+    try:
+        version = _current_version(user_id) if bumped else _bump_version(user_id)
+        state_cache.apply(user_id, version, mutate)
+    except Exception:
+        state_cache.invalidate(user_id)
+
+def _is_open(t: dict) -> bool:
+    return (t.get("progress") or "").strip().lower() not in DONE_PROGRESS
+
+def _is_upcoming(t: dict, today: dt.date) -> bool:
+    if not _is_open(t):
+        return False
+    try:
+        due = dt.date.fromisoformat(str(t.get("due_date") or "")[:10])
+    except ValueError:
+        return True  # free-form due dates cannot be ruled out
+    return due <= today + dt.timedelta(days=UPCOMING_DAYS)
+
+def _filter_todos(state: dict, todos: str) -> dict:
+    if todos == "open":
+        state["todos"] = [t for t in state["todos"] if _is_open(t)]
+    elif todos == "upcoming":
+        today = dt.datetime.utcnow().date()
+        state["todos"] = [t for t in state["todos"] if _is_upcoming(t, today)]
     return state
 
+@tool
+@logged_tool
+def get_state(user_id: str, todos: str = "all") -> dict:
+    """Load saved context for a user (business_idea, budget_finance, todos).
+
+    todos: "all" (default), "open" (not done), or "upcoming" (open and due within the next two weeks or overdue).
+    """
+    return read_state(user_id, todos)[0]
+
+def read_state(user_id: str, todos: str = "all", fresh: bool = False) -> tuple:
+    """(state, version) through the state cache; the version changes with every write to the user's state.
+
+    fresh=True always checks the stored version (one GetItem) instead of trusting a recent cache entry.
+    """
+    state, version = state_cache.get_versioned(
+        user_id,
+        load=lambda: _load_state(user_id),
+        current_version=lambda: _current_version(user_id),
+        fresh=fresh,
+    )
+    return _filter_todos(state, todos), version
+
 @tool
 @logged_tool
 def upsert_business_idea(user_id: str, business_name: str, idea: str, market: str) -> dict:
-    table.put_item(Item={
+    _transact(user_id, [{"Put": {"TableName": DDB_TABLE, "Item": {
         "pk": _pk(user_id),
         "sk": "STATE#BUSINESS_IDEA",
         "business_name": business_name,
         "idea": idea,
         "market": market,
         "updated_at": _utcnow(),
-    })
+    }}}])
+    _written(user_id, lambda s: s.update(business_idea={
+        "business_name": business_name, "idea": idea, "market": market,
+    }))
     return {"ok": True}
 
 @tool
 @logged_tool
 def upsert_budget_finance(user_id: str, customer_count: int, revenue_per_customer: float, cost_per_customer: float) -> dict:
-    table.put_item(Item={
+    _transact(user_id, [{"Put": {"TableName": DDB_TABLE, "Item": {
         "pk": _pk(user_id),
         "sk": "STATE#BUDGET_FINANCE",
         "customer_count": _num(customer_count),
         "revenue_per_customer": _num(revenue_per_customer),
         "cost_per_customer": _num(cost_per_customer),
         "updated_at": _utcnow(),
-    })
+    }}}])
+    # Mirror the DynamoDB round-trip (Decimal(str(x)) -> int/float) so cached and loaded state match.
+    _written(user_id, lambda s: s.update(budget_finance={
+        "customer_count": int(_num(customer_count)) if customer_count is not None else None,
+        "revenue_per_customer": float(_num(revenue_per_customer)) if revenue_per_customer is not None else None,
+        "cost_per_customer": float(_num(cost_per_customer)) if cost_per_customer is not None else None,
+    }))
     return {"ok": True}
 
 @tool
@@ -140,7 +322,7 @@ def upsert_budget_finance(user_id: str, customer_count: int, revenue_per_custome
 def add_todo(user_id: str, task: str, due_date: str, progress: str = "not_started") -> dict:
     todo_id = str(uuid.uuid4())
     now = _utcnow()
-    table.put_item(Item={
+    _transact(user_id, [{"Put": {"TableName": DDB_TABLE, "Item": {
         "pk": _pk(user_id),
         "sk": f"TODO#{todo_id}",
         "task": task,
@@ -148,70 +330,259 @@ def add_todo(user_id: str, task: str, due_date: str, progress: str = "not_starte
         "progress": progress,
         "created_at": now,
         "updated_at": now,
-    })
+    }}}])
+    _written(user_id, lambda s: s["todos"].append({
+        "id": todo_id, "task": task, "due_date": due_date, "progress": progress,
+    }))
     return {"id": todo_id}
 
-@tool
-@logged_tool
-def update_todo(user_id: str, todo_id: str, task: str | None = None, due_date: str | None = None, progress: str | None = None) -> dict:
+def _patch_todo(state: dict, todo_id: str, changes: dict):
+    for t in state["todos"]:
+        if t["id"] == todo_id:
+            t.update(changes)
+            return
+
+def _todo_update(task: str | None, due_date: str | None, progress: str | None) -> dict:
+    """UpdateExpression parts for an existing TODO item; only the given fields change."""
     expr, names, values = [], {}, {}
     if task is not None:     expr += ["#t = :t"]; names["#t"]="task"; values[":t"]=task
     if due_date is not None: expr += ["#d = :d"]; names["#d"]="due_date"; values[":d"]=due_date
     if progress is not None: expr += ["#p = :p"]; names["#p"]="progress"; values[":p"]=progress
     expr += ["updated_at = :u"]; values[":u"] = _utcnow()
-    table.update_item(
-        Key={"pk": _pk(user_id), "sk": f"TODO#{todo_id}"},
-        UpdateExpression="SET " + ", ".join(expr),
-        ExpressionAttributeNames=names if names else None,
-        ExpressionAttributeValues=values,
-    )
+    # update_item would otherwise upsert: an unknown id must fail, not create a task-less to-do.
+    out = {"UpdateExpression": "SET " + ", ".join(expr), "ExpressionAttributeValues": values,
+           "ConditionExpression": "attribute_exists(sk)"}
+    if names:
+        out["ExpressionAttributeNames"] = names
+    return out
+
+class TodoNotFound(ValueError):
+    """update_todo on an id the user does not have."""
+
+def _failed_conditions(e: Exception, ids: list) -> list:
+    """The ids whose ConditionExpression failed, from a cancelled transaction over `ids` (+ the version bump)."""
+    reasons = getattr(e, "response", {}).get("CancellationReasons") or []
+    return [tid for tid, r in zip(ids, reasons) if (r or {}).get("Code") == "ConditionalCheckFailed"]
+
+@tool
+@logged_tool
+def update_todo(user_id: str, todo_id: str, task: str | None = None, due_date: str | None = None, progress: str | None = None) -> dict:
+    client = _table().meta.client
+    try:
+        _transact(user_id, [{"Update": {
+            "TableName": DDB_TABLE,
+            "Key": {"pk": _pk(user_id), "sk": f"TODO#{todo_id}"},
+            **_todo_update(task, due_date, progress),
+        }}])
+    except client.exceptions.TransactionCanceledException as e:
+        if _failed_conditions(e, [todo_id]):
+            raise TodoNotFound(f"unknown todo_id: {todo_id}") from None
+        raise
+    changes = {k: v for k, v in (("task", task), ("due_date", due_date), ("progress", progress)) if v is not None}
+    _written(user_id, lambda s: _patch_todo(s, todo_id, changes))
     return {"ok": True}
 
+# ---------- Bulk to-do tools (one tool call instead of one per task) ----------
+TRANSACT_MAX = 100          # DynamoDB TransactWriteItems limit (one slot goes to the version bump)
+TRANSACT_RETRIES = 3
+
+@tool
+@logged_tool
+def add_todos(user_id: str, todos: list[dict]) -> dict:
+    """Add several to-dos at once. Each item: {"task": str, "due_date": str, "progress": str (optional, default "not_started")}."""
+    for n, t in enumerate(todos):  # all or nothing: reject bad entries before anything is written
+        if not isinstance(t, dict):
+            raise ValueError(f"todos[{n}]: expected an object with task and due_date")
+        for field in ("task", "due_date"):
+            if not isinstance(t.get(field), str) or not t[field].strip():
+                raise ValueError(f"todos[{n}]: {field} is required")
+        if t.get("progress") is not None and not isinstance(t["progress"], str):
+            raise ValueError(f"todos[{n}]: progress must be a string")
+    now = _utcnow()
+    created = [{"id": str(uuid.uuid4()), "task": t["task"], "due_date": t["due_date"],
+                "progress": t.get("progress") or "not_started"} for t in todos]
+    try:
+        # batch_writer groups puts into BatchWriteItem calls of 25 and resends UnprocessedItems automatically.
+        with _table().batch_writer() as bw:
+            for todo in created:
+                bw.put_item(Item={
+                    "pk": _pk(user_id),
+                    "sk": f"TODO#{todo['id']}",
+                    "task": todo["task"],
+                    "due_date": todo["due_date"],
+                    "progress": todo["progress"],
+                    "created_at": now,
+                    "updated_at": now,
+                })
+    except Exception:
+        # Some batches may have landed: make every replica reload rather than serve state without them.
+        state_cache.invalidate(user_id)
+        try:
+            _bump_version(user_id)
+        except Exception:
+            pass
+        raise
+    if created:
+        _written(user_id, lambda s: s["todos"].extend(dict(t) for t in created), bumped=False)
+    return {"ids": [t["id"] for t in created]}
+
+@tool
+@logged_tool
+def update_todos(user_id: str, updates: list[dict]) -> dict:
+    """Update several to-dos at once. Each item: {"todo_id": str, and any of "task", "due_date", "progress"}.
+
+    Items that change nothing are skipped; ids that do not exist are listed in "not_found", not created.
+    """
+    merged: dict = {}
+    for n, u in enumerate(updates):  # a transaction may touch each item only once
+        tid = u.get("todo_id") if isinstance(u, dict) else None
+        if not isinstance(tid, str) or not tid.strip():
+            raise ValueError(f"updates[{n}]: todo_id is required")
+        changes = {k: u[k] for k in ("task", "due_date", "progress") if u.get(k) is not None}
+        if changes:
+            merged.setdefault(tid.strip(), {}).update(changes)
+    client = _table().meta.client  # resource-backed client: accepts plain Python values
+    ids = list(merged)
+    not_found: list = []
+    chunk = TRANSACT_MAX - 1
+    for i in range(0, len(ids), chunk):
+        pending = ids[i:i + chunk]
+        conflicts = 0
+        while pending:
+            items = [{"Update": {
+                "TableName": DDB_TABLE,
+                "Key": {"pk": _pk(user_id), "sk": f"TODO#{tid}"},
+                **_todo_update(merged[tid].get("task"), merged[tid].get("due_date"), merged[tid].get("progress")),
+            }} for tid in pending]
+            try:
+                _transact(user_id, items)
+                break
+            except client.exceptions.TransactionCanceledException as e:
+                missing = _failed_conditions(e, pending)
+                if missing:   # drop the unknown ids and write the rest
+                    not_found += missing
+                    pending = [tid for tid in pending if tid not in missing]
+                    continue
+                # Otherwise usually a conflicting concurrent write; the chunk is retried after a short backoff.
+                conflicts += 1
+                if conflicts == TRANSACT_RETRIES:
+                    raise
+                time.sleep(0.05 * (2 ** (conflicts - 1)))
+    updated = [tid for tid in ids if tid not in not_found]
+    if updated:
+        def mutate(s):
+            for tid in updated:
+                _patch_todo(s, tid, merged[tid])
+        _written(user_id, mutate)
+    out = {"ok": True, "updated": len(updated)}
+    if not_found:
+        out["not_found"] = not_found
+    return out
+
+# ---------- Profit scenarios (NumPy; no arithmetic left to the model) ----------
+def run_scenarios(user_id: str, analyses: list | None = None, fixed_costs: float = 0.0,
+                  overrides: dict | None = None, options: dict | None = None) -> dict:
+    """scenarios.analyze on the user's saved budget_finance (shared by the tool and POST /scenarios)."""
+    budget = read_state(user_id)[0]["budget_finance"]
+    return scenarios.analyze(budget, analyses or ["base", "grid", "break_even"], fixed_costs, overrides, options)
+
+@tool
+@logged_tool
+def profit_scenarios(user_id: str, analyses: list[str] | None = None, fixed_costs: float = 0.0,
+                     customer_count: float | None = None, revenue_per_customer: float | None = None,
+                     cost_per_customer: float | None = None, months: int = 12,
+                     growth_rates: list[float] | None = None, churn_rate: float = 0.02,
+                     investment: float = 0.0, variation: float = 0.2) -> dict:
+    """Compute profit figures and what-if scenarios from the saved budget_finance.
+
+    analyses: any of "base" (monthly revenue / margins), "grid" (customer x price x cost sensitivity),
+    "growth" (monthly projection per growth rate), "break_even", "monte_carlo" (ranges and probability of loss).
+    Defaults to base, grid and break_even. customer_count / revenue_per_customer / cost_per_customer override
+    the saved values for this calculation only. fixed_costs and investment are monthly overhead and upfront spend.
+    """
+    overrides = {"customer_count": customer_count, "revenue_per_customer": revenue_per_customer,
+                 "cost_per_customer": cost_per_customer}
+    options = {
+        "growth": {"months": months, "churn_rate": churn_rate, "investment": investment,
+                   **({"growth_rates": growth_rates} if growth_rates else {})},
+        "break_even": {"investment": investment},
+        "monte_carlo": {"variation": variation, "months": months},
+    }
+    return run_scenarios(user_id, analyses, fixed_costs, overrides, options)
+
+# ---------- Direct state writes (REST API; same tools the agent calls, no model involved) ----------
+def write_state(user_id: str, kind: str, fields: dict) -> dict:
+    """kind: business_idea | budget_finance | add_todo | update_todo. Returns the tool's result."""
+    if kind == "business_idea":
+        return upsert_business_idea(user_id=user_id, **fields)
+    if kind == "budget_finance":
+        return upsert_budget_finance(user_id=user_id, **fields)
+    if kind == "add_todo":
+        return add_todo(user_id=user_id, **fields)
+    if kind == "update_todo":
+        return update_todo(user_id=user_id, **fields)
+    raise ValueError(f"unknown state kind: {kind}")
+
+_STATE_INSTRUCTIONS = (
+    "Each turn's message starts with STATE=<json>: the user's saved business_idea, budget_finance and todos as of "
+    "this turn. Use it directly; only call tools to change that state, compute scenarios or search.\n"
+    if PREFETCH_STATE else "Start each turn by calling get_state with USER_ID.\n"
+)
+
 SYSTEM_PROMPT = (
-    "You are a small-business coach. Start each turn by calling get_state with USER_ID.\n"
+    "You are a small-business coach. " + _STATE_INSTRUCTIONS +
     "For first-time users, collect & persist:\n"
     "- business_name, idea, market\n"
     "- customer_count, revenue_per_customer, cost_per_customer\n"
     "- at least one to-do (task, due_date, progress)\n"
-    "Ask before overwriting existing values. Compute: monthly_revenue, gross_margin_per_customer, monthly_gross_margin.\n"
-    "If the user's question cannot be answered from the retrieved state (and does not require changing the state), "
+    "When adding or changing more than one to-do, use add_todos / update_todos in a single call.\n"
+    "Ask before overwriting existing values. For monthly_revenue, gross_margin_per_customer, monthly_gross_margin and any "
+    "what-if, growth, break-even or risk question, call profit_scenarios instead of doing the arithmetic yourself.\n"
+    "If the user's question cannot be answered from the saved state (and does not require changing the state), "
     "call the tool rag_search(query=<the user's question>) to retrieve external knowledge, then answer citing those results."
 )
 
-bedrock_model = BedrockModel(model_id=BEDROCK_MODEL_ID, region_name=AWS_REGION)
+# ---------- Shared model + tools, one Agent per user ----------
+# Built once per process; every session reuses them (BedrockModel holds only config + a thread-safe boto3 client).
+TOOLS = [upsert_business_idea, upsert_budget_finance, add_todo, update_todo, add_todos, update_todos,
+         profit_scenarios, rag_search]  # <-- add tool here
+if not PREFETCH_STATE:
+    TOOLS.insert(0, get_state)
+# Tools that change state; when none ran, the prefetched snapshot is still current at the end of the turn.
+MUTATING_TOOLS = {"upsert_business_idea", "upsert_budget_finance", "add_todo", "update_todo", "add_todos", "update_todos"}
 
-agent = Agent(
-    model=_get_model(),
-    tools=[get_state, upsert_business_idea, upsert_budget_finance, add_todo, update_todo, rag_search],  # <-- add tool here
-    system_prompt=SYSTEM_PROMPT,
-)
+def _new_agent(messages: list) -> Agent:
+    return Agent(
+        model=_get_model(),
+        tools=TOOLS,
+        system_prompt=SYSTEM_PROMPT,
+        messages=messages,
+        conversation_manager=RollingSummaryManager(),   # bounded history: recent turns + running summary
+        callback_handler=None,
+    )
 
-from contextvars import ContextVar
-_tool_events: ContextVar[list] = ContextVar("_tool_events", default=[])
+sessions = SessionPool(
+    _new_agent,
+    store=DynamoHistoryStore(_table, _pk) if SESSION_PERSIST else None,
+)
 
-def run_turn(user_id: str, message: str) -> dict:
-    ts = _ts()
+metrics.register_stats("state_cache", state_cache.stats)
+metrics.register_stats("sessions", sessions.stats)
 
+def _log_prompt(user_id: str, message: str, ts: str):
     # PROMPT LOG
     prompt_log = {
         "ts": ts,
         "user_id": user_id,
         "model_id": BEDROCK_MODEL_ID,
-        "system_prompt_sha": sha256(SYSTEM_PROMPT),  # store hash not full prompt if you prefer
-        "system_prompt": SYSTEM_PROMPT,              # or remove if you want only the hash
+        "system_prompt_sha": sha256(SYSTEM_PROMPT),
+        "system_prompt": SYSTEM_PROMPT,              # logged as a sha256 blob ref (see LOG_S3_DEDUPE_FIELDS)
         "message": message,
         "runtime": {"region": AWS_REGION},
     }
     put_json(user_id, "prompts", prompt_log, ts=ts)
 
-    # Reset per-turn tool event buffer
-    _tool_events.set([])
-
-    # RUN
-    reply = agent(f"USER_ID={user_id}\nMESSAGE={message}")
-    text = getattr(reply, "text", None) or str(reply)
-    snapshot = get_state(user_id)
-
+def _log_turn(user_id: str, ts: str, text: str, snapshot: dict, trace: metrics.Trace, model: dict):
     # ANSWER LOG
     answer_log = {
         "ts": ts,
@@ -223,20 +594,131 @@ def run_turn(user_id: str, message: str) -> dict:
     put_json(user_id, "answers", answer_log, ts=ts)
 
     # REASONING SUMMARY (no chain-of-thought; just trace + brief notes)
-    events = _tool_events.get()
     reasoning_log = {
         "ts": ts,
         "user_id": user_id,
-        "trace": events,  # [{"tool":"get_state","ts":"...","args_keys":["user_id"],"duration_ms":...}, ...]
-        "notes": (
-            "Trace of tool usage and timing for observability. No hidden chain-of-thought is logged. "
-            "Consider enabling token usage metrics from the model API if needed."
-        ),
+        "trace": trace.spans,  # [{"stage":"state.prefetch",...}, {"tool":"add_todo","ts":"...","args_keys":[...],"duration_ms":...}, ...]
+        "turn_ms": int((time.perf_counter() - trace.started) * 1000),
+        "model": model,        # model_latency_ms, model_cycles, usage (input/output/total tokens)
+        "notes": "Trace of tool usage and timing for observability. No hidden chain-of-thought is logged.",
     }
     put_json(user_id, "reasoning", reasoning_log, ts=ts)
 
+def _turn_prompt(user_id: str, message: str, state: dict | None = None) -> str:
+    if state is None:
+        return f"USER_ID={user_id}\nMESSAGE={message}"
+    return f"USER_ID={user_id}\nSTATE={_compact_state(state)}\nMESSAGE={message}"
+
+def _compact_state(state: dict) -> str:
+    """One-line JSON without empty fields (the model reads this every turn)."""
+    def strip(d):
+        return {k: v for k, v in d.items() if v is not None} if isinstance(d, dict) else d
+    return dumps_str({
+        "business_idea": strip(state.get("business_idea")),
+        "budget_finance": strip(state.get("budget_finance")),
+        "todos": [strip(t) for t in state.get("todos") or []],
+    })
+
+# State reads start before the session is checked out / restored, so the two overlap.
+_prefetch_pool = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="prefetch")
+
+def _prefetch(user_id: str) -> Future | None:
+    return _prefetch_pool.submit(read_state, user_id) if PREFETCH_STATE else None
+
+def _state_after(user_id: str, before: dict | None, trace: metrics.Trace) -> dict:
+    """The prefetched snapshot if no state-changing tool ran this turn, else a fresh (cache-backed) read."""
+    if before is None or any(s.get("tool") in MUTATING_TOOLS for s in trace.spans):
+        return read_state(user_id)[0]
+    return before
+
+def run_turn(user_id: str, message: str) -> dict:
+    ts = _ts()
+    pending = _prefetch(user_id)
+    _log_prompt(user_id, message, ts)
+    trace = metrics.begin_turn(user_id)
+    try:
+        # RUN
+        with metrics.TURN_SECONDS.labels("sync").time():
+            with sessions.session(user_id) as agent:
+                state = None
+                if pending is not None:
+                    with metrics.span("state.prefetch", trace):
+                        state = pending.result()[0]
+                before = metrics.model_totals(agent)
+                reply = agent(_turn_prompt(user_id, message, state))
+                model = metrics.record_model(trace, agent, before)
+            text = getattr(reply, "text", None) or str(reply)
+            snapshot = _state_after(user_id, state, trace)
+    except Exception as e:
+        metrics.TURN_ERRORS.labels("sync").inc()
+        e.turn_trace = trace   # what the failed turn already did; batch retries check it for writes
+        raise
+    finally:
+        metrics.end_turn(trace)
+
+    _log_turn(user_id, ts, text, snapshot, trace, model)
     return {"reply": text, "state": snapshot}
 
+async def stream_turn(user_id: str, message: str) -> AsyncIterator[dict]:
+    """Async counterpart of run_turn built on Agent.stream_async.
+
+    Yields {"type": "token"|"tool_use"|"tool_result"|"done", ...} as the model produces them.
+    The state snapshot (prefetched, re-read only if a tool changed it) is sent with "done";
+    S3 logging happens after that, so it never delays the last event.
+    """
+    ts = _ts()
+    pending = _prefetch(user_id)
+    await asyncio.to_thread(_log_prompt, user_id, message, ts)
+    trace = metrics.begin_turn(user_id)
+
+    chunks: list = []
+    seen_tools: set = set()
+    result = None
+    try:
+        # Checkout may restore history from DynamoDB and checkin may persist evicted sessions: off the loop.
+        session = await asyncio.to_thread(sessions.checkout, user_id)
+        finished = False
+        try:
+            agent = session.agent
+            state = None
+            if pending is not None:
+                with metrics.span("state.prefetch", trace):
+                    state = (await asyncio.wrap_future(pending))[0]
+            before = metrics.model_totals(agent)
+            async for ev in agent.stream_async(_turn_prompt(user_id, message, state)):
+                if "data" in ev and isinstance(ev["data"], str):
+                    chunks.append(ev["data"])
+                    yield {"type": "token", "text": ev["data"]}
+                elif "current_tool_use" in ev:
+                    tu = ev["current_tool_use"] or {}
+                    tid = tu.get("toolUseId")
+                    if tid and tu.get("name") and tid not in seen_tools:
+                        seen_tools.add(tid)
+                        yield {"type": "tool_use", "tool": tu["name"], "tool_use_id": tid}
+                elif "message" in ev:
+                    for block in (ev["message"] or {}).get("content", []):
+                        tr = block.get("toolResult") if isinstance(block, dict) else None
+                        if tr:
+                            yield {"type": "tool_result", "tool_use_id": tr.get("toolUseId"), "status": tr.get("status")}
+                elif "result" in ev:
+                    result = ev["result"]
+            model = metrics.record_model(trace, agent, before)
+            finished = True
+        finally:
+            # Rolls back a failed or cancelled turn's history; the thread finishes even if we are cancelled.
+            await asyncio.to_thread(sessions.checkin, session, finished)
+
+        text = (getattr(result, "text", None) or str(result)) if result is not None else "".join(chunks)
+        snapshot = await asyncio.to_thread(_state_after, user_id, state, trace)
+    except Exception:
+        metrics.TURN_ERRORS.labels("stream").inc()
+        raise
+    finally:
+        metrics.end_turn(trace)
+    metrics.TURN_SECONDS.labels("stream").observe(time.perf_counter() - trace.started)
+    yield {"type": "done", "reply": text, "state": snapshot}
+    await asyncio.to_thread(_log_turn, user_id, ts, text, snapshot, trace, model)
+
 # Optional helpers (handy for local testing)
 def chat(user_id: str, message: str, verbose: bool = True):
     out = run_turn(user_id, message)
@@ -246,6 +728,38 @@ def chat(user_id: str, message: str, verbose: bool = True):
         print("\nState Snapshot:\n", _json.dumps(out["state"], indent=2))
     return out["reply"], out["state"]
 
+def _ping(call):
+    """Make one real request so the client's pool holds an open connection. An error reply (e.g.
+    AccessDenied for a permission the app does not otherwise need) still came over that connection."""
+    try:
+        call()
+    except ClientError:
+        pass
+
+def _warm_bedrock():
+    from . import tools_rag
+    for client in (getattr(_get_model().inner, "client", None), tools_rag._bedrock_runtime()):
+        if client is not None:
+            _ping(lambda: client.list_async_invokes(maxResults=1))   # free; no model invocation
+
+def _warm_s3():
+    from . import log_s3
+    if log_s3.LOG_BUCKET:
+        _ping(lambda: log_s3._client().head_bucket(Bucket=log_s3.LOG_BUCKET))
+
+def warm_up_steps() -> dict:
+    """Clients worth pre-connecting before the first turn (see startup.warm_up).
+
+    Building a boto3 client opens no connection, so each step also makes one cheap request.
+    """
+    from . import tools_rag
+    return {
+        "dynamodb": _table,            # ensure_table's DescribeTable is the request
+        "bedrock": _warm_bedrock,
+        "s3": _warm_s3,
+        "opensearch": tools_rag._os_client,
+    }
+
 def free_form_chat(user_id: str, prompt: str) -> dict:
     if not isinstance(user_id, str) or not user_id.strip():
         raise ValueError("user_id must be a non-empty string")
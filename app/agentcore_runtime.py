@@ -1,9 +1,22 @@
-import logging, time
-from typing import Dict, Any, Optional, List
+import asyncio, logging, time, json, weakref
+from typing import Dict, Any, Optional, List, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel
-from .agent import run_turn
+from . import startup
+# Heavy imports are timed one group at a time (later groups exclude what earlier ones already loaded).
+with startup.timed("import_ms", "fastapi"):
+    from fastapi import FastAPI, HTTPException, Request, Query
+    from fastapi.responses import JSONResponse, StreamingResponse, Response
+    from pydantic import BaseModel
+with startup.timed("import_ms", "boto3"):
+    import boto3  # noqa: F401  (timed only)
+with startup.timed("import_ms", "strands"):
+    import strands.models  # noqa: F401  (timed only)
+with startup.timed("import_ms", "app"):
+    from .agent import run_turn, stream_turn, sessions, warm_up_steps, read_state, write_state, run_scenarios, TodoNotFound
+    from .executor import executor
+    from .log_s3 import shipper
+    from . import admission, batch, dedupe, metrics
+    from .encoding import dumps, dumps_str
 
 # ----- Logging config -----
 # Use uvicorn's logger so logs show in CloudWatch with level/ts.
@@ -18,7 +31,22 @@ if not logger.handlers:
     handler.setFormatter(fmt)
     logger.addHandler(handler)
 
-app = FastAPI(title="SmallBiz Agent", version="1.1.0")
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the shared encoder (orjson when installed; Decimal-safe)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+app = FastAPI(title="SmallBiz Agent", version="1.1.0", default_response_class=FastJSONResponse)
+
+metrics.register_stats("executor", executor.stats)
+metrics.register_stats("log_shipper", shipper.stats)
+
+@app.exception_handler(admission.Rejected)
+async def _rejected(request: Request, e: admission.Rejected):
+    """Over the user's rate or the server's queue: answer at once and say when to come back."""
+    logger.warning(f"[admission] {request.url.path} -> {e.status}: {e}")
+    return FastJSONResponse({"detail": str(e), "retry_after": e.retry_after}, status_code=e.status, headers=e.headers())
 
 # ----- Diagnostics middleware: request/response timing & payload trim -----
 @app.middleware("http")
@@ -48,18 +76,57 @@ class InvokeIn(BaseModel):
     message: Optional[str] = None
     inputText: Optional[str] = None
     messages: Optional[List[Dict[str, Any]]] = None
+    stream: Optional[bool] = None
 
 class InvokeOut(BaseModel):
     output: Dict[str, Any]
 
+class BusinessIdeaIn(BaseModel):
+    business_name: str
+    idea: str
+    market: str
+
+class BudgetFinanceIn(BaseModel):
+    customer_count: int
+    revenue_per_customer: float
+    cost_per_customer: float
+
+class TodoIn(BaseModel):
+    task: str
+    due_date: str
+    progress: str = "not_started"
+
+class TodoPatch(BaseModel):
+    task: Optional[str] = None
+    due_date: Optional[str] = None
+    progress: Optional[str] = None
+
+class ScenarioIn(BaseModel):
+    analyses: Optional[List[str]] = None          # base | grid | growth | break_even | monte_carlo
+    fixed_costs: float = 0.0
+    overrides: Optional[Dict[str, float]] = None   # customer_count / revenue_per_customer / cost_per_customer
+    options: Optional[Dict[str, Dict[str, Any]]] = None   # per-analysis keyword arguments
+
+class BatchIn(BaseModel):
+    items: List[Dict[str, Any]]          # {user_id, message, id?}; see batch.normalize
+    concurrency: Optional[int] = None   # users in flight; capped at the turn pool size
+    retries: Optional[int] = None
+    include_state: bool = False
+
 # ----- Extractors -----
-def _pick_user_id(req: Request, body: InvokeIn) -> str:
-    if body.input and isinstance(body.input.get("user_id"), str) and body.input["user_id"].strip():
-        return body.input["user_id"].strip()
+def _header_user_id(req: Request) -> Optional[str]:
     for h in ("x-actor-id", "x-user-id", "x-agentcore-actor-id", "x-agentcore-user-id"):
         v = req.headers.get(h)
         if v and v.strip():
             return v.strip()
+    return None
+
+def _pick_user_id(req: Request, body: InvokeIn) -> str:
+    if body.input and isinstance(body.input.get("user_id"), str) and body.input["user_id"].strip():
+        return body.input["user_id"].strip()
+    v = _header_user_id(req)
+    if v:
+        return v
     if body.input and isinstance(body.input.get("actorId"), str) and body.input["actorId"].strip():
         return body.input["actorId"].strip()
     raise HTTPException(400, "user_id missing (expected in input.user_id or x-actor-id header)")
@@ -83,35 +150,309 @@ def _pick_message(body: InvokeIn) -> str:
                         return part["text"].strip()
     raise HTTPException(400, "message missing (input.message, message, inputText, or messages[])")
 
-async def _handle_invoke(request: Request, body: InvokeIn) -> Dict[str, Any]:
+def _flight(request: Request, user_id: str, message: str) -> Tuple[str, str, float]:
+    key = (request.headers.get("idempotency-key") or request.headers.get("x-idempotency-key") or "").strip()
+    try:
+        return dedupe.request_key(user_id, message, key or None)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+_REPLAYED = {"Idempotent-Replayed": "true"}
+
+async def _handle_invoke(request: Request, body: InvokeIn) -> Tuple[Dict[str, Any], bool]:
+    """(output, replayed). Duplicates attach to the turn in flight or replay its result (see dedupe)."""
     user_id = _pick_user_id(request, body)
     message = _pick_message(body)
     logger.info(f"[invoke] user_id={user_id} msg_len={len(message)}")
+    if not dedupe.DEDUPE_ENABLED:
+        return await _run_invoke(user_id, message), False
     try:
-        out = run_turn(user_id, message)  # {"reply": "...", "state": {...}}
+        out, replayed = await dedupe.flights.run(*_flight(request, user_id, message), lambda: _run_invoke(user_id, message))
+    except dedupe.Conflict as e:
+        raise HTTPException(422, str(e))
+    if replayed:
+        logger.info(f"[invoke] user_id={user_id} duplicate served from the original turn")
+    return out, replayed
+
+async def _run_invoke(user_id: str, message: str) -> Dict[str, Any]:
+    ticket = admission.controller.admit(user_id)   # 429 straight away when over rate or queue
+    try:
+        # Off the event loop; same-user turns are serialized, other users run in parallel (up to the slot limit).
+        out = await admission.submit(ticket, run_turn, user_id, message)  # {"reply": "...", "state": {...}}
         return out
+    except admission.Rejected:
+        raise
     except Exception as e:
         logger.exception("[invoke] unhandled error")
         raise HTTPException(500, f"agent error: {e}")
 
+def _wants_stream(request: Request, body: InvokeIn) -> bool:
+    if body.stream or (body.input and body.input.get("stream") is True):
+        return True
+    return "text/event-stream" in (request.headers.get("accept") or "")
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {dumps_str(event)}\n\n"
+
+class _EventLog:
+    """Events of one streaming turn, kept so every reader (the original request and any duplicate that
+    attaches to it) gets the whole stream however late it starts reading."""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def append(self, ev: Dict[str, Any]):
+        self.events.append(ev)
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self, replayed: bool = False):
+        i = 0
+        while True:
+            while i < len(self.events):
+                ev = self.events[i]
+                i += 1
+                yield _sse({**ev, "replayed": True} if replayed and ev["type"] == "done" else ev)
+            if self.closed:
+                return
+            await self._changed.wait()
+
+# Streaming leader's flight -> its event log, for duplicates that attach while it runs.
+_STREAMS: "weakref.WeakKeyDictionary[asyncio.Future, _EventLog]" = weakref.WeakKeyDictionary()
+_STREAM_TASKS: set = set()   # strong refs: the loop only keeps weak ones to running tasks
+
+async def _stream_invoke(request: Request, body: InvokeIn) -> StreamingResponse:
+    user_id = _pick_user_id(request, body)
+    message = _pick_message(body)
+    logger.info(f"[invoke:stream] user_id={user_id} msg_len={len(message)}")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    flight: Optional[asyncio.Future] = None
+    if dedupe.DEDUPE_ENABLED:
+        try:
+            flight, leader = dedupe.flights.claim(*_flight(request, user_id, message))
+        except dedupe.Conflict as e:
+            raise HTTPException(422, str(e))
+        if not leader:
+            logger.info(f"[invoke:stream] user_id={user_id} duplicate served from the original turn")
+            log = _STREAMS.get(flight)
+            events = log.read(replayed=True) if log is not None else _replay_events(flight)
+            return StreamingResponse(events, media_type="text/event-stream", headers={**headers, **_REPLAYED})
+    try:
+        ticket = admission.controller.admit(user_id)   # rejected before the 200 and the stream start
+    except admission.Rejected as e:
+        _fail(flight, e)
+        raise
+    log = _EventLog()
+    if flight is not None:
+        _STREAMS[flight] = log
+    # The turn runs as its own task, not inside the response body: a client that disconnects only stops
+    # reading, and the retry it sends with the same Idempotency-Key attaches to this turn instead of
+    # running the (possibly state-changing) turn a second time.
+    task = asyncio.ensure_future(_run_stream(user_id, message, ticket, flight, log))
+    _STREAM_TASKS.add(task)
+    task.add_done_callback(_STREAM_TASKS.discard)
+    task.add_done_callback(lambda _: ticket.release())   # also covers a task cancelled before it first ran
+    return StreamingResponse(log.read(), media_type="text/event-stream", headers=headers)
+
+async def _run_stream(user_id: str, message: str, ticket: admission.Ticket,
+                      flight: Optional[asyncio.Future], log: _EventLog):
+    try:
+        async with executor.ordered(user_id):
+            async with ticket.slot():
+                async for ev in stream_turn(user_id, message):
+                    if ev["type"] == "done" and flight is not None and not flight.done():
+                        flight.set_result({"reply": ev["reply"], "state": ev["state"]})
+                    log.append(ev)
+    except admission.Rejected as e:
+        _fail(flight, e)
+        log.append({"type": "error", "error": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        _fail(flight, e)
+        logger.exception("[invoke:stream] unhandled error")
+        log.append({"type": "error", "error": f"agent error: {e}"})
+    finally:
+        ticket.release()
+        if flight is not None and not flight.done():
+            flight.cancel()   # only on shutdown; every other ending settled it above
+        log.close()
+
+def _fail(flight: Optional[asyncio.Future], e: Exception):
+    if flight is not None and not flight.done():
+        flight.set_exception(e)
+
+async def _replay_events(flight: asyncio.Future):
+    """A duplicate of a non-streaming or already finished turn: just that turn's final event."""
+    try:
+        out = await asyncio.shield(flight)
+        yield _sse({"type": "done", **out, "replayed": True})
+    except Exception as e:
+        yield _sse({"type": "error", "error": str(getattr(e, "detail", e))})
+
+async def _invoke(request: Request, body: InvokeIn):
+    if _wants_stream(request, body):
+        return await _stream_invoke(request, body)
+    out, replayed = await _handle_invoke(request, body)
+    if replayed:
+        return FastJSONResponse({"output": out}, headers=_REPLAYED)
+    return {"output": out}
+
+@app.on_event("startup")
+def _startup():
+    startup.warm_up(warm_up_steps())
+
+@app.on_event("shutdown")
+def _shutdown():
+    executor.shutdown(wait=True)
+    sessions.flush()
+    shipper.close()
+
 # ----- Health -----
 @app.get("/ping")
 def ping():
     return {"status": "healthy"}
 
+@app.get("/ready")
+def ready():
+    """503 until background warm-up has finished; body carries the startup-time report."""
+    return FastJSONResponse(startup.report(), status_code=200 if startup.ready.is_set() else 503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus exposition: turn/stage/tool/model latency histograms plus component stats as gauges."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ----- State API (direct DynamoDB reads/writes; no model call) -----
+def _state_user_id(req: Request) -> str:
+    v = _header_user_id(req) or (req.query_params.get("user_id") or "").strip()
+    if not v:
+        raise HTTPException(400, "user_id missing (expected x-actor-id header or ?user_id=)")
+    return v
+
+def _etag(version: int, todos: str) -> str:
+    return f'"v{version}-{todos}"'
+
+def _etag_matches(req: Request, etag: str) -> bool:
+    inm = req.headers.get("if-none-match")
+    if not inm:
+        return False
+    tags = [t.strip() for t in inm.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+def _state_response(state: Dict[str, Any], version: int, todos: str, status_code: int = 200, **extra) -> FastJSONResponse:
+    return FastJSONResponse({"state": state, "version": version, **extra}, status_code=status_code,
+                        headers={"ETag": _etag(version, todos), "Cache-Control": "no-cache"})
+
+@app.get("/state")
+async def get_state_route(request: Request, todos: str = Query("all", pattern="^(all|open|upcoming)$")):
+    """Current state; 304 when If-None-Match carries the current ETag (the per-user state version)."""
+    user_id = _state_user_id(request)
+    # Reads skip the per-user turn queue: a screen refresh should not wait for a chat turn to finish.
+    # fresh: the version becomes the ETag, so it is checked against the table rather than the trust window.
+    state, version = await asyncio.to_thread(read_state, user_id, todos, True)
+    etag = _etag(version, todos)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return _state_response(state, version, todos)
+
+async def _write_state(request: Request, kind: str, fields: Dict[str, Any], status_code: int = 200) -> FastJSONResponse:
+    user_id = _state_user_id(request)
+    try:
+        # Ordered with this user's agent turns, like any other state change, but not on the turn pool
+        # (and not behind admission): a form save must not wait for other users' turns to free a worker.
+        async with executor.ordered(user_id):
+            result = await asyncio.to_thread(write_state, user_id, kind, fields)
+    except TodoNotFound as e:
+        raise HTTPException(404, str(e))
+    except Exception as e:
+        logger.exception(f"[state] {kind} failed")
+        raise HTTPException(500, f"state write failed: {e}")
+    state, version = await asyncio.to_thread(read_state, user_id, "all", True)
+    return _state_response(state, version, "all", status_code=status_code, result=result)
+
+@app.put("/state/business_idea")
+async def put_business_idea(request: Request, body: BusinessIdeaIn):
+    return await _write_state(request, "business_idea", body.model_dump())
+
+@app.put("/state/budget_finance")
+async def put_budget_finance(request: Request, body: BudgetFinanceIn):
+    return await _write_state(request, "budget_finance", body.model_dump())
+
+@app.post("/state/todos")
+async def post_todo(request: Request, body: TodoIn):
+    return await _write_state(request, "add_todo", body.model_dump(), status_code=201)
+
+@app.patch("/state/todos/{todo_id}")
+async def patch_todo(request: Request, todo_id: str, body: TodoPatch):
+    changes = body.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(400, "nothing to update (task, due_date or progress)")
+    return await _write_state(request, "update_todo", {"todo_id": todo_id, **changes})
+
+@app.post("/scenarios")
+async def scenarios_route(request: Request, body: ScenarioIn):
+    """Profit scenarios computed from the saved budget_finance (see app.scenarios); no model call."""
+    user_id = _state_user_id(request)
+    try:
+        return await asyncio.to_thread(run_scenarios, user_id, body.analyses, body.fixed_costs, body.overrides, body.options)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(400, str(e))
+
+# ----- Batch (bulk/offline jobs) -----
+async def _batch_body(request: Request) -> BatchIn:
+    """JSON BatchIn, or an NDJSON body of items (options then come from the query string)."""
+    try:
+        if "ndjson" in (request.headers.get("content-type") or ""):
+            q = request.query_params
+            data = {"items": [json.loads(line) for line in (await request.body()).splitlines() if line.strip()],
+                    "include_state": q.get("include_state") in ("1", "true"),
+                    **{k: q[k] for k in ("concurrency", "retries") if k in q}}
+        else:
+            data = await request.json()
+        return BatchIn.model_validate(data)
+    except ValueError as e:   # bad JSON and pydantic ValidationError alike
+        raise HTTPException(400, f"invalid batch body: {e}")
+
+@app.post("/batch")
+async def batch_route(request: Request):
+    """Run many {user_id, message} items through run_turn; NDJSON result/progress lines, then a summary."""
+    body = await _batch_body(request)
+    try:
+        items = batch.normalize(body.items)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    concurrency = max(1, min(body.concurrency or batch.BATCH_CONCURRENCY, executor.workers))
+    retries = batch.BATCH_RETRIES if body.retries is None else max(0, body.retries)
+    logger.info(f"[batch] items={len(items)} users={len({i['user_id'] for i in items})} concurrency={concurrency}")
+
+    async def lines():
+        async for ev in batch.run_batch(items, concurrency, retries, body.include_state):
+            yield dumps(ev) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # ----- Invocation routes (support multiple paths just in case) -----
 @app.post("/invocations", response_model=InvokeOut)
 async def invocations(request: Request, body: InvokeIn):
-    return {"output": await _handle_invoke(request, body)}
+    return await _invoke(request, body)
 
 @app.post("/invoke", response_model=InvokeOut)
 async def invoke_alias(request: Request, body: InvokeIn):
-    return {"output": await _handle_invoke(request, body)}
+    return await _invoke(request, body)
 
 @app.post("/v1/invoke", response_model=InvokeOut)
 async def invoke_v1(request: Request, body: InvokeIn):
-    return {"output": await _handle_invoke(request, body)}
+    return await _invoke(request, body)
 
 @app.post("/call", response_model=InvokeOut)
 async def call_alias(request: Request, body: InvokeIn):
-    return {"output": await _handle_invoke(request, body)}
+    return await _invoke(request, body)
@@ -0,0 +1,216 @@
+# app/batch.py
+"""Run many {user_id, message} items through run_turn with bounded parallelism.
+
+    python -m app.batch prompts.jsonl --concurrency 16 --out results.ndjson
+    python -m app.batch requests.jsonl --url http://localhost:8080 --users 8
+
+Input is JSONL, one {"user_id"?, "message", "id"?} per line (rows with title/body are accepted too).
+Items for the same user run one after another in input order; different users run in parallel,
+up to `concurrency` at a time. Results are NDJSON, written as each item finishes, followed by a
+summary line. The same engine backs POST /batch in the runtime.
+"""
+import argparse, asyncio, json, os, random, sys, threading, time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from . import admission, metrics
+from .executor import executor, TURN_WORKERS
+from .resilience import retryable   # throttling / transient errors; anything else fails the item straight away
+
+# ---------- Config via env ----------
+BATCH_CONCURRENCY   = int(os.getenv("BATCH_CONCURRENCY", str(TURN_WORKERS)))   # users in flight at once
+BATCH_MAX_ITEMS     = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+BATCH_RETRIES       = int(os.getenv("BATCH_RETRIES", "3"))                     # extra attempts per item
+BATCH_RETRY_BASE_MS = int(os.getenv("BATCH_RETRY_BASE_MS", "500"))             # backoff base, doubled per attempt
+BATCH_PROGRESS_SEC  = float(os.getenv("BATCH_PROGRESS_SEC", "5"))
+
+def normalize(rows: Iterable[Dict[str, Any]], default_user: Optional[str] = None, users: int = 1) -> List[Dict[str, Any]]:
+    """[{index, id, user_id, message}]; rows without a user_id get default_user or one of `users` batch-N ids."""
+    items = []
+    for r in rows:
+        msg = r.get("message") or " ".join(x for x in (r.get("title"), r.get("body")) if x)
+        if not isinstance(msg, str) or not msg.strip():
+            raise ValueError(f"item {len(items)}: message missing")
+        i = len(items)
+        user_id = (r.get("user_id") or default_user or f"batch-{i % max(1, users)}").strip()
+        items.append({"index": i, "id": r.get("id", r.get("request_id")), "user_id": user_id, "message": msg.strip()})
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"{len(items)} items; limit is {BATCH_MAX_ITEMS}")
+    return items
+
+# ---------- Telemetry ----------
+_STATS = {"batches": 0, "batches_active": 0, "items_ok": 0, "items_failed": 0, "retries": 0}
+_STATS_LOCK = threading.Lock()
+
+def _record(**kv):
+    with _STATS_LOCK:
+        for k, v in kv.items():
+            _STATS[k] += v
+
+def stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+metrics.register_stats("batch", stats)
+
+# ---------- Engine ----------
+def _wrote(e: BaseException) -> bool:
+    """The failed turn had already run a state-changing tool, so running it again could apply it twice."""
+    trace = getattr(e, "turn_trace", None)
+    if trace is None:
+        return False   # failed before the turn ran (admission, connection) or no trace to go on
+    from .agent import MUTATING_TOOLS
+    return any(s.get("tool") in MUTATING_TOOLS for s in trace.spans)
+
+def _retryable(e: BaseException) -> bool:
+    return retryable(e) and not _wrote(e)
+
+async def _attempt(item: Dict[str, Any], turn: Callable[[str, str], Dict[str, Any]], retries: int,
+                   include_state: bool) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    out = {"type": "result", "index": item["index"], "id": item["id"], "user_id": item["user_id"]}
+    for attempt in range(1, retries + 2):
+        try:
+            # Through the shared executor, so batch turns stay ordered with this user's live turns too;
+            # the batch lane only gets slots no interactive turn is waiting for.
+            ticket = admission.controller.admit(item["user_id"], "batch")
+            res = await admission.submit(ticket, turn, item["user_id"], item["message"])
+            out.update(ok=True, attempts=attempt, reply=res.get("reply"))
+            if include_state:
+                out["state"] = res.get("state")
+            break
+        except Exception as e:
+            if attempt <= retries and _retryable(e):
+                _record(retries=1)
+                delay = BATCH_RETRY_BASE_MS * (2 ** (attempt - 1)) / 1000
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))   # jitter spreads retries of a throttled burst
+                continue
+            out.update(ok=False, attempts=attempt, error=f"{type(e).__name__}: {e}", retryable=_retryable(e))
+            if _wrote(e):
+                out["partial_writes"] = True   # some state changes may have landed; check before resubmitting
+            break
+    out["ms"] = int((time.perf_counter() - t0) * 1000)
+    return out
+
+async def run_batch(items: List[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY, retries: int = BATCH_RETRIES,
+                    include_state: bool = False, turn: Optional[Callable[[str, str], Dict[str, Any]]] = None,
+                    progress_sec: float = BATCH_PROGRESS_SEC) -> AsyncIterator[Dict[str, Any]]:
+    """Yield a "result" event per item as it finishes, "progress" events every progress_sec, then a "summary".
+
+    Each worker takes a whole user's queue, so one user's items never occupy more than one slot and
+    their order is kept without head-of-line blocking other users.
+    """
+    if turn is None:
+        from .agent import run_turn as turn
+    lanes: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        lanes.setdefault(item["user_id"], []).append(item)
+    pending: asyncio.Queue = asyncio.Queue()
+    for lane in lanes.values():
+        pending.put_nowait(lane)
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while not pending.empty():
+            for item in pending.get_nowait():
+                await done.put(await _attempt(item, turn, retries, include_state))
+
+    t0 = time.perf_counter()
+    counts = {"ok": 0, "failed": 0, "retried": 0}
+    failed: List[int] = []
+    _record(batches=1, batches_active=1)
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(lanes))))]
+    finished = asyncio.gather(*workers)
+
+    def progress(kind: str) -> Dict[str, Any]:
+        wall = time.perf_counter() - t0
+        n = counts["ok"] + counts["failed"]
+        return {"type": kind, "total": len(items), "done": n, **counts, "users": len(lanes),
+                "wall_ms": int(wall * 1000), "items_per_s": round(n / wall, 2) if wall else 0.0}
+
+    try:
+        last = time.perf_counter()
+        for _ in range(len(items)):
+            ev = await done.get()
+            key = "ok" if ev["ok"] else "failed"
+            counts[key] += 1
+            counts["retried"] += ev["attempts"] > 1
+            _record(**{f"items_{key}": 1})
+            if not ev["ok"]:
+                failed.append(ev["index"])
+            yield ev
+            if progress_sec and time.perf_counter() - last >= progress_sec:
+                last = time.perf_counter()
+                yield progress("progress")
+        await finished
+        yield dict(progress("summary"), failed_indexes=sorted(failed))
+    finally:
+        # Client went away (or the caller stopped iterating): don't keep burning model quota.
+        for w in workers:
+            w.cancel()
+        _record(batches_active=-1)
+
+# ---------- CLI ----------
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with (sys.stdin if path == "-" else open(path)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _remote(args, items: List[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    import requests
+    body = {"items": [{k: it[k] for k in ("id", "user_id", "message")} for it in items],
+            "concurrency": args.concurrency, "retries": args.retries, "include_state": args.include_state}
+    with requests.post(f"{args.url.rstrip('/')}/batch", json=body, stream=True, timeout=(10, None),
+                       headers={"Accept": "application/x-ndjson"}) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line:
+                yield json.loads(line)
+
+async def _local(args, items: List[Dict[str, Any]]):
+    executor.workers = max(executor.workers, args.concurrency)   # the pool is created lazily, on the first turn
+    admission.controller.resize(max(admission.controller.limit, args.concurrency), args.concurrency)
+    async for ev in run_batch(items, args.concurrency, args.retries, args.include_state):
+        _emit(args, ev)
+
+def _emit(args, ev: Dict[str, Any]):
+    if ev["type"] == "result":
+        args.out_file.write(json.dumps(ev, ensure_ascii=False, default=str) + "\n")
+        args.out_file.flush()
+        if not ev["ok"]:
+            print(f"[batch] item {ev['index']} failed after {ev['attempts']} attempt(s): {ev['error']}", file=sys.stderr)
+    else:
+        print(f"[batch] {ev['type']}: {ev['done']}/{ev['total']} ok={ev['ok']} failed={ev['failed']} "
+              f"retried={ev['retried']} {ev['items_per_s']} items/s", file=sys.stderr)
+        if ev["type"] == "summary":
+            args.summary = ev
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("input", help="JSONL file of {user_id?, message, id?} rows ('-' for stdin)")
+    ap.add_argument("--url", help="send the batch to a running runtime's POST /batch instead of running in-process")
+    ap.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    ap.add_argument("--retries", type=int, default=BATCH_RETRIES)
+    ap.add_argument("--user-id", help="user id for rows without one (default: spread over --users batch-N ids)")
+    ap.add_argument("--users", type=int, default=1, help="distinct batch-N user ids for rows without one")
+    ap.add_argument("--include-state", action="store_true", help="add each item's state snapshot to its result")
+    ap.add_argument("--out", default="-", help="NDJSON results file (default stdout)")
+    args = ap.parse_args(argv)
+
+    items = normalize(_read_jsonl(args.input), args.user_id, args.users)
+    args.summary = None
+    args.out_file = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        if args.url:
+            for ev in _remote(args, items):
+                _emit(args, ev)
+        else:
+            asyncio.run(_local(args, items))
+    finally:
+        if args.out_file is not sys.stdout:
+            args.out_file.close()
+    if not args.url:
+        from .log_s3 import shipper
+        shipper.flush()
+    return 1 if not args.summary or args.summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# app/context.py
+import os, re, json, time, threading, logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from strands.agent.conversation_manager import ConversationManager
+from strands.types.exceptions import ContextWindowOverflowException
+
+from . import metrics
+
+logger = logging.getLogger("app")
+
+# ---------- Config via env ----------
+CONTEXT_KEEP_TURNS        = int(os.getenv("CONTEXT_KEEP_TURNS", "4"))            # newest turns kept verbatim
+CONTEXT_TOKEN_BUDGET      = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))       # history size that triggers folding
+CONTEXT_STUB_CHARS        = int(os.getenv("CONTEXT_STUB_CHARS", "160"))          # preview kept from an old tool result
+CONTEXT_SUMMARY_MODE      = os.getenv("CONTEXT_SUMMARY_MODE", "extractive")      # extractive | llm
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "2400"))
+CONTEXT_SUMMARY_MODEL_ID  = os.getenv("CONTEXT_SUMMARY_MODEL_ID", "us.anthropic.claude-3-5-haiku-20241022-v1:0")
+
+SUMMARY_HEADER = "[Summary of earlier conversation]"
+_STUB_PREFIX = "[trimmed "
+_MESSAGE = re.compile(r"MESSAGE=(.*)", re.S)
+_STATE_LINE = re.compile(r"^STATE=.*\n", re.M)   # per-turn state snapshot (agent._turn_prompt)
+
+# ---------- Message helpers ----------
+def _blocks(msg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [b for b in msg.get("content", []) if isinstance(b, dict)]
+
+def is_turn_start(msg: Dict[str, Any]) -> bool:
+    """A user message the person typed, as opposed to a toolResult hand-back."""
+    return msg.get("role") == "user" and not any("toolResult" in b for b in _blocks(msg))
+
+def split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    turns: List[List[Dict[str, Any]]] = []
+    for m in messages:
+        if is_turn_start(m) or not turns:
+            turns.append([])
+        turns[-1].append(m)
+    return turns
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """~4 characters per token over the serialized content; close enough to compare against a budget."""
+    return sum(len(json.dumps(m.get("content", []), ensure_ascii=False, default=str)) for m in messages) // 4
+
+def _text(msg: Dict[str, Any]) -> str:
+    return " ".join(b["text"] for b in _blocks(msg) if isinstance(b.get("text"), str))
+
+def _user_text(msg: Dict[str, Any]) -> str:
+    text = " ".join(t for t in (b.get("text") for b in _blocks(msg)) if t and not t.startswith(SUMMARY_HEADER))
+    m = _MESSAGE.search(text)
+    return (m.group(1) if m else text).strip()
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+# ---------- Tool-result stubs ----------
+def _stub_tool_results(turn: List[Dict[str, Any]]) -> int:
+    """Replace toolResult content in-place with a short stub; toolUseId/status stay so pairs remain valid."""
+    names = {b["toolUse"]["toolUseId"]: b["toolUse"].get("name", "tool")
+             for m in turn for b in _blocks(m) if "toolUse" in b}
+    stubbed = 0
+    for m in turn:
+        for b in _blocks(m):
+            tr = b.get("toolResult")
+            if not tr:
+                continue
+            content = tr.get("content") or []
+            if len(content) == 1 and str(content[0].get("text", "")).startswith(_STUB_PREFIX):
+                continue
+            raw = " ".join(c["text"] if "text" in c else json.dumps(c.get("json", c), default=str) for c in content)
+            if len(raw) <= CONTEXT_STUB_CHARS:
+                continue
+            name = names.get(tr.get("toolUseId"), "tool")
+            tr["content"] = [{"text": f"{_STUB_PREFIX}{name} result, {len(raw)} chars] {_clip(raw, CONTEXT_STUB_CHARS)}"}]
+            stubbed += 1
+    return stubbed
+
+def _drop_stale_state(turns: List[List[Dict[str, Any]]]) -> int:
+    """Remove the STATE= line from every turn but the newest; later turns carry a fresher copy."""
+    dropped = 0
+    for turn in turns[:-1]:
+        for b in _blocks(turn[0]):
+            t = b.get("text")
+            if isinstance(t, str) and "STATE=" in t:
+                b["text"], n = _STATE_LINE.subn("", t)
+                dropped += n
+    return dropped
+
+# ---------- Summaries ----------
+def _summary_of(first: Dict[str, Any]) -> str:
+    for b in _blocks(first):
+        t = b.get("text")
+        if isinstance(t, str) and t.startswith(SUMMARY_HEADER):
+            return t[len(SUMMARY_HEADER):].strip()
+    return ""
+
+def _extractive(turns: List[List[Dict[str, Any]]]) -> List[str]:
+    lines = []
+    for turn in turns:
+        tools = sorted({b["toolUse"].get("name", "tool") for m in turn for b in _blocks(m) if "toolUse" in b})
+        reply = next((_text(m) for m in reversed(turn) if m.get("role") == "assistant" and _text(m)), "")
+        line = f"- User: {_clip(_user_text(turn[0]), 200)}"
+        if tools:
+            line += f" | tools: {', '.join(tools)}"
+        if reply:
+            line += f" | Assistant: {_clip(reply, 240)}"
+        lines.append(line)
+    return lines
+
+def _llm_summary(previous: str, turns: List[List[Dict[str, Any]]]) -> str:
+    from .tools_rag import _bedrock_runtime
+    transcript = "\n".join(_extractive(turns))
+    resp = _bedrock_runtime().converse(
+        modelId=CONTEXT_SUMMARY_MODEL_ID,
+        system=[{"text": "Maintain a terse running summary of a small-business coaching chat. Keep facts, numbers, "
+                         "decisions and open questions; drop pleasantries. Plain text, at most 12 bullet lines."}],
+        messages=[{"role": "user", "content": [{"text": f"Current summary:\n{previous or '(none)'}\n\nNew exchanges:\n{transcript}"}]}],
+        inferenceConfig={"temperature": 0, "maxTokens": CONTEXT_SUMMARY_MAX_CHARS // 3},
+    )
+    return resp["output"]["message"]["content"][0]["text"].strip()
+
+def fold_summary(previous: str, turns: List[List[Dict[str, Any]]], mode: str = CONTEXT_SUMMARY_MODE) -> str:
+    """New running summary covering `previous` plus `turns`, capped at CONTEXT_SUMMARY_MAX_CHARS (oldest lines go first)."""
+    if mode == "llm":
+        try:
+            return _clip_lines(_llm_summary(previous, turns))
+        except Exception as e:
+            logger.warning(f"[context] llm summary failed, using extractive: {e!r}")
+    return _clip_lines("\n".join(([previous] if previous else []) + _extractive(turns)))
+
+def _clip_lines(text: str) -> str:
+    lines = text.splitlines()
+    while len(lines) > 1 and sum(len(l) + 1 for l in lines) > CONTEXT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)[-CONTEXT_SUMMARY_MAX_CHARS:]
+
+def _with_summary(first: Dict[str, Any], summary: str) -> Dict[str, Any]:
+    """Copy of the first kept user message with the summary as its leading text block (replacing any old one)."""
+    content = [b for b in first.get("content", []) if not str(b.get("text", "")).startswith(SUMMARY_HEADER)]
+    return {**first, "content": [{"text": f"{SUMMARY_HEADER}\n{summary}"}] + content}
+
+# ---------- Telemetry ----------
+_STATS = {"turns_managed": 0, "turns_folded": 0, "results_stubbed": 0, "states_dropped": 0, "overflows": 0,
+          "history_tokens_last": 0}
+_STATS_LOCK = threading.Lock()
+
+def _record(**kv):
+    with _STATS_LOCK:
+        for k, v in kv.items():
+            if k.endswith("_last"):
+                _STATS[k] = v
+            else:
+                _STATS[k] += v
+
+def stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+metrics.register_stats("context", stats)
+
+# ---------- Manager ----------
+class RollingSummaryManager(ConversationManager):
+    """Keeps the newest turns verbatim, stubs older tool results and folds the oldest turns into a summary.
+
+    The summary lives in the first kept user message (a leading text block), so the history always starts
+    with a user turn, toolUse/toolResult pairs are never split, and persisted sessions carry it along.
+    """
+
+    def __init__(self, keep_turns: int = CONTEXT_KEEP_TURNS, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 summary_mode: str = CONTEXT_SUMMARY_MODE):
+        super().__init__()
+        self.keep_turns = max(1, keep_turns)
+        self.token_budget = token_budget
+        self.summary_mode = summary_mode
+        self.last: Dict[str, Any] = {}
+
+    def apply_management(self, agent: Any, **kwargs: Any) -> None:
+        t0 = time.perf_counter()
+        before = estimate_tokens(agent.messages)
+        states = _drop_stale_state(split_turns(agent.messages))
+        stubbed, folded = self._manage(agent, self.keep_turns)
+        after = estimate_tokens(agent.messages)
+        self.last = {"duration_ms": int((time.perf_counter() - t0) * 1000), "history_tokens_before": before,
+                     "history_tokens": after, "turns_folded": folded, "results_stubbed": stubbed,
+                     "states_dropped": states}
+        metrics.HISTORY_TOKENS.observe(after)
+        _record(turns_managed=1, turns_folded=folded, results_stubbed=stubbed, states_dropped=states,
+                history_tokens_last=after)
+
+    def reduce_context(self, agent: Any, e: Optional[Exception] = None, **kwargs: Any) -> None:
+        """Context window overflow: keep only the current turn (plus summary) and stub its large results."""
+        _record(overflows=1)
+        before = estimate_tokens(agent.messages)
+        stubbed, folded = self._manage(agent, 1, force=True)
+        if not folded:
+            stubbed += _stub_tool_results(agent.messages)
+        if not (stubbed or folded) or estimate_tokens(agent.messages) >= before:
+            raise ContextWindowOverflowException("Unable to reduce context further") from e
+
+    def _manage(self, agent: Any, keep: int, force: bool = False) -> Tuple[int, int]:
+        turns = split_turns(agent.messages)
+        if len(turns) <= keep:
+            return 0, 0
+        old, recent = turns[:-keep], turns[-keep:]
+        stubbed = sum(_stub_tool_results(t) for t in old)
+
+        messages = [m for t in turns for m in t]
+        if not force and estimate_tokens(messages) <= self.token_budget:
+            if stubbed:
+                agent.messages[:] = messages
+            return stubbed, 0
+
+        # Fold old turns, oldest first, until the rest fits the budget (or only `keep` turns remain).
+        cut = len(old) if force else 0
+        while not force and cut < len(old):
+            cut += 1
+            if estimate_tokens([m for t in turns[cut:] for m in t]) <= self.token_budget:
+                break
+        folded, kept = turns[:cut], turns[cut:]
+        summary = fold_summary(_summary_of(turns[0][0]), folded, self.summary_mode)
+        kept[0] = [_with_summary(kept[0][0], summary)] + kept[0][1:]
+        removed = sum(len(t) for t in folded)
+        agent.messages[:] = [m for t in kept for m in t]
+        self.removed_message_count += removed
+        return stubbed, len(folded)
@@ -0,0 +1,119 @@
+# app/dedupe.py
+"""Single-flight deduplication of agent turns, keyed by Idempotency-Key or by (user_id, message).
+
+A duplicate request never runs a second turn:
+- If the original is still running, the duplicate attaches to it and gets the same result.
+- With an `Idempotency-Key` header, a finished original's result is replayed for IDEMPOTENCY_TTL_SEC.
+  Reusing the key with a different message is a client bug and is refused (Conflict).
+
+Without a key, only a turn still in flight is shared. Once it has finished, the same message is a
+new turn: "yes" or "do it again" after a confirmation question must reach the agent.
+
+Only successful turns are cached; a failed turn fails every request attached to it, and the next
+retry runs afresh. State is in-process: duplicates that land on different replicas are not caught.
+"""
+import os, time, asyncio, hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+# ---------- Config via env ----------
+DEDUPE_ENABLED      = os.getenv("DEDUPE_ENABLED", "1") == "1"
+IDEMPOTENCY_TTL_SEC = float(os.getenv("IDEMPOTENCY_TTL_SEC", "600"))   # replay window for Idempotency-Key
+DEDUPE_MAX_ENTRIES  = int(os.getenv("DEDUPE_MAX_ENTRIES", "10000"))
+MAX_KEY_LEN         = 255
+
+class Conflict(Exception):
+    """The Idempotency-Key was already used for a different message."""
+
+def _digest(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+def request_key(user_id: str, message: str, idempotency_key: Optional[str]) -> Tuple[str, str, float]:
+    """(flight key, request fingerprint, replay TTL) for one turn request; TTL 0 = in-flight sharing only."""
+    fingerprint = _digest(message)
+    if idempotency_key:
+        if len(idempotency_key) > MAX_KEY_LEN:
+            raise ValueError(f"Idempotency-Key longer than {MAX_KEY_LEN} characters")
+        return f"key:{user_id}:{idempotency_key}", fingerprint, IDEMPOTENCY_TTL_SEC
+    return f"msg:{user_id}:{fingerprint}", fingerprint, 0.0
+
+class SingleFlight:
+    """In-flight turns and recently completed results. Event-loop only, so no locks."""
+
+    def __init__(self, max_entries: int = DEDUPE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._done: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()   # key -> (expires, fingerprint, result)
+        self._stats = {"leaders": 0, "joined": 0, "replayed": 0, "conflicts": 0}
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Tuple[asyncio.Future, bool]:
+        """(future, leader). The leader must resolve the future; everyone else just awaits it.
+
+        A cached result comes back as an already-resolved future.
+        """
+        loop = asyncio.get_running_loop()
+        hit = self._done.get(key)
+        if hit is not None:
+            expires, fp, result = hit
+            if expires > time.monotonic():
+                self._check(fp, fingerprint)
+                self._stats["replayed"] += 1
+                fut = loop.create_future()
+                fut.set_result(result)
+                return fut, False
+            del self._done[key]
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self._check(flight[0], fingerprint)
+            self._stats["joined"] += 1
+            return flight[1], False
+        fut = loop.create_future()
+        self._inflight[key] = (fingerprint, fut)
+        fut.add_done_callback(lambda f: self._landed(key, fingerprint, ttl, f))
+        self._stats["leaders"] += 1
+        return fut, True
+
+    async def run(self, key: str, fingerprint: str, ttl: float, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, replayed). The leader's turn runs as its own task, so a client that disconnects
+        does not abort the turn its retry is about to attach to."""
+        fut, leader = self.claim(key, fingerprint, ttl)
+        if leader:
+            _resolve_with(fut, asyncio.ensure_future(fn()))
+        return await asyncio.shield(fut), not leader
+
+    def _check(self, expected: str, got: str):
+        if expected != got:
+            self._stats["conflicts"] += 1
+            raise Conflict("Idempotency-Key was already used with a different message")
+
+    def _landed(self, key: str, fingerprint: str, ttl: float, fut: asyncio.Future):
+        if self._inflight.get(key, (None, None))[1] is fut:
+            del self._inflight[key]
+        if fut.cancelled() or fut.exception() is not None or ttl <= 0:   # also marks the exception as retrieved
+            return
+        self._done[key] = (time.monotonic() + ttl, fingerprint, fut.result())
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out.update(inflight=len(self._inflight), cached=len(self._done))
+        return out
+
+def _resolve_with(fut: asyncio.Future, task: asyncio.Future):
+    def done(t: asyncio.Future):
+        if fut.done():
+            return
+        if t.cancelled():
+            fut.cancel()
+        elif t.exception() is not None:
+            fut.set_exception(t.exception())
+        else:
+            fut.set_result(t.result())
+    task.add_done_callback(done)
+
+flights = SingleFlight()
+metrics.register_stats("dedupe", flights.stats)
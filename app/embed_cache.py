@@ -0,0 +1,159 @@
+# app/embed_cache.py
+import os, re, sqlite3, hashlib, threading, logging
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("app")
+
+# ---------- Config via env ----------
+EMBED_CACHE_MEM_MAX = int(os.getenv("EMBED_CACHE_MEM_MAX", "4096"))             # vectors kept in memory
+# "" disables the disk tier. In a container, point this at a mounted volume so it survives restarts.
+EMBED_CACHE_PATH    = os.getenv("EMBED_CACHE_PATH", os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "smallbiz-agent", "embed_cache.sqlite3"))
+EMBED_BATCH_WORKERS = int(os.getenv("EMBED_BATCH_WORKERS", "8"))                 # parallel Bedrock calls for misses
+
+_WS = re.compile(r"\s+")
+
+def normalize(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+def cache_key(model_id: str, text: str) -> str:
+    """Key for `text`, which must already be normalized: it is exactly what gets embedded."""
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Two-tier embedding cache: in-memory LRU in front of a SQLite file of float32 blobs.
+
+    Keys are sha256(model_id + whitespace-normalized text), and that normalized text is what gets
+    embedded, so a cached vector is always the one Bedrock returns for the key's text. The same question
+    with different spacing is embedded once, and switching models never serves a stale vector. The
+    SQLite file is opened on first use, not at construction (i.e. not at import).
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, mem_max: int = EMBED_CACHE_MEM_MAX):
+        self._mem: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._mem_max = max(1, mem_max)
+        self._lock = threading.Lock()
+        self._path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_opened = not path   # no path: nothing to open
+        self._db_lock = threading.Lock()
+        self.hits_mem = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        """The SQLite connection, opened on first use; None if the disk tier is off or failed to open."""
+        if not self._db_opened:
+            with self._db_lock:
+                if not self._db_opened:
+                    self._db = self._open(self._path)
+                    self._db_opened = True
+        return self._db
+
+    @staticmethod
+    def _open(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (k TEXT PRIMARY KEY, dim INTEGER, v BLOB)")
+            return db
+        except Exception:
+            logger.exception(f"[embed_cache] disk tier disabled; cannot open {path}")
+            return None
+
+    def _mem_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            v = self._mem.get(key)
+            if v is not None:
+                self._mem.move_to_end(key)
+            return v
+
+    def _mem_put(self, key: str, vec: List[float]):
+        with self._lock:
+            self._mem[key] = vec
+            self._mem.move_to_end(key)
+            while len(self._mem) > self._mem_max:
+                self._mem.popitem(last=False)
+
+    def _disk_get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        db = self._conn() if keys else None
+        if db is None:
+            return {}
+        out: Dict[str, List[float]] = {}
+        rows = []
+        keys = list(keys)
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            with self._db_lock:
+                rows += db.execute(f"SELECT k, v FROM embeddings WHERE k IN ({marks})", chunk).fetchall()
+        for k, blob in rows:
+            a = array("f")
+            a.frombytes(blob)
+            out[k] = a.tolist()
+        return out
+
+    def _disk_put_many(self, items: Dict[str, List[float]]):
+        db = self._conn() if items else None
+        if db is None:
+            return
+        rows = [(k, len(v), array("f", v).tobytes()) for k, v in items.items()]
+        try:
+            with self._db_lock:
+                db.executemany("INSERT OR REPLACE INTO embeddings (k, dim, v) VALUES (?, ?, ?)", rows)
+        except Exception:
+            logger.exception("[embed_cache] disk write failed")
+
+    def get_many(self, model_id: str, texts: Sequence[str],
+                 embed: Callable[[str], List[float]],
+                 workers: int = EMBED_BATCH_WORKERS) -> List[List[float]]:
+        """Embed `texts`, calling `embed` only for distinct cache misses (in parallel)."""
+        texts = [normalize(t) for t in texts]
+        keys = [cache_key(model_id, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        hits_mem = 0
+        for k in keys:
+            v = self._mem_get(k)
+            if v is not None:
+                found[k] = v
+                hits_mem += 1
+        pending = [k for k in dict.fromkeys(keys) if k not in found]
+        disk = self._disk_get_many(pending)
+        for k, v in disk.items():
+            self._mem_put(k, v)
+        found.update(disk)
+
+        miss_text: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in miss_text:
+                miss_text[k] = t
+        with self._lock:   # counters are bumped from many turn threads at once
+            self.hits_mem += hits_mem
+            self.hits_disk += len(disk)
+            self.misses += len(miss_text)
+        if miss_text:
+            ks = list(miss_text)
+            if len(ks) == 1:
+                vecs = [embed(miss_text[ks[0]])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(workers, len(ks))) as pool:
+                    vecs = list(pool.map(lambda k: embed(miss_text[k]), ks))
+            fresh = dict(zip(ks, vecs))
+            for k, v in fresh.items():
+                self._mem_put(k, v)
+            self._disk_put_many(fresh)
+            found.update(fresh)
+        return [found[k] for k in keys]
+
+    def get(self, model_id: str, text: str, embed: Callable[[str], List[float]]) -> List[float]:
+        return self.get_many(model_id, [text], embed)[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"mem_entries": len(self._mem), "hits_mem": self.hits_mem, "hits_disk": self.hits_disk,
+                    "misses": self.misses}
@@ -0,0 +1,96 @@
+# app/encoding.py
+"""Shared JSON encoding for S3 logs and HTTP responses: fast dumps, cheap redaction.
+
+orjson is used when installed (it serializes datetime/date natively and is several times faster
+than the stdlib); otherwise json.dumps with the same output conventions. Either way Decimal
+(DynamoDB numbers), sets and other odd values go through `_default`.
+"""
+import json, re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib fallback below
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# ---------- JSON ----------
+def _default(o: Any) -> Any:
+    if isinstance(o, Decimal):
+        return int(o) if o == o.to_integral_value() else float(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if isinstance(o, bytes):
+        return o.decode("utf-8", errors="replace")
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    return str(o)
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        """Compact UTF-8 JSON bytes."""
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTS)
+        except TypeError:
+            # e.g. ints beyond 64 bits or a default() that returns another unknown type
+            return _std_dumps(obj)
+else:
+    def dumps(obj: Any) -> bytes:
+        """Compact UTF-8 JSON bytes."""
+        return _std_dumps(obj)
+
+def _std_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+# ---------- Redaction ----------
+REDACTED = "***REDACTED***"
+_SECRET_KEY = re.compile(r"password|secret|token|authorization|api_?key|auth", re.I)
+# Token usage counters the app itself logs; these are counts, not credentials. Anything else matching
+# _SECRET_KEY (access_tokens, refresh_tokens ...) stays masked.
+_COUNT_KEYS = frozenset({"inputTokens", "outputTokens", "totalTokens", "cacheReadInputTokens",
+                         "cacheWriteInputTokens", "history_tokens", "history_tokens_before"})
+
+@lru_cache(maxsize=4096)
+def _secret_key(key: str) -> bool:
+    return key not in _COUNT_KEYS and _SECRET_KEY.search(key) is not None
+
+def redact(d: Any) -> Any:
+    """Mask values under secret-looking keys.
+
+    Copy-on-write: containers without a secret anywhere below them are returned as-is (no rebuild),
+    and scalars are never inspected, so a clean payload costs one walk and no allocations.
+    """
+    if isinstance(d, dict):
+        out = None
+        for k, v in d.items():
+            if _secret_key(k if isinstance(k, str) else str(k)):
+                nv = REDACTED
+            elif isinstance(v, (dict, list)):
+                nv = redact(v)
+                if nv is v:
+                    continue
+            else:
+                continue
+            if out is None:
+                out = dict(d)
+            out[k] = nv
+        return d if out is None else out
+    if isinstance(d, list):
+        out = None
+        for i, v in enumerate(d):
+            if isinstance(v, (dict, list)):
+                nv = redact(v)
+                if nv is not v:
+                    if out is None:
+                        out = list(d)
+                    out[i] = nv
+        return d if out is None else out
+    return d
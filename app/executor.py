@@ -0,0 +1,70 @@
+# app/executor.py
+import os, asyncio, functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# ---------- Config via env ----------
+TURN_WORKERS  = int(os.getenv("TURN_WORKERS", "8"))         # pool size == max concurrent turns
+
+class TurnExecutor:
+    """Runs blocking agent turns on a worker pool, off the event loop.
+
+    Turns for the same user_id run strictly in arrival order (asyncio.Lock is FIFO);
+    turns for different users run in parallel, capped by the pool size.
+
+    Threads only: sessions, caches, breakers and metrics are per process, and a worker process
+    forked after those threads exist would see none of them (or a copy with held locks).
+    """
+
+    def __init__(self, workers: int = TURN_WORKERS):
+        self.workers = max(1, workers)
+        self._pool: ThreadPoolExecutor | None = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="turn")
+        return self._pool
+
+    @asynccontextmanager
+    async def ordered(self, user_id: str):
+        """Hold user_id's turn slot: waits for that user's earlier turns, not for anyone else's."""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        self._waiters[user_id] = self._waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            # Drop per-user bookkeeping once nobody is queued, so the dicts stay small.
+            self._waiters[user_id] -= 1
+            if self._waiters[user_id] == 0:
+                del self._waiters[user_id]
+                self._locks.pop(user_id, None)
+
+    async def submit(self, user_id: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool once all earlier turns for user_id are done."""
+        async with self.ordered(user_id):
+            return await self.run(fn, *args, **kwargs)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on the pool with no per-user ordering (callers that already hold ordered())."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "users_active": len(self._locks),
+            "turns_queued": sum(self._waiters.values()),
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+executor = TurnExecutor()
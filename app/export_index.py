@@ -0,0 +1,41 @@
+# app/export_index.py
+"""Snapshot OpenSearch indexes (documents + vectors) into the local retrieval format.
+
+    python -m app.export_index --out /opt/rag_index
+    python -m app.export_index --out ./rag_index --index llcattorney_chunks_v2 --ivf-nlist 64 --quantize
+"""
+import argparse, time
+from typing import Any, Dict, Iterator, List, Tuple
+
+from opensearchpy.helpers import scan
+
+from .local_index import write_index
+from .tools_rag import RAG_INDEXES, SOURCE_FIELDS, _os_client, _pick_vector_field_mapping, _parse_hits
+
+def _rows(index: str, batch: int) -> Iterator[Tuple[Dict[str, Any], List[float]]]:
+    client = _os_client()
+    vec_field = _pick_vector_field_mapping(client, index)["name"]
+    query = {"_source": SOURCE_FIELDS + [vec_field], "query": {"match_all": {}}}
+    for h in scan(client, index=index, query=query, size=batch, request_timeout=120):
+        vec = (h.get("_source") or {}).get(vec_field)
+        if not vec:
+            continue
+        yield _parse_hits({"hits": {"hits": [h]}})[0], vec
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", required=True, help="root directory (one sub-directory per index)")
+    ap.add_argument("--index", action="append", help="index to export (repeatable); default RAG_INDEXES")
+    ap.add_argument("--ivf-nlist", type=int, default=0, help="build an IVF layer with this many lists")
+    ap.add_argument("--quantize", action="store_true", help="also write int8 codes for a faster approximate scan")
+    ap.add_argument("--batch", type=int, default=500, help="scroll page size")
+    args = ap.parse_args(argv)
+
+    for index in args.index or RAG_INDEXES:
+        t0 = time.time()
+        meta = write_index(args.out, index, _rows(index, args.batch), ivf_nlist=args.ivf_nlist, quantize=args.quantize)
+        print(f"{index}: {meta['count']} docs, dim={meta['dim']}, ivf_nlist={meta['ivf_nlist']}, "
+              f"quantized={meta['quantized']} in {time.time() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
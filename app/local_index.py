@@ -0,0 +1,160 @@
+# app/local_index.py
+import os, json, threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .retrieval import RetrievalBackend
+
+# ---------- Config via env ----------
+RAG_LOCAL_DIR    = os.getenv("RAG_LOCAL_DIR", "/opt/rag_index")   # one sub-directory per index
+RAG_LOCAL_NPROBE = int(os.getenv("RAG_LOCAL_NPROBE", "8"))        # IVF lists scanned per query
+RAG_LOCAL_RESCORE = int(os.getenv("RAG_LOCAL_RESCORE", "4"))      # quantized mode: rescore k * this exactly
+
+# ---------- Local, memory-mapped index ----------
+# Layout of <root>/<index>/:
+#   meta.json        {"dim", "count", "ivf_nlist", "quantized"}
+#   vectors.f32      count x dim float32, unit-normalized rows
+#   docs.jsonl       one hit dict (without score) per row, same order as vectors
+#   centroids.f32    ivf_nlist x dim                     (IVF only)
+#   ivf_order.i32    row ids grouped by list             (IVF only)
+#   ivf_offsets.i64  ivf_nlist + 1 offsets into order    (IVF only)
+#   vectors.i8       count x dim int8 codes              (quantized only)
+#   scales.f32       dim per-dimension scales            (quantized only)
+
+def _unit_rows(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return (m / n).astype(np.float32)
+
+def _kmeans(x: np.ndarray, k: int, iters: int = 12, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means on unit rows; returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    cent = x[rng.choice(len(x), size=k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int32)
+    for _ in range(iters):
+        assign = np.argmax(x @ cent.T, axis=1).astype(np.int32)
+        for c in range(k):
+            members = x[assign == c]
+            cent[c] = members.mean(axis=0) if len(members) else x[rng.integers(len(x))]
+        cent = _unit_rows(cent)
+    return cent, assign
+
+def write_index(root: str, index: str, rows: Iterable[Tuple[Dict[str, Any], List[float]]],
+                ivf_nlist: int = 0, quantize: bool = False) -> Dict[str, Any]:
+    """Write (hit_dict, vector) pairs as a local index; returns its meta."""
+    path = os.path.join(root, index)
+    os.makedirs(path, exist_ok=True)
+    docs, vecs = [], []
+    for doc, vec in rows:
+        doc = {k: v for k, v in doc.items() if k != "score"}
+        doc["index"] = index
+        docs.append(doc)
+        vecs.append(np.asarray(vec, dtype=np.float32))
+    if not vecs:
+        raise ValueError(f"No documents to write for index '{index}'.")
+    m = _unit_rows(np.vstack(vecs))
+    m.tofile(os.path.join(path, "vectors.f32"))
+    with open(os.path.join(path, "docs.jsonl"), "w", encoding="utf-8") as f:
+        for d in docs:
+            f.write(json.dumps(d, ensure_ascii=False, default=str) + "\n")
+
+    nlist = min(ivf_nlist, len(m)) if ivf_nlist > 0 else 0
+    if nlist:
+        cent, assign = _kmeans(m, nlist)
+        order = np.argsort(assign, kind="stable").astype(np.int32)
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        cent.tofile(os.path.join(path, "centroids.f32"))
+        order.tofile(os.path.join(path, "ivf_order.i32"))
+        offsets.tofile(os.path.join(path, "ivf_offsets.i64"))
+    if quantize:
+        scales = np.abs(m).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+        np.round(m / scales).astype(np.int8).tofile(os.path.join(path, "vectors.i8"))
+        scales.astype(np.float32).tofile(os.path.join(path, "scales.f32"))
+
+    meta = {"dim": int(m.shape[1]), "count": int(m.shape[0]), "ivf_nlist": nlist, "quantized": bool(quantize)}
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+class LocalVectorIndex:
+    """Exact (or IVF-probed) cosine top-k over a memory-mapped float32 matrix."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        dim, count = self.meta["dim"], self.meta["count"]
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+        with open(os.path.join(path, "docs.jsonl"), encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f]
+        self.centroids = self.order = self.offsets = self.codes = self.scales = None
+        if self.meta.get("ivf_nlist"):
+            n = self.meta["ivf_nlist"]
+            self.centroids = np.fromfile(os.path.join(path, "centroids.f32"), dtype=np.float32).reshape(n, dim)
+            self.order = np.fromfile(os.path.join(path, "ivf_order.i32"), dtype=np.int32)
+            self.offsets = np.fromfile(os.path.join(path, "ivf_offsets.i64"), dtype=np.int64)
+        if self.meta.get("quantized"):
+            self.codes = np.memmap(os.path.join(path, "vectors.i8"), dtype=np.int8, mode="r", shape=(count, dim))
+            self.scales = np.fromfile(os.path.join(path, "scales.f32"), dtype=np.float32)
+
+    def _candidates(self, q: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        probes = np.argsort(-(self.centroids @ q))[:max(1, nprobe)]
+        return np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+    def search(self, query_vec: List[float], k: int, nprobe: int = RAG_LOCAL_NPROBE) -> List[Dict[str, Any]]:
+        q = np.asarray(query_vec, dtype=np.float32)
+        if q.shape[0] != self.meta["dim"]:
+            raise ValueError(f"Vector dim mismatch: index dims={self.meta['dim']} but query has {q.shape[0]}.")
+        n = float(np.linalg.norm(q))
+        q = q / n if n > 0 else q
+
+        rows = self._candidates(q, nprobe)
+        if self.codes is not None:
+            # Approximate scan on int8 codes, then exact float32 rescoring of a shortlist.
+            qs = q * self.scales
+            codes = self.codes if rows is None else self.codes[rows]
+            approx = codes.astype(np.float32) @ qs
+            short = min(len(approx), k * RAG_LOCAL_RESCORE)
+            pick = np.argpartition(-approx, short - 1)[:short] if short < len(approx) else np.arange(len(approx))
+            rows = pick if rows is None else rows[pick]
+        if rows is None:
+            scores = self.vectors @ q
+            rows = np.arange(len(scores))
+        else:
+            rows = np.sort(rows)            # sequential memmap reads
+            scores = self.vectors[rows] @ q
+        if len(scores) == 0:
+            return []
+        kk = min(k, len(scores))
+        top = np.argpartition(-scores, kk - 1)[:kk]
+        top = top[np.argsort(-scores[top])]
+        out = []
+        for i in top:
+            hit = dict(self.docs[int(rows[i])])
+            hit["score"] = (1.0 + float(scores[i])) / 2.0   # same scale as OpenSearch cosinesimil
+            out.append(hit)
+        return out
+
+class LocalVectorBackend(RetrievalBackend):
+    name = "local"
+
+    def __init__(self, root: str = RAG_LOCAL_DIR):
+        self.root = root
+        self._indexes: Dict[str, LocalVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, name: str) -> LocalVectorIndex:
+        idx = self._indexes.get(name)
+        if idx is None:
+            with self._lock:
+                idx = self._indexes.get(name)
+                if idx is None:
+                    idx = self._indexes[name] = LocalVectorIndex(os.path.join(self.root, name))
+        return idx
+
+    def search_many(self, indexes: List[str], query_vec: List[float], k: int,
+                    server_ms: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return {name: self.index(name).search(query_vec, k) for name in indexes}
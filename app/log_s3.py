@@ -1,13 +1,41 @@
 # app/log_s3.py
-import os, json, datetime as dt, hashlib
-from typing import Any, Dict, Optional
+import os, gzip, time, queue, atexit, threading, logging, datetime as dt, hashlib
+from typing import Any, Dict, List, Optional, Tuple
 import boto3
+from . import startup
+from .encoding import dumps, redact
 
 LOG_BUCKET = os.getenv("LOG_S3_BUCKET", "")           # required
 LOG_PREFIX = os.getenv("LOG_S3_PREFIX", "agents/")    # optional, e.g. agents/
 AWS_REGION = os.getenv("AWS_REGION", "us-west-2")
 
-_s3 = boto3.client("s3", region_name=AWS_REGION)
+# Background shipper (LOG_S3_MODE=sync restores one put_object per event)
+LOG_MODE          = os.getenv("LOG_S3_MODE", "batch")                    # batch | sync
+LOG_QUEUE_MAX     = int(os.getenv("LOG_S3_QUEUE_MAX", "10000"))          # events held in memory
+LOG_BATCH_BYTES   = int(os.getenv("LOG_S3_BATCH_BYTES", str(1 << 20)))   # flush a user/area batch at this size (uncompressed)
+LOG_BATCH_AGE_SEC = float(os.getenv("LOG_S3_BATCH_AGE_SEC", "10"))       # ... or when its oldest event is this old
+LOG_OVERFLOW      = os.getenv("LOG_S3_OVERFLOW", "drop")                 # drop | block
+LOG_BLOCK_SEC     = float(os.getenv("LOG_S3_BLOCK_SEC", "0.05"))         # max wait per event when blocking
+
+# Large constant fields (e.g. the system prompt) are written once to blobs/sha256/<hash>.txt and replaced by a ref.
+LOG_DEDUPE_FIELDS    = [f for f in os.getenv("LOG_S3_DEDUPE_FIELDS", "system_prompt").split(",") if f.strip()]
+LOG_DEDUPE_MIN_CHARS = int(os.getenv("LOG_S3_DEDUPE_MIN_CHARS", "512"))
+LOG_BLOB_RETRY_SEC   = float(os.getenv("LOG_S3_BLOB_RETRY_SEC", "30"))   # first retry of a failed blob write, doubled up to 15 min
+
+logger = logging.getLogger("app")
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+def _client():
+    """S3 client, created on first use rather than at import."""
+    global _s3
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                with startup.timed("init_ms", "s3.client"):
+                    _s3 = boto3.client("s3", region_name=AWS_REGION)
+    return _s3
 
 def _ts() -> str:
     # 2025-10-08T16-21-09Z (safe for paths)
@@ -17,40 +45,252 @@ def _path(user_id: str, area: str, ts: str, suffix: str = "json") -> str:
     # s3://BUCKET/agents/users/<user_id>/<area>/<ts>.<suffix>
     return f"{LOG_PREFIX.rstrip('/')}/users/{user_id}/{area}/{ts}.{suffix}"
 
-def _redact(d: Any) -> Any:
-    """Basic redaction for obvious secrets; extend as needed."""
-    try:
-        if isinstance(d, dict):
-            out = {}
-            for k, v in d.items():
-                lk = str(k).lower()
-                if any(x in lk for x in ["password","secret","token","authorization","api_key","apikey","auth"]):
-                    out[k] = "***REDACTED***"
-                else:
-                    out[k] = _redact(v)
-            return out
-        elif isinstance(d, list):
-            return [_redact(x) for x in d]
-        else:
-            return d
-    except Exception:
-        return d
+# ---------- Blob dedupe ----------
+_blobs_written: set = set()          # stored in S3
+_blobs_queued: set = set()           # handed to the shipper, not yet stored
+_blobs_failing: Dict[str, float] = {}   # digest -> monotonic time of the shipper's next retry
+_blobs_lock = threading.Lock()
+
+def _blob_key(digest: str) -> str:
+    return f"{LOG_PREFIX.rstrip('/')}/blobs/sha256/{digest}.txt"
+
+def put_blob(text: str) -> Optional[Dict[str, str]]:
+    """Store text once per process under its full sha256; returns the ref, or None to keep the value inline.
+
+    The write itself happens on the shipper thread (queued ahead of the events that reference it), so
+    callers never wait on S3. While a blob's write is failing, callers get None until it succeeds.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    ref = {"sha256": digest, "blob": _blob_key(digest)}
+    if digest in _blobs_written:
+        return ref
+    with _blobs_lock:
+        if digest in _blobs_written or digest in _blobs_queued:
+            return ref
+        if digest in _blobs_failing:
+            return None
+        _blobs_queued.add(digest)
+    if shipper.put_blob(digest, text.encode("utf-8")):
+        return ref
+    with _blobs_lock:
+        _blobs_queued.discard(digest)
+    return None
+
+def _dedupe(payload: Dict[str, Any]) -> Dict[str, Any]:
+    out = None
+    for f in LOG_DEDUPE_FIELDS:
+        v = payload.get(f)
+        if isinstance(v, str) and len(v) >= LOG_DEDUPE_MIN_CHARS:
+            ref = put_blob(v)
+            if ref is not None:   # on failure the value stays inline, so nothing is lost
+                if out is None:
+                    out = dict(payload)
+                del out[f]
+                out[f"{f}_ref"] = ref
+    return payload if out is None else out
+
+# ---------- Background shipper ----------
+class _Batch:
+    __slots__ = ("lines", "size", "first_at")
+
+    def __init__(self):
+        self.lines: List[bytes] = []
+        self.size = 0
+        self.first_at = time.monotonic()
+
+class LogShipper:
+    """Queues log events and writes them as gzipped NDJSON objects, one per user/area batch.
+
+    put() never does network I/O. A single daemon thread drains the queue and flushes a batch
+    when it reaches LOG_BATCH_BYTES or LOG_BATCH_AGE_SEC. When the queue is full, events are
+    dropped (or, with LOG_S3_OVERFLOW=block, the caller waits up to LOG_BLOCK_SEC first) and counted.
+    Deduplicated blobs go through the same queue and are written as soon as they are dequeued; a
+    failed blob write is retried with exponential backoff.
+    """
+
+    def __init__(self, maxsize: int = LOG_QUEUE_MAX):
+        # (user_id, area, line) for events; (None, digest, body) for blobs; None to stop.
+        self._q: "queue.Queue[Optional[Tuple[Optional[str], str, bytes]]]" = queue.Queue(maxsize=maxsize)
+        self._batches: Dict[Tuple[str, str], _Batch] = {}
+        self._blob_retry: Dict[str, Tuple[bytes, float]] = {}   # digest -> (body, current backoff)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._seq = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.objects_written = 0
+        self.events_written = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        # Started on the first put()/put_blob(), so importing this module never spawns a thread; a shipper
+        # thread that died (e.g. on an unexpected error) is replaced on the next call.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-s3-shipper", daemon=True)
+                self._thread.start()
+
+    def put(self, user_id: str, area: str, line: bytes):
+        self._ensure_started()
+        try:
+            if LOG_OVERFLOW == "block":
+                self._q.put((user_id, area, line), timeout=LOG_BLOCK_SEC)
+            else:
+                self._q.put_nowait((user_id, area, line))
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def put_blob(self, digest: str, body: bytes) -> bool:
+        self._ensure_started()
+        try:
+            self._q.put_nowait((None, digest, body))
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            timeout = max(0.05, min(1.0, LOG_BATCH_AGE_SEC / 4))
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:                      # close() sentinel
+                self._drain_pending()
+                self._flush(force=True)
+                return
+            if item:
+                self._add(*item)
+            if self._flush_now.is_set():
+                self._drain_pending()
+                self._flush(force=True)
+                self._flush_now.clear()
+            else:
+                self._flush(force=False)
+
+    def _drain_pending(self):
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                return
+            if item:
+                self._add(*item)
+
+    def _add(self, user_id: Optional[str], area: str, line: bytes):
+        if user_id is None:
+            self._write_blob(area, line, LOG_BLOB_RETRY_SEC)
+            return
+        b = self._batches.get((user_id, area))
+        if b is None:
+            b = self._batches[(user_id, area)] = _Batch()
+        b.lines.append(line)
+        b.size += len(line)
+
+    def _flush(self, force: bool):
+        now = time.monotonic()
+        for digest, (body, backoff) in list(self._blob_retry.items()):
+            if force or _blobs_failing.get(digest, 0.0) <= now:
+                self._write_blob(digest, body, min(900.0, backoff * 2))
+        for key in list(self._batches):
+            b = self._batches[key]
+            if force or b.size >= LOG_BATCH_BYTES or now - b.first_at >= LOG_BATCH_AGE_SEC:
+                del self._batches[key]
+                self._write(key[0], key[1], b)
+
+    def _write(self, user_id: str, area: str, b: _Batch):
+        self._seq += 1
+        key = _path(user_id, area, _ts(), f"{os.getpid()}-{self._seq:06d}.ndjson.gz")
+        try:
+            _client().put_object(
+                Bucket=LOG_BUCKET, Key=key, Body=gzip.compress(b"".join(b.lines)),
+                ContentType="application/x-ndjson; charset=utf-8", ContentEncoding="gzip",
+            )
+            self.objects_written += 1
+            self.events_written += len(b.lines)
+        except Exception:
+            self.errors += 1
+            logger.exception(f"[log_s3] failed to write {len(b.lines)} events to s3://{LOG_BUCKET}/{key}")
+
+    def _write_blob(self, digest: str, body: bytes, backoff: float):
+        try:
+            _client().put_object(Bucket=LOG_BUCKET, Key=_blob_key(digest), Body=body,
+                                 ContentType="text/plain; charset=utf-8")
+        except Exception:
+            self.errors += 1
+            logger.exception(f"[log_s3] failed to write blob {digest}; retrying in {backoff:.0f}s")
+            self._blob_retry[digest] = (body, backoff)
+            with _blobs_lock:
+                _blobs_queued.discard(digest)
+                _blobs_failing[digest] = time.monotonic() + backoff
+            return
+        self._blob_retry.pop(digest, None)
+        with _blobs_lock:
+            _blobs_written.add(digest)
+            _blobs_queued.discard(digest)
+            _blobs_failing.pop(digest, None)
+
+    def flush(self, timeout: float = 10.0):
+        """Ask the worker to write everything queued so far; waits until the queue is drained."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._flush_now.set()
+        deadline = time.monotonic() + timeout
+        while self._flush_now.is_set() and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def close(self, timeout: float = 10.0):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._q.put(None, timeout=timeout)
+        except queue.Full:
+            self.dropped += self._q.qsize()
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._q.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "objects_written": self.objects_written,
+            "events_written": self.events_written,
+            "errors": self.errors,
+        }
+
+shipper = LogShipper()
+atexit.register(shipper.close)
 
 def put_json(user_id: str, area: str, payload: Dict[str, Any], ts: Optional[str] = None, key_suffix: Optional[str] = None):
     if not LOG_BUCKET:
         return  # disabled if not configured
     ts = ts or _ts()
-    suffix = f"{key_suffix}.json" if key_suffix else "json"
-    key = _path(user_id, area, ts, suffix)
-    body = json.dumps(_redact(payload), ensure_ascii=False).encode("utf-8")
-    _s3.put_object(Bucket=LOG_BUCKET, Key=key, Body=body, ContentType="application/json; charset=utf-8")
+    if LOG_MODE == "sync":
+        suffix = f"{key_suffix}.json" if key_suffix else "json"
+        key = _path(user_id, area, ts, suffix)
+        body = dumps(redact(_dedupe(payload)))
+        _client().put_object(Bucket=LOG_BUCKET, Key=key, Body=body, ContentType="application/json; charset=utf-8")
+        return
+    # One NDJSON line per event; ts/key_suffix ride along since they no longer name the object.
+    record = {"ts": ts, **redact(_dedupe(payload))}
+    if key_suffix:
+        record["key_suffix"] = key_suffix
+    shipper.put(user_id, area, dumps(record) + b"\n")
 
 def put_text(user_id: str, area: str, text: str, ts: Optional[str] = None, ext: str = "log"):
     if not LOG_BUCKET:
         return
     ts = ts or _ts()
     key = _path(user_id, area, ts, ext)
-    _s3.put_object(Bucket=LOG_BUCKET, Key=key, Body=text.encode("utf-8"), ContentType="text/plain; charset=utf-8")
+    _client().put_object(Bucket=LOG_BUCKET, Key=key, Body=text.encode("utf-8"), ContentType="text/plain; charset=utf-8")
+
+def flush(timeout: float = 10.0):
+    shipper.flush(timeout)
 
 def sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()[:16]
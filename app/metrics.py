@@ -0,0 +1,162 @@
+# app/metrics.py
+import time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# ---------- Prometheus series ----------
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+TURN_SECONDS  = Histogram("smallbiz_turn_seconds", "End-to-end agent turn latency", ["mode"], buckets=_BUCKETS)
+STAGE_SECONDS = Histogram("smallbiz_stage_seconds", "Latency of instrumented stages (rag.embed, rag.knn, ...)", ["stage"], buckets=_BUCKETS)
+TOOL_SECONDS  = Histogram("smallbiz_tool_seconds", "Tool call latency", ["tool", "status"], buckets=_BUCKETS)
+MODEL_SECONDS = Histogram("smallbiz_model_seconds", "Bedrock model time per turn (sum over event-loop cycles)", buckets=_BUCKETS)
+MODEL_CYCLES  = Counter("smallbiz_model_cycles_total", "Agent event-loop cycles (one model call each)")
+MODEL_TOKENS  = Counter("smallbiz_model_tokens_total", "Bedrock tokens by kind", ["kind"])
+RERANK_TOKENS = Counter("smallbiz_rerank_tokens_total", "LLM rerank Bedrock tokens by kind", ["kind"])
+TURN_ERRORS   = Counter("smallbiz_turn_errors_total", "Turns that raised", ["mode"])
+
+# Bedrock usage keys -> token "kind" label (cache reads are billed at a fraction of input, writes at a premium).
+_TOKEN_KINDS = (("inputTokens", "input"), ("outputTokens", "output"),
+                ("cacheReadInputTokens", "cache_read"), ("cacheWriteInputTokens", "cache_write"))
+
+_TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+TURN_INPUT_TOKENS = Histogram("smallbiz_turn_input_tokens", "Model input tokens per turn (summed over cycles)", buckets=_TOKEN_BUCKETS)
+HISTORY_TOKENS    = Histogram("smallbiz_history_tokens", "Estimated history tokens carried into the next turn", buckets=_TOKEN_BUCKETS)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# ---------- Per-turn trace ----------
+class Trace:
+    """Spans recorded during one turn; shipped in the 'reasoning' log."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._token = None
+
+    def add(self, span: Dict[str, Any]):
+        self.spans.append(span)   # list.append is atomic; tools may record from several threads
+
+_current: ContextVar[Optional[Trace]] = ContextVar("_turn_trace", default=None)
+_by_user: Dict[str, Trace] = {}   # fallback when a tool thread does not inherit the ContextVar
+_by_user_lock = threading.Lock()   # turns begin and end on executor threads and the event loop alike
+
+def begin_turn(user_id: str) -> Trace:
+    t = Trace(user_id)
+    t._token = _current.set(t)
+    with _by_user_lock:
+        _by_user[user_id] = t
+    return t
+
+def end_turn(trace: Trace):
+    # Executor threads keep their context between turns, so reset rather than leave a stale trace.
+    try:
+        _current.reset(trace._token)
+    except ValueError:   # ended from a different context than it began in
+        _current.set(None)
+    with _by_user_lock:
+        if _by_user.get(trace.user_id) is trace:
+            del _by_user[trace.user_id]
+
+def current(user_id: Optional[str] = None) -> Optional[Trace]:
+    t = _current.get()
+    if user_id is not None and (t is None or t.user_id != user_id):
+        with _by_user_lock:
+            t = _by_user.get(user_id)
+    return t
+
+@contextmanager
+def span(stage: str, trace: Optional[Trace] = None, sink: Optional[Dict[str, int]] = None, **attrs):
+    """Time a stage into the stage histogram, the turn trace and (optionally) a local timings dict.
+
+    Yields the span's attrs; keys added inside the block are recorded with it.
+    """
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        observe(stage, (time.perf_counter() - t0) * 1000, trace, sink, status=status, **attrs)
+
+def observe(stage: str, ms: float, trace: Optional[Trace] = None, sink: Optional[Dict[str, int]] = None, **attrs):
+    STAGE_SECONDS.labels(stage).observe(ms / 1000)
+    if sink is not None:
+        sink[stage] = int(ms)
+    if trace is not None:
+        trace.add({"stage": stage, "duration_ms": int(ms), **attrs})
+
+def record_tool(user_id: str, tool: str, ts: str, args_keys: List[str], ms: float, ok: bool):
+    TOOL_SECONDS.labels(tool, "ok" if ok else "error").observe(ms / 1000)
+    t = current(user_id)
+    if t is not None:
+        t.add({"tool": tool, "ts": ts, "args_keys": args_keys, "duration_ms": int(ms), "ok": ok})
+
+def model_totals(agent: Any) -> Dict[str, Any]:
+    """Snapshot of an Agent's cumulative event-loop metrics (they grow across every turn of a session)."""
+    m = getattr(agent, "event_loop_metrics", None)
+    return {
+        "latency_ms": (getattr(m, "accumulated_metrics", None) or {}).get("latencyMs", 0),
+        "cycles": getattr(m, "cycle_count", 0) or 0,
+        "usage": dict(getattr(m, "accumulated_usage", None) or {}),
+    }
+
+def count_tokens(counter: Counter, usage: Dict[str, Any]):
+    for key, kind in _TOKEN_KINDS:
+        if usage.get(key):
+            counter.labels(kind).inc(usage[key])
+
+def record_model(trace: Optional[Trace], agent: Any, before: Dict[str, Any]) -> Dict[str, Any]:
+    """Record this turn's model latency/tokens (totals now minus `before`); returns the summary it recorded."""
+    now = model_totals(agent)
+    latency_ms = now["latency_ms"] - before["latency_ms"]
+    cycles = now["cycles"] - before["cycles"]
+    usage = {k: v - before["usage"].get(k, 0) for k, v in now["usage"].items() if isinstance(v, (int, float))}
+    MODEL_SECONDS.observe(latency_ms / 1000)
+    MODEL_CYCLES.inc(cycles)
+    TURN_INPUT_TOKENS.observe(usage.get("inputTokens", 0))
+    count_tokens(MODEL_TOKENS, usage)
+    summary = {"model_latency_ms": latency_ms, "model_cycles": cycles, "usage": usage}
+    if trace is not None:
+        trace.add({"stage": "model", "duration_ms": latency_ms, "cycles": cycles, "usage": usage})
+        ctx = getattr(getattr(agent, "conversation_manager", None), "last", None)
+        if ctx:   # set by context.RollingSummaryManager at the end of the turn
+            trace.add({"stage": "context", **ctx})
+    return summary
+
+# ---------- Component stats as gauges ----------
+_STATS: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_STATS_LOCK = threading.Lock()
+
+def register_stats(component: str, fn: Callable[[], Optional[Dict[str, Any]]]):
+    """Expose a component's stats() dict as smallbiz_<component>_<key> gauges (numeric values only)."""
+    with _STATS_LOCK:
+        _STATS[component] = fn
+
+class _StatsCollector:
+    def collect(self):
+        with _STATS_LOCK:
+            items = list(_STATS.items())
+        for component, fn in items:
+            try:
+                stats = fn() or {}
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                g = GaugeMetricFamily(f"smallbiz_{component}_{key}", f"{component} {key}")
+                g.add_metric([], value)
+                yield g
+
+REGISTRY.register(_StatsCollector())
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
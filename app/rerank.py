@@ -0,0 +1,138 @@
+# app/rerank.py
+import os, re, math, threading
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# ---------- Config via env ----------
+RERANK_MODE      = os.getenv("RERANK_MODE", "tiered")               # llm | local | tiered
+RERANK_ANSWER_K  = int(os.getenv("RERANK_ANSWER_K", "5"))           # results the agent actually sees
+RERANK_MARGIN    = float(os.getenv("RERANK_MARGIN", "0.08"))        # local-score gap that counts as "confident"
+RERANK_RRF_K     = int(os.getenv("RERANK_RRF_K", "60"))
+RERANK_WEIGHTS   = {"rrf": 0.5, "bm25": 0.3, "tags": 0.2}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOP = frozenset("a an and are as at be by can do does for from how i in is it my of on or our should the to "
+                  "what when where which who why will with you your".split())
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in _STOP and len(t) > 1]
+
+def _key(r: Dict[str, Any]) -> Tuple[str, str]:
+    return (r["index"], r["doc_id"])
+
+def _minmax(scores: Dict[Any, float]) -> Dict[Any, float]:
+    if not scores:
+        return {}
+    lo, hi = min(scores.values()), max(scores.values())
+    if hi - lo < 1e-12:
+        return {k: (1.0 if hi > 0 else 0.0) for k in scores}
+    return {k: (v - lo) / (hi - lo) for k, v in scores.items()}
+
+def rrf_scores(per_index: Dict[str, List[Dict[str, Any]]], k: int = RERANK_RRF_K) -> Dict[Tuple[str, str], float]:
+    """Reciprocal-rank fusion: rank positions are comparable across indexes even when raw scores are not."""
+    out: Dict[Tuple[str, str], float] = {}
+    for rows in per_index.values():
+        ordered = sorted(rows, key=lambda r: r.get("score") or 0.0, reverse=True)
+        for rank, r in enumerate(ordered, start=1):
+            out[_key(r)] = out.get(_key(r), 0.0) + 1.0 / (k + rank)
+    return out
+
+def bm25_scores(query: str, docs: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75) -> Dict[Tuple[str, str], float]:
+    """BM25 of the query terms against title/body/tags_text, with IDF taken over the candidate set."""
+    q = set(_tokens(query))
+    if not q or not docs:
+        return {_key(d): 0.0 for d in docs}
+    tfs = [Counter(_tokens(" ".join([d.get("title") or "", d.get("body") or "", d.get("tags_text") or ""]))) for d in docs]
+    lens = [sum(tf.values()) for tf in tfs]
+    avg = (sum(lens) / len(lens)) or 1.0
+    n = len(docs)
+    idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t in q for df in [sum(1 for tf in tfs if t in tf)]}
+    out = {}
+    for d, tf, dl in zip(docs, tfs, lens):
+        s = 0.0
+        for t in q:
+            f = tf.get(t, 0)
+            if f:
+                s += idf[t] * f * (k1 + 1) / (f + k1 * (1 - b + b * dl / avg))
+        out[_key(d)] = s
+    return out
+
+def tag_scores(query: str, docs: List[Dict[str, Any]]) -> Dict[Tuple[str, str], float]:
+    """Share of query terms that appear in a document's industry_tags/theme_tags."""
+    q = set(_tokens(query))
+    out = {}
+    for d in docs:
+        tags = d.get("industry_tags") or []
+        tags = (tags if isinstance(tags, list) else [tags]) + list(d.get("theme_tags") or [])
+        words = set(_tokens(" ".join(str(t) for t in tags)))
+        out[_key(d)] = len(q & words) / len(q) if q else 0.0
+    return out
+
+def local_rerank(query: str, per_index: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """First-stage rerank; returns copies sorted by rerank_score (a weighted blend in [0, 1])."""
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for rows in per_index.values():
+        for r in rows:
+            if _key(r) not in merged or (r.get("score") or 0.0) > (merged[_key(r)].get("score") or 0.0):
+                merged[_key(r)] = r
+    docs = list(merged.values())
+    parts = {
+        "rrf": _minmax(rrf_scores(per_index)),
+        "bm25": _minmax(bm25_scores(query, docs)),
+        "tags": tag_scores(query, docs),
+    }
+    out = []
+    for d in docs:
+        d2 = dict(d)
+        d2["rerank_score"] = round(sum(w * parts[name].get(_key(d), 0.0) for name, w in RERANK_WEIGHTS.items()), 4)
+        d2["rerank_stage"] = "local"
+        out.append(d2)
+    out.sort(key=lambda x: (x["rerank_score"], x.get("score") or 0.0), reverse=True)
+    return out
+
+def ambiguous_slice(ranked: List[Dict[str, Any]], answer_k: int = RERANK_ANSWER_K,
+                    margin: float = RERANK_MARGIN, max_k: int = 10) -> Tuple[int, int]:
+    """Return [lo, hi) of the candidates whose order around the answer_k cut-off is uncertain.
+
+    lo == hi means the local ranking is confident: the top answer_k are separated from the
+    rest by at least `margin`, so an LLM pass could not change which documents are returned.
+    """
+    if len(ranked) <= answer_k:
+        return 0, 0
+    s = [r["rerank_score"] for r in ranked]
+    inside, outside = s[answer_k - 1], s[answer_k]
+    if inside - outside >= margin:
+        return 0, 0
+    lo = next(i for i in range(answer_k) if s[i] < inside + margin)
+    hi = answer_k
+    while hi < len(s) and s[hi] > outside - margin and hi - lo < max_k:
+        hi += 1
+    return lo, hi
+
+# ---------- Telemetry ----------
+_STATS = {"queries": 0, "llm_called": 0, "llm_skipped": 0, "llm_docs_sent": 0, "local_only": 0, "degraded": 0}
+_STATS_LOCK = threading.Lock()
+
+def record(llm_docs: int, mode: str = RERANK_MODE):
+    with _STATS_LOCK:
+        _STATS["queries"] += 1
+        if mode == "local":
+            _STATS["local_only"] += 1
+        elif llm_docs:
+            _STATS["llm_called"] += 1
+            _STATS["llm_docs_sent"] += llm_docs
+        else:
+            _STATS["llm_skipped"] += 1
+
+def record_degraded():
+    """The LLM stage failed or was short-circuited and the pre-LLM order was served instead."""
+    with _STATS_LOCK:
+        _STATS["degraded"] += 1
+
+def stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        out = dict(_STATS)
+    out["mode"] = RERANK_MODE
+    skipped = out["llm_skipped"] + out["local_only"]
+    out["llm_skip_rate"] = round(skipped / out["queries"], 4) if out["queries"] else 0.0
+    return out
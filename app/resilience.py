@@ -0,0 +1,394 @@
+# app/resilience.py
+import os, time, random, asyncio, threading, logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterable, Callable, Dict, Optional
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+from strands.models import Model
+from strands.types.exceptions import ModelThrottledException
+
+from . import metrics
+
+logger = logging.getLogger("app")
+
+# ---------- Config via env ----------
+RESILIENCE_ENABLED  = os.getenv("RESILIENCE_ENABLED", "1") == "1"
+HEDGE_DEPENDENCIES  = {d.strip() for d in os.getenv("HEDGE_DEPENDENCIES", "opensearch,bedrock.embed").split(",") if d.strip()}
+HEDGE_MIN_MS        = float(os.getenv("HEDGE_MIN_MS", "20"))         # never hedge sooner than this
+TIMEOUT_MULTIPLIER  = float(os.getenv("TIMEOUT_MULTIPLIER", "4"))    # adaptive timeout = p99 x this, within bounds
+RETRY_MAX           = int(os.getenv("RETRY_MAX", "2"))               # extra attempts per call
+RETRY_BASE_MS       = float(os.getenv("RETRY_BASE_MS", "50"))        # backoff base, doubled per attempt, jittered
+RETRY_BUDGET_RATIO  = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))  # retries + hedges per call, long-run
+RETRY_BUDGET_BURST  = float(os.getenv("RETRY_BUDGET_BURST", "10"))
+BREAKER_FAILURES    = int(os.getenv("BREAKER_FAILURES", "5"))        # consecutive failures that open a breaker
+BREAKER_OPEN_SEC    = float(os.getenv("BREAKER_OPEN_SEC", "30"))
+LATENCY_WINDOW      = int(os.getenv("LATENCY_WINDOW", "200"))        # recent successes kept per dependency
+LATENCY_MIN_SAMPLES = 20                                             # below this: no hedging, max timeout
+DEP_MAX_INFLIGHT    = int(os.getenv("DEP_MAX_INFLIGHT", "16"))       # attempts running per dependency, abandoned ones included
+
+# ---------- Errors ----------
+class Unavailable(Exception):
+    """The dependency could not serve the call (breaker open or timed out); callers may degrade."""
+
+    def __init__(self, dependency: str, reason: str):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.reason = reason
+
+class CircuitOpen(Unavailable):
+    def __init__(self, dependency: str):
+        super().__init__(dependency, "circuit open")
+
+class DependencyTimeout(Unavailable, TimeoutError):
+    def __init__(self, dependency: str, timeout_s: float):
+        super().__init__(dependency, f"no response in {timeout_s:.2f}s")
+
+class Saturated(Unavailable):
+    """Too many attempts (timed-out ones still finishing included) are already running against the dependency."""
+
+    def __init__(self, dependency: str):
+        super().__init__(dependency, "too many calls in flight")
+
+_RETRYABLE_CODES = {
+    "ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ServiceUnavailable",
+    "ModelNotReadyException", "ModelTimeoutException", "InternalServerException", "InternalFailure",
+    "ProvisionedThroughputExceededException", "RequestLimitExceeded",
+}
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def retryable(e: BaseException) -> bool:
+    """Throttling and transient service/network errors (AWS and OpenSearch alike); not validation/auth errors."""
+    if isinstance(e, CircuitOpen):
+        return False
+    if isinstance(e, (ModelThrottledException, BotoConnectionError, ReadTimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code") in _RETRYABLE_CODES
+    # opensearchpy errors are matched by name / status so that checking does not import it.
+    if type(e).__name__ in ("ConnectionTimeout", "ConnectionError") or getattr(e, "status_code", None) in _RETRYABLE_STATUS:
+        return True
+    cause = e.__cause__ or e.__context__
+    return cause is not None and cause is not e and retryable(cause)
+
+# ---------- Building blocks ----------
+class LatencyWindow:
+    """Latencies (ms) of the last `size` successful calls."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._d: deque = deque(maxlen=max(LATENCY_MIN_SAMPLES, size))
+        self._lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self._lock:
+            self._d.append(ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._d) < LATENCY_MIN_SAMPLES:
+                return None
+            s = sorted(self._d)
+        return s[min(len(s) - 1, int(q * len(s)))]
+
+class RetryBudget:
+    """Token bucket: every call deposits `ratio`, every retry or hedge spends one.
+
+    Extra attempts therefore stay around `ratio` of normal traffic even while a dependency is failing,
+    so retries cannot multiply load on a struggling service.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, burst: float = RETRY_BUDGET_BURST):
+        self.ratio, self.burst = ratio, burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures -> half-open after `open_sec` (one probe) -> closed."""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, open_sec: float = BREAKER_OPEN_SEC):
+        self.name, self.failures, self.open_sec = name, max(1, failures), open_sec
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.open_sec else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.open_sec or self._probing:
+                return False
+            self._probing = True   # half-open: exactly one call goes through to test the dependency
+            return True
+
+    def cancel_probe(self):
+        """The half-open probe was granted but never sent; let the next call probe instead."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                if self._opened_at is None:
+                    self.opened += 1
+                    logger.warning(f"[resilience] {self.name} circuit opened after {self._consecutive} failures")
+                self._opened_at = time.monotonic()
+
+# ---------- Dependency ----------
+class Dependency:
+    """One remote dependency: adaptive timeout, budgeted jittered retries, optional hedging, circuit breaker.
+
+    `call(fn)` runs fn(timeout_s) and returns its result. With hedging on, if the first
+    attempt has not answered after the recent p95, a duplicate is sent (budget permitting) and whichever
+    answers first wins. Only use hedging for idempotent reads.
+
+    Attempts run on the dependency's own pool of `max_inflight` threads. An attempt abandoned at its
+    deadline keeps its thread until the client's own timeout ends it, so a hung dependency can only
+    tie up its own threads; once they are all taken, calls fail fast with Saturated.
+    """
+
+    def __init__(self, name: str, timeout_min_ms: float, timeout_max_ms: float, hedge: Optional[bool] = None,
+                 retries: int = RETRY_MAX, max_inflight: int = DEP_MAX_INFLIGHT):
+        self.name = name
+        self.timeout_min_ms, self.timeout_max_ms = timeout_min_ms, timeout_max_ms
+        self.hedge = name in HEDGE_DEPENDENCIES if hedge is None else hedge
+        self.retries = retries
+        self.latency = LatencyWindow()
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker(name)
+        self.max_inflight = max(1, max_inflight)
+        self._inflight = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix=f"dep-{name}")
+        self._counts = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                        "timeouts": 0, "short_circuited": 0, "saturated": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._counts_lock:
+            self._counts[key] += 1
+
+    def timeout_s(self) -> float:
+        p99 = self.latency.quantile(0.99)
+        ms = self.timeout_max_ms if p99 is None else min(self.timeout_max_ms, max(self.timeout_min_ms, p99 * TIMEOUT_MULTIPLIER))
+        return ms / 1000
+
+    def hedge_delay_s(self) -> Optional[float]:
+        p95 = self.latency.quantile(0.95)
+        return None if p95 is None else max(HEDGE_MIN_MS, p95) / 1000
+
+    def _submit(self, fn: Callable[[float], Any], timeout: float) -> Optional[Future]:
+        """Start one attempt on the pool, or None if max_inflight attempts are already running."""
+        with self._counts_lock:
+            if self._inflight >= self.max_inflight:
+                return None
+            self._inflight += 1
+        fut = self._pool.submit(fn, timeout)
+        fut.add_done_callback(self._finished)
+        return fut
+
+    def _finished(self, _fut: Future):
+        with self._counts_lock:
+            self._inflight -= 1
+
+    def call(self, fn: Callable[[float], Any], hedge: Optional[bool] = None) -> Any:
+        if not RESILIENCE_ENABLED:
+            return fn(self.timeout_max_ms / 1000)
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpen(self.name)
+        self._count("calls")
+        self.budget.deposit()
+        hedge = self.hedge if hedge is None else hedge
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = self._attempt(fn, hedge)
+            except Saturated:
+                # Shed before reaching the dependency: says nothing about its health.
+                self._count("saturated")
+                self.breaker.cancel_probe()
+                raise
+            except Exception as e:
+                failure = isinstance(e, DependencyTimeout) or retryable(e)
+                if failure:
+                    self._count("failures")
+                # A non-transient error (bad request, auth) still means the dependency answered.
+                self.breaker.record(not failure)
+                if failure and attempt <= self.retries and self.breaker.allow() and self.budget.try_spend():
+                    self._count("retries")
+                    time.sleep(RETRY_BASE_MS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5) / 1000)
+                    continue
+                raise
+            self.breaker.record(True)
+            return result
+
+    def _attempt(self, fn: Callable[[float], Any], hedge: bool) -> Any:
+        timeout = self.timeout_s()
+        delay = self.hedge_delay_s() if hedge else None
+        t0 = time.perf_counter()
+        # Attempts run on the pool so the deadline holds even for clients without a per-call timeout
+        # (boto3); an abandoned attempt finishes in the background under the client's own timeout.
+        deadline = t0 + timeout
+        primary = self._submit(fn, timeout)
+        if primary is None:
+            raise Saturated(self.name)
+        pending = {primary}
+        error: Optional[BaseException] = None
+        hedged = False
+        while pending:
+            now = time.perf_counter()
+            until = deadline if hedged or delay is None else min(deadline, t0 + delay)
+            done, _ = wait(pending, timeout=max(0.0, until - now), return_when=FIRST_COMPLETED)
+            for f in done:
+                pending.discard(f)
+                try:
+                    result = f.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.latency.add((time.perf_counter() - t0) * 1000)
+                if f is not primary:
+                    self._count("hedge_wins")
+                return result   # the slower duplicate finishes in the background; its result is dropped
+            if done:
+                continue
+            if time.perf_counter() >= deadline:
+                self._count("timeouts")
+                raise DependencyTimeout(self.name, timeout)
+            if not hedged:
+                hedged = True
+                if self._inflight < self.max_inflight and self.budget.try_spend():
+                    dup = self._submit(fn, max(0.001, deadline - time.perf_counter()))
+                    if dup is not None:
+                        self._count("hedges")
+                        pending.add(dup)
+        raise error  # every attempt failed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counts_lock:
+            out = dict(self._counts, inflight=self._inflight)
+        p95, p99 = self.latency.quantile(0.95), self.latency.quantile(0.99)
+        out.update(p95_ms=round(p95 or 0.0, 1), p99_ms=round(p99 or 0.0, 1), timeout_ms=round(self.timeout_s() * 1000),
+                   breaker_open=int(self.breaker.state != "closed"), breaker_opened=self.breaker.opened,
+                   budget_exhausted=self.budget.exhausted)
+        return out
+
+DEPENDENCIES: Dict[str, Dependency] = {}
+_DEPS_LOCK = threading.Lock()
+
+def dependency(name: str, timeout_min_ms: float, timeout_max_ms: float, **kwargs) -> Dependency:
+    with _DEPS_LOCK:
+        dep = DEPENDENCIES.get(name)
+        if dep is None:
+            dep = DEPENDENCIES[name] = Dependency(name, timeout_min_ms, timeout_max_ms, **kwargs)
+        return dep
+
+def stats() -> Dict[str, Any]:
+    """Flat {<dependency>_<counter>: value} for the /metrics gauges."""
+    return {f"{name.replace('.', '_')}_{k}": v for name, dep in list(DEPENDENCIES.items()) for k, v in dep.stats().items()}
+
+metrics.register_stats("resilience", stats)
+
+# ---------- Agent model ----------
+class ResilientModel(Model):
+    """Wraps a Strands model: circuit breaker plus an adaptive time-to-first-event timeout.
+
+    A call that produces no event within the timeout, or fails transiently before its first event, is
+    retried once (budget permitting); once events flow the stream is passed through untouched, since a
+    half-streamed reply cannot be replayed. Not hedged: a duplicate model call costs a whole turn's
+    tokens. If `fallback` is given, it serves turns while the primary's breaker is open.
+    """
+
+    def __init__(self, inner: Model, dep: Dependency, fallback: Optional[Model] = None):
+        self.inner, self.dep, self.fallback = inner, dep, fallback
+
+    def update_config(self, **model_config: Any) -> None:
+        self.inner.update_config(**model_config)
+        if self.fallback is not None:
+            self.fallback.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.inner.get_config()
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        return self.inner.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+
+    async def stream(self, *args: Any, **kwargs: Any) -> AsyncIterable[Dict[str, Any]]:
+        dep = self.dep
+        if not RESILIENCE_ENABLED:
+            async for ev in self.inner.stream(*args, **kwargs):
+                yield ev
+            return
+        if not dep.breaker.allow():
+            dep._count("short_circuited")
+            if self.fallback is None:
+                raise CircuitOpen(dep.name)
+            async for ev in self.fallback.stream(*args, **kwargs):
+                yield ev
+            return
+        dep._count("calls")
+        dep.budget.deposit()
+        for attempt in (1, 2):
+            timeout = dep.timeout_s()
+            t0 = time.perf_counter()
+            events = self.inner.stream(*args, **kwargs).__aiter__()
+            try:
+                first = await asyncio.wait_for(events.__anext__(), timeout)
+            except StopAsyncIteration:
+                dep.breaker.record(True)
+                return
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                if timed_out:
+                    dep._count("timeouts")
+                    await _aclose(events)
+                failure = timed_out or retryable(e)
+                if failure:
+                    dep._count("failures")
+                dep.breaker.record(not failure)
+                # Throttling is retried by the Strands event loop with its own backoff; don't stack ours on top.
+                if failure and not isinstance(e, ModelThrottledException) and attempt == 1 and dep.budget.try_spend():
+                    dep._count("retries")
+                    continue
+                if timed_out:
+                    raise DependencyTimeout(dep.name, timeout) from e
+                raise
+            dep.latency.add((time.perf_counter() - t0) * 1000)
+            dep.breaker.record(True)
+            yield first
+            async for ev in events:
+                yield ev
+            return
+
+async def _aclose(events: Any):
+    try:
+        await events.aclose()
+    except Exception:
+        pass
@@ -0,0 +1,18 @@
+# app/retrieval.py
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+# Kept free of heavy imports: tools_rag subclasses this at import time, while the numpy-backed
+# local implementation (app.local_index) is only loaded when RAG_BACKEND=local.
+
+class RetrievalBackend(ABC):
+    """Where k-NN candidates come from. Hits use the same dict shape as tools_rag._parse_hits."""
+    name = "base"
+
+    @abstractmethod
+    def search_many(self, indexes: List[str], query_vec: List[float], k: int,
+                    server_ms: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """{index: hits} for each of `indexes`, best first, at most `k` per index.
+
+        Backends with a remote engine put its own per-index search time into `server_ms`.
+        """
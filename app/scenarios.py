@@ -0,0 +1,180 @@
+# app/scenarios.py
+import os, time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Per-customer figures are monthly, matching the system prompt's monthly_revenue = customer_count * revenue_per_customer.
+
+# ---------- Config via env ----------
+SCENARIO_MAX_CELLS = int(os.getenv("SCENARIO_MAX_CELLS", "1000000"))   # grid / simulation size cap per call
+SCENARIO_MAX_MONTHS = int(os.getenv("SCENARIO_MAX_MONTHS", "120"))
+
+ANALYSES = ("base", "grid", "growth", "break_even", "monte_carlo")
+
+def _r(x: Any, nd: int = 2) -> Any:
+    """Round numpy scalars/arrays into plain JSON-friendly floats."""
+    if isinstance(x, np.ndarray):
+        return [round(float(v), nd) for v in x.tolist()]
+    return round(float(x), nd)
+
+def _axis(base: float, values: Optional[Sequence[float]], spread: float, steps: int) -> np.ndarray:
+    """Explicit values, or `steps` points from base*(1-spread) to base*(1+spread)."""
+    if values:
+        return np.asarray(values, dtype=np.float64)
+    return np.linspace(base * (1 - spread), base * (1 + spread), max(1, steps))
+
+def _axis_len(values: Optional[Sequence[float]], steps: int) -> int:
+    """Length `_axis` would produce, so the cell cap is checked before anything is allocated."""
+    return len(values) if values else max(1, int(steps))
+
+def unit_economics(customers, price, cost, fixed_costs: float = 0.0) -> Dict[str, Any]:
+    """Vectorised monthly figures; inputs broadcast against each other."""
+    revenue = customers * price
+    margin_per_customer = price - cost
+    gross = customers * margin_per_customer
+    return {
+        "monthly_revenue": revenue,
+        "gross_margin_per_customer": margin_per_customer,
+        "monthly_gross_margin": gross,
+        "monthly_net": gross - fixed_costs,
+    }
+
+def _summary(a: np.ndarray) -> Dict[str, float]:
+    p5, p50, p95 = np.percentile(a, [5, 50, 95])
+    return {"min": _r(a.min()), "p5": _r(p5), "p50": _r(p50), "mean": _r(a.mean()), "p95": _r(p95), "max": _r(a.max())}
+
+# ---------- Analyses ----------
+def base_case(b: Dict[str, float], fixed_costs: float = 0.0) -> Dict[str, Any]:
+    e = unit_economics(b["customer_count"], b["revenue_per_customer"], b["cost_per_customer"], fixed_costs)
+    out = {k: _r(v) for k, v in e.items()}
+    out["gross_margin_pct"] = _r(100 * e["gross_margin_per_customer"] / b["revenue_per_customer"]) if b["revenue_per_customer"] else None
+    return out
+
+def grid(b: Dict[str, float], fixed_costs: float = 0.0, spread: float = 0.2, steps: int = 9,
+         customers: Optional[Sequence[float]] = None, prices: Optional[Sequence[float]] = None,
+         costs: Optional[Sequence[float]] = None, top: int = 3) -> Dict[str, Any]:
+    """customer_count x price x cost sensitivity grid, summarised (never returned cell by cell)."""
+    cells = _axis_len(customers, steps) * _axis_len(prices, steps) * _axis_len(costs, steps)
+    if cells > SCENARIO_MAX_CELLS:
+        raise ValueError(f"grid has {cells} cells; limit is {SCENARIO_MAX_CELLS}")
+    c = _axis(b["customer_count"], customers, spread, steps)
+    p = _axis(b["revenue_per_customer"], prices, spread, steps)
+    k = _axis(b["cost_per_customer"], costs, spread, steps)
+    net = unit_economics(c[:, None, None], p[None, :, None], k[None, None, :], fixed_costs)["monthly_net"]
+    flat = net.ravel()
+    order = np.argsort(flat)
+
+    def cell(i: int) -> Dict[str, float]:
+        ci, pi, ki = np.unravel_index(i, net.shape)
+        return {"customer_count": _r(c[ci]), "revenue_per_customer": _r(p[pi]), "cost_per_customer": _r(k[ki]),
+                "monthly_net": _r(flat[i])}
+
+    # Elasticity-style sensitivity: change in monthly net for a +1% move of one input, others at base.
+    base_net = unit_economics(b["customer_count"], b["revenue_per_customer"], b["cost_per_customer"], fixed_costs)["monthly_net"]
+    sens = {}
+    for name in ("customer_count", "revenue_per_customer", "cost_per_customer"):
+        bumped = dict(b, **{name: b[name] * 1.01})
+        sens[name] = _r(unit_economics(bumped["customer_count"], bumped["revenue_per_customer"],
+                                       bumped["cost_per_customer"], fixed_costs)["monthly_net"] - base_net)
+    return {
+        "scenarios": int(flat.size),
+        "axes": {"customer_count": [_r(c.min()), _r(c.max())], "revenue_per_customer": [_r(p.min()), _r(p.max())],
+                 "cost_per_customer": [_r(k.min()), _r(k.max())]},
+        "monthly_net": _summary(flat),
+        "profitable_share": _r((flat > 0).mean(), 4),
+        "best": [cell(i) for i in order[::-1][:top]],
+        "worst": [cell(i) for i in order[:top]],
+        "net_change_per_1pct": sens,
+    }
+
+def growth(b: Dict[str, float], fixed_costs: float = 0.0, months: int = 12,
+           growth_rates: Iterable[float] = (0.0, 0.02, 0.05, 0.1), churn_rate: float = 0.02,
+           price_change: float = 0.0, cost_change: float = 0.0, investment: float = 0.0) -> Dict[str, Any]:
+    """Month-by-month projection for several monthly growth rates at once (rates x months matrix)."""
+    months = int(min(max(1, months), SCENARIO_MAX_MONTHS))
+    rates = list(growth_rates)
+    if len(rates) * months > SCENARIO_MAX_CELLS:
+        raise ValueError(f"growth has {len(rates) * months} cells; limit is {SCENARIO_MAX_CELLS}")
+    g = np.asarray(rates, dtype=np.float64)[:, None]
+    t = np.arange(1, months + 1, dtype=np.float64)[None, :]
+    customers = b["customer_count"] * (1 + g - churn_rate) ** t
+    price = b["revenue_per_customer"] * (1 + price_change) ** t
+    cost = b["cost_per_customer"] * (1 + cost_change) ** t
+    e = unit_economics(customers, price, cost, fixed_costs)
+    cumulative = np.cumsum(e["monthly_net"], axis=1) - investment
+    paid_back = cumulative >= 0
+    payback = np.where(paid_back.any(axis=1), paid_back.argmax(axis=1) + 1, -1)
+    curves = []
+    for i, rate in enumerate(g[:, 0]):
+        curves.append({
+            "growth_rate": _r(rate, 4),
+            "customers_end": _r(customers[i, -1], 1),
+            "monthly_revenue_end": _r(e["monthly_revenue"][i, -1]),
+            "monthly_net_end": _r(e["monthly_net"][i, -1]),
+            "total_revenue": _r(e["monthly_revenue"][i].sum()),
+            "total_net": _r(e["monthly_net"][i].sum()),
+            "cumulative_net_end": _r(cumulative[i, -1]),
+            "payback_month": int(payback[i]) if payback[i] > 0 else None,
+            # Quarterly points keep the payload small while still showing the curve's shape.
+            "monthly_net_by_quarter": _r(e["monthly_net"][i, 2::3]),
+        })
+    return {"months": months, "churn_rate": churn_rate, "investment": investment, "curves": curves}
+
+def break_even(b: Dict[str, float], fixed_costs: float = 0.0, investment: float = 0.0) -> Dict[str, Any]:
+    c, p, k = b["customer_count"], b["revenue_per_customer"], b["cost_per_customer"]
+    margin = p - k
+    net = c * margin - fixed_costs
+    return {
+        "fixed_costs": _r(fixed_costs),
+        "customers_needed": int(np.ceil(fixed_costs / margin)) if margin > 0 else None,
+        "price_needed": _r(k + fixed_costs / c) if c > 0 else None,
+        "max_cost_per_customer": _r(p - fixed_costs / c) if c > 0 else None,
+        "monthly_net": _r(net),
+        "months_to_recover_investment": (int(np.ceil(investment / net)) if net > 0 else None) if investment > 0 else 0,
+    }
+
+def monte_carlo(b: Dict[str, float], fixed_costs: float = 0.0, simulations: int = 10000,
+                variation: float = 0.2, customers_sd: Optional[float] = None, price_sd: Optional[float] = None,
+                cost_sd: Optional[float] = None, months: int = 12, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Normal relative shocks to each input (sd = variation unless given); reports ranges, not samples."""
+    n = int(min(max(100, simulations), SCENARIO_MAX_CELLS))
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((3, n))
+    sds = np.array([customers_sd if customers_sd is not None else variation,
+                    price_sd if price_sd is not None else variation,
+                    cost_sd if cost_sd is not None else variation])[:, None]
+    c, p, k = np.maximum(0.0, np.array([b["customer_count"], b["revenue_per_customer"], b["cost_per_customer"]])[:, None]
+                         * (1 + sds * shocks))
+    e = unit_economics(c, p, k, fixed_costs)
+    net = e["monthly_net"]
+    return {
+        "simulations": n,
+        "monthly_revenue": _summary(e["monthly_revenue"]),
+        "monthly_net": _summary(net),
+        "horizon_net": {"months": months, **_summary(net * months)},
+        "probability_of_loss": _r((net < 0).mean(), 4),
+    }
+
+# ---------- Entry point (tool + HTTP) ----------
+def analyze(budget: Optional[Dict[str, Any]], analyses: Sequence[str] = ("base", "grid", "break_even"),
+            fixed_costs: float = 0.0, overrides: Optional[Dict[str, float]] = None,
+            options: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Run the requested analyses from stored budget_finance (plus overrides); returns compact summaries."""
+    t0 = time.perf_counter()
+    b = {k: v for k, v in (budget or {}).items() if v is not None}
+    b.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    missing = [k for k in ("customer_count", "revenue_per_customer", "cost_per_customer") if k not in b]
+    if missing:
+        raise ValueError(f"budget_finance is missing {', '.join(missing)}; save it first or pass overrides")
+    b = {k: float(b[k]) for k in ("customer_count", "revenue_per_customer", "cost_per_customer")}
+    unknown = [a for a in analyses if a not in ANALYSES]
+    if unknown:
+        raise ValueError(f"unknown analyses {unknown}; choose from {list(ANALYSES)}")
+
+    funcs = {"base": base_case, "grid": grid, "growth": growth, "break_even": break_even, "monte_carlo": monte_carlo}
+    out: Dict[str, Any] = {"inputs": dict(b, fixed_costs=fixed_costs)}
+    for name in analyses:
+        out[name] = funcs[name](b, fixed_costs=fixed_costs, **((options or {}).get(name) or {}))
+    out["took_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return out
@@ -0,0 +1,96 @@
+# app/semantic_cache.py
+import os, copy, time, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ---------- Config via env ----------
+RAG_SEMCACHE_ENABLED   = os.getenv("RAG_SEMCACHE_ENABLED", "1") == "1"
+RAG_SEMCACHE_THRESHOLD = float(os.getenv("RAG_SEMCACHE_THRESHOLD", "0.95"))   # cosine similarity for a hit
+RAG_SEMCACHE_TTL_SEC   = float(os.getenv("RAG_SEMCACHE_TTL_SEC", "3600"))
+RAG_SEMCACHE_MAX       = int(os.getenv("RAG_SEMCACHE_MAX", "2048"))
+
+class SemanticCache:
+    """Nearest-neighbour cache of rag results keyed on query embeddings.
+
+    Embeddings live unit-normalized in one preallocated float32 matrix, so a lookup is a single
+    matrix-vector product over the live rows. Slots are recycled expired-first, then least recently used.
+    """
+
+    def __init__(self, dim: int, capacity: int = RAG_SEMCACHE_MAX, threshold: float = RAG_SEMCACHE_THRESHOLD,
+                 ttl_sec: float = RAG_SEMCACHE_TTL_SEC, enabled: bool = RAG_SEMCACHE_ENABLED):
+        self.dim = dim
+        self.capacity = max(1, capacity)
+        self.threshold = threshold
+        self.ttl = ttl_sec
+        self.enabled = enabled
+        self._vecs = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)     # 0 == empty slot
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._values: List[Optional[Tuple[str, Any]]] = [None] * self.capacity
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    def lookup(self, vec) -> Optional[Dict[str, Any]]:
+        """Return {"query", "value", "similarity"} for the closest live entry above threshold, else None."""
+        if not self.enabled:
+            return None
+        q = self._unit(vec)
+        now = time.monotonic()
+        with self._lock:
+            live = self._expires > now
+            if not live.any():
+                self.misses += 1
+                return None
+            sims = self._vecs @ q
+            sims[~live] = -np.inf
+            i = int(np.argmax(sims))
+            sim = float(sims[i])
+            if sim < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[i] = now
+            query, value = self._values[i]
+            return {"query": query, "value": copy.deepcopy(value), "similarity": sim}
+
+    def put(self, vec, query: str, value: Any):
+        if not self.enabled:
+            return
+        q = self._unit(vec)
+        now = time.monotonic()
+        with self._lock:
+            free = np.flatnonzero(self._expires <= now)
+            if free.size:
+                i = int(free[0])
+                if self._values[i] is not None:
+                    self.evictions += 1
+            else:
+                i = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vecs[i] = q
+            self._expires[i] = now + self.ttl
+            self._last_used[i] = now
+            self._values[i] = (query, copy.deepcopy(value))
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._values = [None] * self.capacity
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = int((self._expires > time.monotonic()).sum())
+            total = self.hits + self.misses
+            return {
+                "entries": live, "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
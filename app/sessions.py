@@ -0,0 +1,172 @@
+# app/sessions.py
+import os, json, time, threading, logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("app")
+
+# ---------- Config via env ----------
+SESSION_MAX          = int(os.getenv("SESSION_MAX", "256"))             # LRU size limit
+SESSION_TTL_SEC      = float(os.getenv("SESSION_TTL_SEC", "1800"))      # idle eviction
+SESSION_PERSIST      = os.getenv("SESSION_PERSIST", "0") == "1"         # store evicted history in DynamoDB
+SESSION_HISTORY_MAX  = int(os.getenv("SESSION_HISTORY_MAX", "40"))      # messages kept when persisting
+SESSION_HISTORY_SK   = "SESSION#HISTORY"
+_MAX_ITEM_BYTES      = 350_000                                          # DynamoDB item limit is 400 KB
+
+def _trim_history(messages: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Keep the tail of the history, starting on a plain user message so toolUse/toolResult pairs stay intact."""
+    out = list(messages[-limit:]) if limit > 0 else []
+    while out and not (out[0].get("role") == "user"
+                       and not any("toolResult" in c for c in out[0].get("content", []))):
+        out.pop(0)
+    return out
+
+class DynamoHistoryStore:
+    """Persists a user's Agent messages as one item next to their state (pk=USER#<id>, sk=SESSION#HISTORY)."""
+
+    def __init__(self, table_getter: Callable[[], Any], pk: Callable[[str], str]):
+        self._table = table_getter
+        self._pk = pk
+
+    def load(self, user_id: str) -> List[Dict[str, Any]]:
+        resp = self._table().get_item(Key={"pk": self._pk(user_id), "sk": SESSION_HISTORY_SK})
+        raw = (resp.get("Item") or {}).get("messages")
+        return json.loads(raw) if raw else []
+
+    def save(self, user_id: str, messages: List[Dict[str, Any]]):
+        msgs = _trim_history(messages, SESSION_HISTORY_MAX)
+        body = json.dumps(msgs, ensure_ascii=False, default=str)
+        while msgs and len(body.encode("utf-8")) > _MAX_ITEM_BYTES:
+            msgs = _trim_history(msgs[1:], len(msgs))
+            body = json.dumps(msgs, ensure_ascii=False, default=str)
+        self._table().put_item(Item={
+            "pk": self._pk(user_id),
+            "sk": SESSION_HISTORY_SK,
+            "messages": body,
+            "updated_at": int(time.time()),
+        })
+
+class _Session:
+    __slots__ = ("agent", "last_used", "busy", "saved")
+
+    def __init__(self, agent: Any):
+        self.agent = agent
+        self.last_used = time.monotonic()
+        self.busy = 0
+        self.saved: List[Dict[str, Any]] = []   # history as of checkout, restored if the turn does not finish
+
+class SessionPool:
+    """Per-user Agent instances with idle-TTL and LRU eviction.
+
+    Busy sessions (a turn is running) are never evicted. Evicted histories are handed to
+    `store` (if any) and restored the next time the user shows up.
+    """
+
+    def __init__(self, factory: Callable[[List[Dict[str, Any]]], Any],
+                 store: Optional[DynamoHistoryStore] = None,
+                 max_sessions: int = SESSION_MAX, ttl_sec: float = SESSION_TTL_SEC):
+        self._factory = factory
+        self._store = store
+        self._max = max(1, max_sessions)
+        self._ttl = ttl_sec
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _collect(self, now: float) -> List[tuple]:
+        """Pop expired and over-limit idle sessions (oldest first). Caller holds the lock."""
+        evicted = []
+        for uid in list(self._sessions):
+            s = self._sessions[uid]
+            expired = now - s.last_used > self._ttl
+            if not expired and len(self._sessions) <= self._max:
+                break  # ordered by last use, so everything after is fresher
+            if s.busy:
+                continue
+            evicted.append((uid, self._sessions.pop(uid)))
+        return evicted
+
+    def _persist(self, evicted: List[tuple]):
+        self.evictions += len(evicted)
+        if not self._store:
+            return
+        for uid, s in evicted:
+            try:
+                self._store.save(uid, s.agent.messages)
+            except Exception:
+                logger.exception(f"[sessions] failed to persist history for user_id={uid}")
+
+    def _restore(self, user_id: str) -> List[Dict[str, Any]]:
+        if not self._store:
+            return []
+        try:
+            return self._store.load(user_id)
+        except Exception:
+            logger.exception(f"[sessions] failed to restore history for user_id={user_id}")
+            return []
+
+    @contextmanager
+    def session(self, user_id: str):
+        """Yield the user's Agent, marked busy for the duration of the block.
+
+        If the block raises (or is cancelled), the history is rolled back to what it was on entry.
+        """
+        s = self.checkout(user_id)
+        ok = False
+        try:
+            yield s.agent
+            ok = True
+        finally:
+            self.checkin(s, ok)
+
+    def checkout(self, user_id: str) -> _Session:
+        """Mark the user's session busy (building or restoring it if needed); pair with checkin().
+
+        Both halves may block (DynamoDB restore, eviction persistence), so async callers run them
+        in a thread.
+        """
+        with self._lock:
+            s = self._sessions.get(user_id)
+            if s is not None:
+                self._sessions.move_to_end(user_id)
+                s.busy += 1
+        if s is None:
+            # Build (and possibly restore) outside the lock so other users are not blocked.
+            fresh = _Session(self._factory(self._restore(user_id)))
+            with self._lock:
+                s = self._sessions.setdefault(user_id, fresh)
+                self._sessions.move_to_end(user_id)
+                s.busy += 1
+        s.saved = list(s.agent.messages)
+        return s
+
+    def checkin(self, s: _Session, ok: bool = True):
+        """Release a checked-out session. With ok=False the turn did not finish: its partial messages
+        (e.g. a trailing toolResult that Converse would reject before the next user turn) are dropped."""
+        if not ok:
+            s.agent.messages = s.saved
+        s.saved = []
+        with self._lock:
+            s.busy -= 1
+            s.last_used = time.monotonic()
+            evicted = self._collect(s.last_used)
+        self._persist(evicted)
+
+    def sweep(self):
+        """Evict idle sessions past their TTL; cheap enough to call from a timer."""
+        with self._lock:
+            evicted = self._collect(time.monotonic())
+        self._persist(evicted)
+
+    def flush(self):
+        """Persist and drop every idle session (used on shutdown)."""
+        with self._lock:
+            evicted = [(uid, s) for uid, s in self._sessions.items() if not s.busy]
+            for uid, _ in evicted:
+                del self._sessions[uid]
+        self._persist(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max": self._max, "evictions": self.evictions}
@@ -0,0 +1,55 @@
+# app/startup.py
+import os, time, threading, logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger("app")
+
+# Comma-separated warm-up targets run in the background at startup ("" disables).
+WARMUP = os.getenv("WARMUP", "dynamodb,bedrock,s3")
+
+_T0 = time.perf_counter()
+_REPORT: Dict[str, Dict[str, float]] = {"import_ms": {}, "init_ms": {}, "warmup_ms": {}}
+_ERRORS: Dict[str, str] = {}
+_LOCK = threading.Lock()
+ready = threading.Event()
+
+@contextmanager
+def timed(section: str, name: str):
+    """Record how long the block took under _REPORT[section][name] (first measurement wins)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        with _LOCK:
+            _REPORT[section].setdefault(name, ms)
+
+def _run_warmup(steps: Dict[str, Callable[[], Any]]):
+    for name, fn in steps.items():
+        try:
+            with timed("warmup_ms", name):
+                fn()
+        except Exception as e:
+            _ERRORS[name] = repr(e)
+            logger.warning(f"[startup] warm-up step '{name}' failed: {e!r}")
+    ready.set()
+    logger.info(f"[startup] ready: {report()}")
+
+def warm_up(steps: Dict[str, Callable[[], Any]], targets: str = WARMUP):
+    """Pre-connect the selected clients on a daemon thread; `ready` is set when done."""
+    wanted = [t.strip() for t in targets.split(",") if t.strip()]
+    selected = {name: fn for name, fn in steps.items() if name in wanted}
+    if not selected:
+        ready.set()
+        return
+    threading.Thread(target=_run_warmup, args=(selected,), name="warmup", daemon=True).start()
+
+def report() -> Dict[str, Any]:
+    with _LOCK:
+        out: Dict[str, Any] = {k: dict(v) for k, v in _REPORT.items()}
+    out["since_start_ms"] = round((time.perf_counter() - _T0) * 1000, 1)
+    out["ready"] = ready.is_set()
+    if _ERRORS:
+        out["warmup_errors"] = dict(_ERRORS)
+    return out
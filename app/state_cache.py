@@ -0,0 +1,119 @@
+# app/state_cache.py
+import os, copy, time, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# ---------- Config via env ----------
+STATE_CACHE_MAX       = int(os.getenv("STATE_CACHE_MAX", "1024"))        # users kept in memory
+STATE_CACHE_TTL_SEC   = float(os.getenv("STATE_CACHE_TTL_SEC", "300"))   # hard expiry
+STATE_CACHE_TRUST_SEC = float(os.getenv("STATE_CACHE_TRUST_SEC", "5"))   # serve without a version check
+STATE_CACHE_ENABLED   = os.getenv("STATE_CACHE_ENABLED", "1") == "1"
+
+class _Entry:
+    __slots__ = ("state", "version", "expires_at", "checked_at")
+
+    def __init__(self, state: dict, version: int, now: float, ttl: float):
+        self.state = state
+        self.version = version
+        self.expires_at = now + ttl
+        self.checked_at = now
+
+class StateCache:
+    """Write-through, per-user cache of get_state results.
+
+    Each user has a monotonically increasing version (bumped by every write, on any replica).
+    Entries younger than `trust_sec` are served as-is, which makes repeated reads inside one
+    turn free (but may miss another replica's write for that long; callers that expose the
+    version, e.g. as an ETag, pass fresh=True). Older entries are revalidated with a cheap version read before being served;
+    entries past `ttl_sec` are reloaded. Least recently used users are evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = STATE_CACHE_MAX, ttl_sec: float = STATE_CACHE_TTL_SEC,
+                 trust_sec: float = STATE_CACHE_TRUST_SEC, enabled: bool = STATE_CACHE_ENABLED):
+        self._max = max(1, max_entries)
+        self._ttl = ttl_sec
+        self._trust = trust_sec
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, user_id: str,
+            load: Callable[[], Tuple[dict, int]],
+            current_version: Callable[[], int]) -> dict:
+        """Return a private copy of the user's state, loading or revalidating as needed."""
+        return self.get_versioned(user_id, load, current_version)[0]
+
+    def get_versioned(self, user_id: str,
+                      load: Callable[[], Tuple[dict, int]],
+                      current_version: Callable[[], int], fresh: bool = False) -> Tuple[dict, int]:
+        """Like get(), but also returns the version the copy corresponds to (e.g. for an ETag).
+
+        fresh=True skips the trust window: the entry is always revalidated against the stored version.
+        """
+        if not self.enabled:
+            return load()
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(user_id)
+            if e is not None and now >= e.expires_at:
+                del self._entries[user_id]
+                e = None
+            if e is not None:
+                self._entries.move_to_end(user_id)
+                if not fresh and now - e.checked_at <= self._trust:
+                    self.hits += 1
+                    return copy.deepcopy(e.state), e.version
+        if e is not None:
+            self.revalidations += 1
+            if current_version() == e.version:
+                with self._lock:
+                    e.checked_at = time.monotonic()
+                    self.hits += 1
+                    return copy.deepcopy(e.state), e.version
+        self.misses += 1
+        state, version = load()
+        self._store(user_id, state, version)
+        return copy.deepcopy(state), version
+
+    def _store(self, user_id: str, state: dict, version: int):
+        now = time.monotonic()
+        with self._lock:
+            cur = self._entries.get(user_id)
+            if cur is not None and cur.version > version:
+                return  # a newer write-through landed while we were loading
+            self._entries[user_id] = _Entry(copy.deepcopy(state), version, now, self._ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+
+    def apply(self, user_id: str, version: int, mutate: Callable[[dict], None]):
+        """Write-through after a successful write that bumped the user to `version`.
+
+        If the cached entry is exactly one version behind, only this process wrote since it was
+        loaded, so the mutation is applied in place; otherwise the entry is dropped.
+        """
+        with self._lock:
+            e = self._entries.get(user_id)
+            if e is None:
+                return
+            if e.version == version - 1:
+                mutate(e.state)
+                e.version = version
+                e.checked_at = time.monotonic()
+            else:
+                del self._entries[user_id]
+
+    def invalidate(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "revalidations": self.revalidations}
@@ -1,18 +1,25 @@
 # app/tools_rag.py
-import os, json, base64, time, re
-from typing import List, Dict, Any, Optional, Tuple
+import os, json, base64, time, re, threading, logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 from .log_s3 import put_json, _ts
+from .embed_cache import EmbeddingCache
+from . import rerank
+from .retrieval import RetrievalBackend
+from . import startup
+from . import metrics
+from .rerank import RERANK_MODE
+from .resilience import Unavailable, dependency, retryable
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests.auth import HTTPBasicAuth
-import certifi
-
 from strands import tool
 
+if TYPE_CHECKING:  # opensearchpy/requests/certifi are imported on first OpenSearch use, not at import
+    from opensearchpy import OpenSearch
+
 # ---------- Config via env (defaults match your script) ----------
 OS_ENDPOINT     = os.getenv("OS_ENDPOINT", "https://search-allcloud-opensearch-pm4rnrlowxarwciimomeasbzi4.us-west-2.es.amazonaws.com")
 OS_REGION       = os.getenv("OS_REGION", "us-west-2")
@@ -20,6 +27,10 @@ OS_SECRET_NAME  = os.getenv("OS_SECRET_NAME", "OS_Credentials")
 
 INDEX_A         = os.getenv("INDEX_A", "llcattorney_chunks_v2")
 INDEX_B         = os.getenv("INDEX_B", "youtube_rag_v4")
+RAG_INDEXES     = [i.strip() for i in os.getenv("RAG_INDEXES", f"{INDEX_A},{INDEX_B}").split(",") if i.strip()]
+RAG_FANOUT      = os.getenv("RAG_FANOUT", "msearch")       # msearch | threads
+RAG_BACKEND     = os.getenv("RAG_BACKEND", "opensearch")   # opensearch | local
+RAG_FALLBACK    = os.getenv("RAG_FALLBACK", "")            # local: serve k-NN from the local snapshot while OpenSearch is down
 
 VECTOR_FIELD_CANDIDATES = ["embedding", "embedding_vector", "vector", "embedding_vector_1024"]
 VECTOR_DIM      = int(os.getenv("VECTOR_DIM", "1024"))
@@ -31,6 +42,23 @@ LLM_RERANK_K    = int(os.getenv("LLM_RERANK_K", "10"))
 BEDROCK_REGION  = os.getenv("BEDROCK_REGION", "us-west-2")
 EMBED_MODEL_ID  = os.getenv("EMBED_MODEL_ID", "amazon.titan-embed-text-v2:0")
 LLM_MODEL_ID    = os.getenv("LLM_MODEL_ID", "us.anthropic.claude-3-7-sonnet-20250219-v1:0")
+RERANK_CACHE_PROMPT = os.getenv("RERANK_CACHE_PROMPT", "default")   # cachePoint after the fixed rerank instructions; empty = off
+
+OS_POOL_MAXSIZE        = int(os.getenv("OS_POOL_MAXSIZE", "32"))
+OS_CRED_TTL_SEC        = float(os.getenv("OS_CRED_TTL_SEC", "900"))
+OS_HEALTH_INTERVAL_SEC = float(os.getenv("OS_HEALTH_INTERVAL_SEC", "30"))   # 0 disables background pings
+BEDROCK_POOL_MAXSIZE   = int(os.getenv("BEDROCK_POOL_MAXSIZE", "32"))
+
+# Per-call deadlines adapt to recent latency (p99 x TIMEOUT_MULTIPLIER) within these bounds; see resilience.py.
+OS_TIMEOUT_MS     = (float(os.getenv("OS_TIMEOUT_MIN_MS", "250")), float(os.getenv("OS_TIMEOUT_MAX_MS", "3000")))
+EMBED_TIMEOUT_MS  = (float(os.getenv("EMBED_TIMEOUT_MIN_MS", "250")), float(os.getenv("EMBED_TIMEOUT_MAX_MS", "3000")))
+RERANK_TIMEOUT_MS = (float(os.getenv("RERANK_TIMEOUT_MIN_MS", "2000")), float(os.getenv("RERANK_TIMEOUT_MAX_MS", "15000")))
+
+_OS_DEP     = dependency("opensearch", *OS_TIMEOUT_MS)
+_EMBED_DEP  = dependency("bedrock.embed", *EMBED_TIMEOUT_MS)
+_RERANK_DEP = dependency("bedrock.rerank", *RERANK_TIMEOUT_MS, retries=1)   # hedge only if listed in HEDGE_DEPENDENCIES
+
+logger = logging.getLogger("app")
 
 # ---------- Clients ----------
 def _to_host(endpoint: str) -> str:
@@ -43,37 +71,115 @@ def _get_os_basic_auth(secret_name: str = OS_SECRET_NAME, region_name: str = OS_
     data = json.loads(payload)
     return data["OS_USER"], data["OS_PASS"]
 
-def _os_client() -> OpenSearch:
-    user, pwd = _get_os_basic_auth()
+# Process-wide clients: built once, shared by every thread (both clients are thread-safe).
+_CLIENT_LOCK = threading.Lock()
+_OS_CLIENT: Optional["OpenSearch"] = None
+_OS_CREDS_AT = 0.0                 # monotonic time the current credentials were fetched
+_OS_HEALTHY = True
+_OS_HEALTH_THREAD: Optional[threading.Thread] = None
+_BEDROCK = None
+
+def _build_os_client(user: str, pwd: str) -> "OpenSearch":
+    from opensearchpy import OpenSearch, RequestsHttpConnection
+    from requests.auth import HTTPBasicAuth
+    import certifi
     host = _to_host(OS_ENDPOINT)
-    client = OpenSearch(
+    return OpenSearch(
         hosts=[{"host": host, "port": 443, "scheme": "https"}],
         http_auth=HTTPBasicAuth(user, pwd),
         use_ssl=True,
         verify_certs=True,
         ca_certs=certifi.where(),
         connection_class=RequestsHttpConnection,
+        pool_maxsize=OS_POOL_MAXSIZE,      # keep-alive connections reused across queries
         http_compress=True,
         timeout=20,
         max_retries=0,
         retry_on_timeout=False,
     )
-    if not client.ping():
-        raise RuntimeError("OpenSearch ping failed (network/auth/policy).")
-    return client
+
+def _os_client(refresh: bool = False) -> "OpenSearch":
+    """Shared OpenSearch client. Credentials are re-read after OS_CRED_TTL_SEC or when refresh=True."""
+    global _OS_CLIENT, _OS_CREDS_AT, _OS_HEALTHY
+    now = time.monotonic()
+    client = _OS_CLIENT
+    if client is not None and not refresh and now - _OS_CREDS_AT < OS_CRED_TTL_SEC:
+        return client
+    with _CLIENT_LOCK:
+        if _OS_CLIENT is None or refresh or now - _OS_CREDS_AT >= OS_CRED_TTL_SEC:
+            with startup.timed("init_ms", "opensearch.client"):
+                user, pwd = _get_os_basic_auth()
+                # The previous client is left to in-flight queries and garbage-collected afterwards.
+                _OS_CLIENT = _build_os_client(user, pwd)
+            _OS_CREDS_AT = time.monotonic()
+            _OS_HEALTHY = True
+        _start_os_health_checks()
+        return _OS_CLIENT
+
+def _is_auth_error(e: Exception) -> bool:
+    # Matched by name so that checking does not force an opensearchpy import.
+    return type(e).__name__ in ("AuthenticationException", "AuthorizationException") or getattr(e, "status_code", None) in (401, 403)
+
+def _with_os_client(fn):
+    """Run fn(client); on an auth failure, re-fetch credentials once and retry."""
+    try:
+        return fn(_os_client())
+    except Exception as e:
+        if not _is_auth_error(e):
+            raise
+        return fn(_os_client(refresh=True))
+
+def _os_health_loop():
+    global _OS_HEALTHY, _OS_CREDS_AT
+    while True:
+        time.sleep(OS_HEALTH_INTERVAL_SEC)
+        client = _OS_CLIENT
+        if client is None:
+            continue
+        try:
+            ok = bool(client.ping())
+        except Exception:
+            ok = False
+        if not ok and _OS_HEALTHY:
+            logger.warning("[rag] OpenSearch health check failed; credentials will be refreshed on next use")
+        _OS_HEALTHY = ok
+        if not ok:
+            # Failed pings are most often expired/rotated credentials; force a refresh on next use.
+            _OS_CREDS_AT = 0.0
+
+def _start_os_health_checks():
+    # Caller holds _CLIENT_LOCK.
+    global _OS_HEALTH_THREAD
+    if OS_HEALTH_INTERVAL_SEC <= 0 or (_OS_HEALTH_THREAD is not None and _OS_HEALTH_THREAD.is_alive()):
+        return
+    _OS_HEALTH_THREAD = threading.Thread(target=_os_health_loop, name="opensearch-health", daemon=True)
+    _OS_HEALTH_THREAD.start()
 
 def _bedrock_runtime():
-    return boto3.client(
-        "bedrock-runtime",
-        region_name=BEDROCK_REGION,
-        config=Config(connect_timeout=5, read_timeout=30, retries={"max_attempts": 2}),
-    )
+    global _BEDROCK
+    if _BEDROCK is None:
+        with _CLIENT_LOCK:
+            if _BEDROCK is None:
+                with startup.timed("init_ms", "bedrock.runtime"):
+                    _BEDROCK = boto3.client(
+                        "bedrock-runtime",
+                        region_name=BEDROCK_REGION,
+                        config=Config(
+                            # Retries, deadlines and breakers are applied per dependency in resilience.py. The
+                            # read timeout is the longest deadline of the dependencies sharing this client, so a
+                            # call abandoned at its deadline frees its dependency thread soon after.
+                            connect_timeout=5, read_timeout=max(EMBED_TIMEOUT_MS[1], RERANK_TIMEOUT_MS[1]) / 1000,
+                            retries={"total_max_attempts": 1},
+                            max_pool_connections=BEDROCK_POOL_MAXSIZE, tcp_keepalive=True,
+                        ),
+                    )
+    return _BEDROCK
 
 # ---------- Mapping helpers (unchanged) ----------
 _MAPPING_CACHE: Dict[str, Dict[str, Any]] = {}
 _FIELD_PICK_CACHE: Dict[str, Dict[str, Any]] = {}
 
-def _get_field_mapping(client: OpenSearch, index: str, field: str) -> Dict[str, Any]:
+def _get_field_mapping(client: "OpenSearch", index: str, field: str) -> Dict[str, Any]:
     cache_key = f"{index}:{field}"
     if cache_key in _MAPPING_CACHE:
         return _MAPPING_CACHE[cache_key]
@@ -103,7 +209,7 @@ def _vector_field_info(field_map: Dict[str, Any]) -> Dict[str, Any]:
     dims = field_map.get("dimension") or field_map.get("dims") or field_map.get("dimensions")
     return {"type": t, "dims": dims}
 
-def _pick_vector_field_mapping(client: OpenSearch, index: str) -> Dict[str, Any]:
+def _pick_vector_field_mapping(client: "OpenSearch", index: str) -> Dict[str, Any]:
     if index in _FIELD_PICK_CACHE:
         return _FIELD_PICK_CACHE[index]
     for cand in VECTOR_FIELD_CANDIDATES:
@@ -124,40 +230,55 @@ def _pick_vector_field_mapping(client: OpenSearch, index: str) -> Dict[str, Any]
     raise RuntimeError(f"No knn_vector field found in index '{index}'. Tried {VECTOR_FIELD_CANDIDATES}.")
 
 # ---------- Embeddings ----------
-def _embed_text(bedrock, text: str) -> List[float]:
-    body = {"inputText": text}
-    resp = bedrock.invoke_model(modelId=EMBED_MODEL_ID, body=json.dumps(body))
-    payload = json.loads(resp["body"].read())
+_EMBED_CACHE = EmbeddingCache()
+
+def _invoke_embed(bedrock, text: str) -> List[float]:
+    body = json.dumps({"inputText": text})
+    payload = _EMBED_DEP.call(lambda _timeout: json.loads(
+        bedrock.invoke_model(modelId=EMBED_MODEL_ID, body=body)["body"].read()))
     vec = payload["embedding"]
     if len(vec) != VECTOR_DIM:
         raise ValueError(f"Unexpected embedding dim {len(vec)} != {VECTOR_DIM}")
     return vec
 
-# ---------- k-NN search ----------
-def _knn_search(client: OpenSearch, index: str, query_vec: List[float], k: int) -> List[Dict[str, Any]]:
-    vinfo = _pick_vector_field_mapping(client, index)
-    vec_field = vinfo["name"]
-    if vinfo.get("dims") and int(vinfo["dims"]) != len(query_vec):
-        raise ValueError(f"Vector dim mismatch: mapping dims={vinfo['dims']} but query has {len(query_vec)}.")
+def _embed_text(bedrock, text: str) -> List[float]:
+    return _EMBED_CACHE.get(EMBED_MODEL_ID, text, lambda t: _invoke_embed(bedrock, t))
 
-    body_q = {
-        "size": k,
-        "_source": SOURCE_FIELDS,
-        "query": { "knn": { vec_field: { "vector": query_vec, "k": k } } }
-    }
-    try:
-        res = client.search(index=index, body=body_q, request_timeout=20)
-    except Exception as e1:
-        body_top = {
+def _embed_texts(bedrock, texts: List[str]) -> List[List[float]]:
+    """Batch form of _embed_text: Bedrock is called only for the distinct texts not already cached."""
+    return _EMBED_CACHE.get_many(EMBED_MODEL_ID, texts, lambda t: _invoke_embed(bedrock, t))
+
+# ---------- k-NN search ----------
+# Two k-NN request dialects exist across OpenSearch versions/plugins; remember which one each index accepts.
+_DIALECTS = ("query_knn", "top_knn")
+_DIALECT_CACHE: Dict[str, str] = {}
+_FANOUT_POOL = ThreadPoolExecutor(max_workers=max(2, len(RAG_INDEXES)), thread_name_prefix="knn")
+
+def _dialect_order(index: str) -> List[str]:
+    """The cached dialect first, then the other one, so a cluster upgrade costs one retry instead of a failure."""
+    known = _DIALECT_CACHE.get(index)
+    return [known] + [d for d in _DIALECTS if d != known] if known else list(_DIALECTS)
+
+def _knn_body(dialect: str, vec_field: str, query_vec: List[float], k: int) -> Dict[str, Any]:
+    if dialect == "query_knn":
+        return {
             "size": k,
             "_source": SOURCE_FIELDS,
-            "knn": { "field": vec_field, "query_vector": query_vec, "k": k }
+            "query": { "knn": { vec_field: { "vector": query_vec, "k": k } } }
         }
-        try:
-            res = client.search(index=index, body=body_top, request_timeout=20)
-        except Exception as e2:
-            raise RuntimeError(f"k-NN failed on '{index}'. query.knn error={e1}; top-level.knn error={e2}")
+    return {
+        "size": k,
+        "_source": SOURCE_FIELDS,
+        "knn": { "field": vec_field, "query_vector": query_vec, "k": k }
+    }
 
+def _vector_field(client: "OpenSearch", index: str, query_vec: List[float]) -> str:
+    vinfo = _pick_vector_field_mapping(client, index)
+    if vinfo.get("dims") and int(vinfo["dims"]) != len(query_vec):
+        raise ValueError(f"Vector dim mismatch: mapping dims={vinfo['dims']} but query has {len(query_vec)}.")
+    return vinfo["name"]
+
+def _parse_hits(res: Dict[str, Any]) -> List[Dict[str, Any]]:
     out = []
     for h in res.get("hits", {}).get("hits", []):
         src = h.get("_source", {}) or {}
@@ -174,8 +295,127 @@ def _knn_search(client: OpenSearch, index: str, query_vec: List[float], k: int)
         })
     return out
 
+def _server_took(index: str, r: Dict[str, Any], server_ms: Optional[Dict[str, int]]):
+    """OpenSearch's own time for one index's search: a separate stage from the client-side rag.knn.<index>."""
+    if "took" in r:
+        metrics.observe(f"rag.knn.server.{index}", r["took"])
+        if server_ms is not None:
+            server_ms[index] = int(r["took"])
+
+def _knn_search(client: "OpenSearch", index: str, query_vec: List[float], k: int,
+                server_ms: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    with metrics.span(f"rag.knn.{index}"):
+        return _knn_search_once(client, index, query_vec, k, server_ms)
+
+def _knn_search_once(client: "OpenSearch", index: str, query_vec: List[float], k: int,
+                     server_ms: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    vec_field = _vector_field(client, index, query_vec)
+    errors = []
+    for dialect in _dialect_order(index):
+        body = _knn_body(dialect, vec_field, query_vec, k)
+        try:
+            res = _OS_DEP.call(lambda timeout: client.search(index=index, body=body, request_timeout=timeout))
+        except Exception as e:
+            # Only a rejected query means "try the other dialect"; outages and auth errors propagate.
+            if _is_auth_error(e) or isinstance(e, Unavailable) or retryable(e):
+                raise
+            errors.append(f"{dialect} error={e}")
+            continue
+        _DIALECT_CACHE[index] = dialect
+        _server_took(index, res, server_ms)
+        return _parse_hits(res)
+    _DIALECT_CACHE.pop(index, None)  # neither dialect worked; probe both again next time
+    raise RuntimeError(f"k-NN failed on '{index}'. " + "; ".join(errors))
+
+def _knn_search_many(client: "OpenSearch", indexes: List[str], query_vec: List[float], k: int,
+                     server_ms: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """k-NN over several indexes at once; latency is that of the slowest index, not the sum."""
+    if RAG_FANOUT == "threads" or len(indexes) == 1:
+        futs = {idx: _FANOUT_POOL.submit(_knn_search, client, idx, query_vec, k, server_ms) for idx in indexes}
+        return {idx: f.result() for idx, f in futs.items()}
+
+    # One _msearch round-trip per dialect attempt (normally exactly one, once dialects are cached).
+    # An index whose cached dialect is now rejected moves on to the other one in the next round.
+    fields = dict(zip(indexes, _FANOUT_POOL.map(lambda idx: _vector_field(client, idx, query_vec), indexes)))
+    pending = {idx: _dialect_order(idx) for idx in indexes}
+    errors: Dict[str, List[str]] = {idx: [] for idx in indexes}
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    while pending:
+        batch = [(idx, order.pop(0)) for idx, order in pending.items()]
+        body: List[Dict[str, Any]] = []
+        for idx, dialect in batch:
+            body += [{"index": idx}, _knn_body(dialect, fields[idx], query_vec, k)]
+        resp = _OS_DEP.call(lambda timeout: client.msearch(body=body, request_timeout=timeout))
+        responses = resp.get("responses", [])
+        if len(responses) != len(batch):
+            raise RuntimeError(f"_msearch returned {len(responses)} responses for {len(batch)} searches")
+        for (idx, dialect), r in zip(batch, responses):
+            if "error" in r:
+                errors[idx].append(f"{dialect} error={r['error']}")
+                if not pending[idx]:
+                    _DIALECT_CACHE.pop(idx, None)
+                    raise RuntimeError(f"k-NN failed on '{idx}'. " + "; ".join(errors[idx]))
+                continue
+            _DIALECT_CACHE[idx] = dialect
+            _server_took(idx, r, server_ms)
+            results[idx] = _parse_hits(r)
+            del pending[idx]
+    return {idx: results[idx] for idx in indexes}
+
+# ---------- Retrieval backends ----------
+class OpenSearchBackend(RetrievalBackend):
+    name = "opensearch"
+
+    def search_many(self, indexes: List[str], query_vec: List[float], k: int,
+                    server_ms: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return _with_os_client(lambda c: _knn_search_many(c, indexes, query_vec, k, server_ms))
+
+_BACKEND: Optional[RetrievalBackend] = None
+_FALLBACK: Optional[RetrievalBackend] = None
+
+def _backend() -> RetrievalBackend:
+    """RAG_BACKEND=opensearch (default) or local (memory-mapped snapshot under RAG_LOCAL_DIR)."""
+    global _BACKEND
+    if _BACKEND is None:
+        if RAG_BACKEND == "local":
+            from .local_index import LocalVectorBackend
+            _BACKEND = LocalVectorBackend()
+        else:
+            _BACKEND = OpenSearchBackend()
+    return _BACKEND
+
+def _fallback_backend() -> Optional[RetrievalBackend]:
+    global _FALLBACK
+    if _FALLBACK is None and RAG_FALLBACK == "local" and RAG_BACKEND != "local":
+        from .local_index import LocalVectorBackend
+        _FALLBACK = LocalVectorBackend()
+    return _FALLBACK
+
+def _search_many(indexes: List[str], query_vec: List[float], k: int,
+                 server_ms: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, List[Dict[str, Any]]], str]:
+    """k-NN via the configured backend; while OpenSearch is unavailable, via RAG_FALLBACK if set."""
+    try:
+        return _backend().search_many(indexes, query_vec, k, server_ms), _backend().name
+    except Exception as e:
+        fallback = _fallback_backend()
+        if fallback is None or not (isinstance(e, Unavailable) or retryable(e)):
+            raise
+        logger.warning(f"[rag] {_backend().name} unavailable ({e}); using {fallback.name} index")
+        return fallback.search_many(indexes, query_vec, k, server_ms), fallback.name
+
 # ---------- LLM rerank (with tags) ----------
-def _llm_rerank(bedrock, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+# Fixed instructions first, so they form a stable prefix that Bedrock can cache across queries.
+_RERANK_SYSTEM = [
+    {"text": "You are a precise ranking model. Score each document [0.0..1.0] for relevance to the query. "
+             "Use title/snippet PLUS metadata tags: industry_tags, theme_tags, tags_text. "
+             "Boost direct/strong tag matches; penalize irrelevant tag spam. "
+             "Return only JSON."},
+    {"text": 'Return ONLY JSON like: [{"doc_id":"...","score":0.87}, ...] sorted by score desc.'},
+] + ([{"cachePoint": {"type": RERANK_CACHE_PROMPT}}] if RERANK_CACHE_PROMPT else [])
+
+def _llm_rerank(bedrock, query: str, candidates: List[Dict[str, Any]],
+                info: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Claude scores the candidates; Bedrock usage (incl. cache read/write tokens) is put in info["usage"] if given."""
     def trim(text: Optional[str], limit: int = 1200) -> str:
         t = (text or "").replace("\n", " ").strip()
         return t[:limit] + ("…" if len(t) > limit else "")
@@ -194,23 +434,18 @@ def _llm_rerank(bedrock, query: str, candidates: List[Dict[str, Any]]) -> List[D
             "tags_text": trim(c.get("tags_text", ""), 400),
         })
 
-    system = (
-        "You are a precise ranking model. Score each document [0.0..1.0] for relevance to the query. "
-        "Use title/snippet PLUS metadata tags: industry_tags, theme_tags, tags_text. "
-        "Boost direct/strong tag matches; penalize irrelevant tag spam. "
-        "Return only JSON."
-    )
-    user_payload = {
-        "query": query,
-        "documents": items,
-        "instructions": 'Return ONLY JSON like: [{"doc_id":"...","score":0.87}, ...] sorted by score desc.'
-    }
-    resp = bedrock.converse(
+    user_payload = {"query": query, "documents": items}
+    messages = [{"role": "user", "content": [{"text": json.dumps(user_payload)}]}]
+    resp = _RERANK_DEP.call(lambda _timeout: bedrock.converse(
         modelId=LLM_MODEL_ID,
-        system=[{"text": system}],
-        messages=[{"role": "user", "content": [{"text": json.dumps(user_payload)}]}],
+        system=_RERANK_SYSTEM,
+        messages=messages,
         inferenceConfig={"temperature": 0},
-    )
+    ))
+    usage = resp.get("usage") or {}
+    metrics.count_tokens(metrics.RERANK_TOKENS, usage)
+    if info is not None:
+        info["usage"] = usage
     text = resp["output"]["message"]["content"][0]["text"].strip().strip("`")
     if text.lower().startswith("json"):
         text = text[4:].strip()
@@ -219,21 +454,83 @@ def _llm_rerank(bedrock, query: str, candidates: List[Dict[str, Any]]) -> List[D
 
     with_scores = []
     for c in candidates:
-        c2 = dict(c)
+        c2 = dict(c, rerank_stage="llm")   # tiered mode passes in rows the local stage already tagged
         c2["rerank_score"] = scores.get(c["doc_id"], 0.0)
         with_scores.append(c2)
     with_scores.sort(key=lambda x: (x.get("rerank_score", 0.0), x.get("score", 0.0)), reverse=True)
     return with_scores
 
-def _search_orchestrate(query: str) -> Dict[str, Any]:
+# ---------- Tiered rerank ----------
+def _rerank(bedrock, query: str, per_index: Dict[str, List[Dict[str, Any]]],
+            top: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """RERANK_MODE=llm: Claude ranks the top candidates (previous behaviour).
+    local: fusion/BM25/tag scores only. tiered: local first, then Claude only on the ambiguous slice, if any.
+
+    If the Claude call fails (or its breaker is open) the search still answers: llm mode returns k-NN
+    order, tiered mode keeps the local order, and info["degraded"] says why.
+    """
+    if RERANK_MODE == "llm":
+        rerank.record(len(top), "llm")
+        info = {"mode": "llm", "llm_docs": len(top)}
+        try:
+            return _llm_rerank(bedrock, query, top, info), info
+        except Exception as e:
+            _degrade(info, e)
+            return [dict(r, rerank_stage="knn") for r in top], info
+
+    ranked = rerank.local_rerank(query, per_index)
+    lo, hi = (0, 0) if RERANK_MODE == "local" else rerank.ambiguous_slice(ranked, max_k=LLM_RERANK_K)
+    rerank.record(hi - lo, RERANK_MODE)
+    info = {"mode": RERANK_MODE, "llm_docs": hi - lo}
+    if hi > lo:
+        try:
+            ranked = ranked[:lo] + _llm_rerank(bedrock, query, ranked[lo:hi], info) + ranked[hi:]
+        except Exception as e:
+            _degrade(info, e)
+    return ranked, info
+
+def _degrade(info: Dict[str, Any], e: Exception):
+    rerank.record_degraded()
+    info["degraded"] = type(e).__name__
+    logger.warning(f"[rag] LLM rerank skipped: {e}")
+
+_SEM_CACHE = None
+
+def _sem_cache():
+    """Semantic result cache, built on first search (it preallocates a NumPy matrix)."""
+    global _SEM_CACHE
+    if _SEM_CACHE is None:
+        with _CLIENT_LOCK:
+            if _SEM_CACHE is None:
+                from .semantic_cache import SemanticCache
+                _SEM_CACHE = SemanticCache(VECTOR_DIM)
+    return _SEM_CACHE
+
+metrics.register_stats("rerank", rerank.stats)
+metrics.register_stats("embed_cache", _EMBED_CACHE.stats)
+metrics.register_stats("semcache", lambda: _SEM_CACHE.stats() if _SEM_CACHE is not None else None)
+
+def _search_orchestrate(query: str, trace: Optional["metrics.Trace"] = None,
+                        timings: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Embed -> (semantic cache) -> k-NN -> rerank. Stage latencies go to `timings` and the turn trace."""
     bedrock = _bedrock_runtime()
-    vec = _embed_text(bedrock, query)
-    client = _os_client()
-    res_a = _knn_search(client, INDEX_A, vec, TOP_K_PER_INDEX)
-    res_b = _knn_search(client, INDEX_B, vec, TOP_K_PER_INDEX)
+    with metrics.span("rag.embed", trace, timings):
+        vec = _embed_text(bedrock, query)
+    # Near-duplicate question: reuse its reranked results and skip OpenSearch + the Claude rerank.
+    hit = _sem_cache().lookup(vec)
+    if hit is not None:
+        out = hit["value"]
+        out["query"] = query
+        out["cache"] = {"hit": True, "similarity": round(hit["similarity"], 4), "cached_query": hit["query"]}
+        return out
+    with metrics.span("rag.knn", trace, timings) as attrs:
+        server_ms: Dict[str, int] = {}
+        per_index, attrs["backend"] = _search_many(RAG_INDEXES, vec, TOP_K_PER_INDEX, server_ms)
+        if server_ms:
+            attrs["server_ms"] = server_ms   # OpenSearch's own time per index, next to the client-side duration
 
     merged = {}
-    for r in res_a + res_b:
+    for r in (r for rows in per_index.values() for r in rows):
         key = (r["index"], r["doc_id"])
         if key not in merged or r["score"] > merged[key]["score"]:
             merged[key] = r
@@ -243,7 +540,12 @@ def _search_orchestrate(query: str) -> Dict[str, Any]:
     if not top:
         return {"query": query, "results": [], "reranked": []}
 
-    reranked = _llm_rerank(bedrock, query, top)
+    with metrics.span("rag.rerank", trace, timings) as attrs:
+        reranked, rerank_info = _rerank(bedrock, query, per_index, top)
+        # Token usage belongs to this turn's trace, not to the (semantically cached) result the model reads.
+        usage = rerank_info.pop("usage", None)
+        if usage:
+            attrs["usage"] = usage
     # Return compact structure for the agent to cite
     def pack(rows: List[Dict[str, Any]]):
         return [
@@ -255,12 +557,16 @@ def _search_orchestrate(query: str) -> Dict[str, Any]:
                 "snippet": (r.get("body") or "")[:500],
                 "vector_score": r.get("score"),
                 "rerank_score": r.get("rerank_score"),
+                "rerank_stage": r.get("rerank_stage", "llm"),
                 "industry_tags": r.get("industry_tags", []),
                 "theme_tags": r.get("theme_tags", []),
             }
             for r in rows
         ]
-    return {"query": query, "results": pack(merged_list[:LLM_RERANK_K]), "reranked": pack(reranked)}
+    out = {"query": query, "results": pack(merged_list[:LLM_RERANK_K]), "reranked": pack(reranked), "rerank": rerank_info}
+    if not rerank_info.get("degraded"):   # a degraded answer should not be served again from cache
+        _sem_cache().put(vec, query, out)
+    return out
 
 # ---------- Exposed Strands tool ----------
 @tool
@@ -272,8 +578,21 @@ def rag_search(user_id: str, question: str) -> dict:
         "question": question
     }, ts=ts, key_suffix="rag")
 
-    # … do embedding, kNN, rerank …
+    trace = metrics.current(user_id)
+    timings: Dict[str, int] = {}
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        out = _search_orchestrate(question, trace, timings)
+        ok = True
+    finally:
+        total_ms = int((time.perf_counter() - t0) * 1000)
+        metrics.record_tool(user_id, "rag_search", ts, ["user_id", "question"], total_ms, ok)
+    reranked = out.get("reranked") or []
     result = {"answers": reranked[:5], "took_ms": total_ms}
+    for key in ("rerank", "cache"):
+        if key in out:
+            result[key] = out[key]
 
     put_json(user_id, "answers", {
         "ts": ts,
@@ -286,9 +605,9 @@ def rag_search(user_id: str, question: str) -> dict:
         "ts": ts,
         "component": "rag_search",
         "trace": {
-            "steps": ["embed_text", "knn_search:A", "knn_search:B", "llm_rerank"],
-            "durations_ms": timings_dict
+            "steps": list(timings),
+            "durations_ms": timings,
+            "total_ms": total_ms,
         }
     }, ts=ts, key_suffix="rag")
-
-    return result
\ No newline at end of file
+    return result
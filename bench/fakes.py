@@ -0,0 +1,371 @@
+# bench/fakes.py
+"""In-process stand-ins for DynamoDB, S3, the Bedrock runtime and OpenSearch.
+
+Each fake implements only the calls the app makes, sleeps for a sampled latency and
+raises an injected error at a configured rate, so runs need no network or credentials.
+"""
+import io, json, math, copy, random, threading, time, zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+# ---------- Latency / error injection ----------
+@dataclass
+class Fault:
+    """Log-normal latency (median and p99, in ms) plus a per-call error probability."""
+    median_ms: float = 0.0
+    p99_ms: Optional[float] = None     # default: 3x the median
+    error_rate: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        p99 = self.p99_ms or 3 * self.median_ms
+        sigma = math.log(max(p99, self.median_ms) / self.median_ms) / 2.326
+        return self.median_ms * math.exp(rng.gauss(0.0, sigma)) / 1000.0
+
+    def fails(self, rng: random.Random) -> bool:
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+class _Service:
+    """Shared bookkeeping: per-operation call/error counts, latency sampling, error injection."""
+    name = "service"
+
+    def __init__(self, fault: Fault, seed: int = 0):
+        self.fault = fault
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def _enter(self, op: str, fault: Optional[Fault] = None):
+        fault = fault or self.fault
+        with self._rng_lock:
+            delay, fail = fault.sample(self._rng), fault.fails(self._rng)
+        with self._stats_lock:
+            self.calls[op] += 1
+            if fail:
+                self.errors[op] += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise self._error(op)
+
+    def _error(self, op: str) -> Exception:
+        return ClientError({"Error": {"Code": "ServiceUnavailable", "Message": f"injected {self.name} failure"}}, op)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+# ---------- DynamoDB (Table resource) ----------
+class _TransactionCanceled(ClientError):
+    pass
+
+class _ClientExceptions:
+    TransactionCanceledException = _TransactionCanceled
+    ResourceNotFoundException = type("ResourceNotFoundException", (ClientError,), {})
+
+class _FakeDynamoClient:
+    """The slice of table.meta.client the app uses (transact_write_items)."""
+    exceptions = _ClientExceptions
+
+    def __init__(self, table: "FakeTable"):
+        self._table = table
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]]):
+        self._table._enter("TransactWriteItems")
+        with self._table._lock:
+            # Only the condition the app uses: attribute_exists(sk) on an Update.
+            reasons = [{"Code": "ConditionalCheckFailed"}
+                       if "attribute_exists" in it.get("Update", {}).get("ConditionExpression", "")
+                       and self._table._key(it["Update"]["Key"]) not in self._table._items
+                       else {"Code": "None"} for it in TransactItems]
+            if any(r["Code"] != "None" for r in reasons):
+                raise _TransactionCanceled({"Error": {"Code": "TransactionCanceledException", "Message": "conditional check failed"},
+                                            "CancellationReasons": reasons}, "TransactWriteItems")
+            for it in TransactItems:
+                if "Update" in it:
+                    self._table._update_locked(**{k: v for k, v in it["Update"].items() if k != "TableName"})
+                elif "Put" in it:
+                    self._table._put_locked(it["Put"]["Item"])
+                elif "Delete" in it:
+                    self._table._items.pop(self._table._key(it["Delete"]["Key"]), None)
+        return {}
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+class _BatchWriter:
+    def __init__(self, table: "FakeTable"):
+        self._table, self._pending = table, []
+
+    def put_item(self, Item: Dict[str, Any]):
+        self._pending.append(Item)
+        if len(self._pending) == 25:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._table._enter("BatchWriteItem")
+            with self._table._lock:
+                for item in self._pending:
+                    self._table._put_locked(item)
+            self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._flush()
+        return False
+
+class FakeTable(_Service):
+    """Dict-backed pk/sk table: put/get/update/query (paginated), batch_writer and transactions."""
+    name = "dynamodb"
+    PAGE_SIZE = 100
+
+    def __init__(self, fault: Fault, seed: int = 0):
+        super().__init__(fault, seed)
+        self._items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.meta = _Meta(_FakeDynamoClient(self))
+
+    @staticmethod
+    def _key(key: Dict[str, Any]) -> Tuple[str, str]:
+        return key["pk"], key["sk"]
+
+    def _put_locked(self, item: Dict[str, Any]):
+        self._items[self._key(item)] = copy.deepcopy(item)
+
+    def put_item(self, Item: Dict[str, Any], **_):
+        self._enter("PutItem")
+        with self._lock:
+            self._put_locked(Item)
+        return {}
+
+    @staticmethod
+    def _project(item: Dict[str, Any], projection: Optional[str], names: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        if not projection:
+            return copy.deepcopy(item)
+        wanted = [(names or {}).get(p.strip(), p.strip()) for p in projection.split(",")]
+        return {a: copy.deepcopy(item[a]) for a in wanted if a in item}
+
+    def get_item(self, Key: Dict[str, Any], ProjectionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[Dict[str, str]] = None, **_):
+        self._enter("GetItem")
+        with self._lock:
+            item = self._items.get(self._key(Key))
+            return {"Item": self._project(item, ProjectionExpression, ExpressionAttributeNames)} if item else {}
+
+    def _update_locked(self, Key, UpdateExpression, ExpressionAttributeNames=None,
+                       ExpressionAttributeValues=None, ReturnValues=None, **_):
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        item = self._items.setdefault(self._key(Key), dict(Key))
+        changed = {}
+        clause, action = UpdateExpression.replace(",", " , ").split(), None
+        i = 0
+        while i < len(clause):
+            tok = clause[i]
+            if tok.upper() in ("SET", "ADD", "REMOVE"):
+                action, i = tok.upper(), i + 1
+                continue
+            if tok == ",":
+                i += 1
+                continue
+            attr = names.get(tok, tok)
+            if action == "SET":                         # attr = :v
+                item[attr] = changed[attr] = copy.deepcopy(values[clause[i + 2]])
+                i += 3
+            elif action == "ADD":                       # attr :v
+                item[attr] = changed[attr] = Decimal(str(item.get(attr, 0))) + Decimal(str(values[clause[i + 1]]))
+                i += 2
+            else:                                       # REMOVE attr
+                item.pop(attr, None)
+                i += 1
+        return {"Attributes": copy.deepcopy(changed)} if ReturnValues == "UPDATED_NEW" else {}
+
+    def update_item(self, **kwargs):
+        self._enter("UpdateItem")
+        with self._lock:
+            return self._update_locked(**kwargs)
+
+    def query(self, KeyConditionExpression, ProjectionExpression: Optional[str] = None,
+              ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+              ExclusiveStartKey: Optional[Dict[str, Any]] = None, **_):
+        self._enter("Query")
+        pk = KeyConditionExpression.get_expression()["values"][1]   # Key("pk").eq(value)
+        with self._lock:
+            rows = sorted((k, v) for k, v in self._items.items() if k[0] == pk)
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            rows = [(k, v) for k, v in rows if k > start]
+        page = rows[:self.PAGE_SIZE]
+        out: Dict[str, Any] = {"Items": [self._project(v, ProjectionExpression, ExpressionAttributeNames) for _, v in page]}
+        if len(rows) > self.PAGE_SIZE:
+            out["LastEvaluatedKey"] = {"pk": page[-1][0][0], "sk": page[-1][0][1]}
+        return out
+
+    def batch_writer(self, **_):
+        return _BatchWriter(self)
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out["items"] = len(self._items)
+        return out
+
+# ---------- S3 ----------
+class FakeS3(_Service):
+    """Counts objects and bytes; bodies are discarded."""
+    name = "s3"
+
+    def __init__(self, fault: Fault, seed: int = 0):
+        super().__init__(fault, seed)
+        self.objects = 0
+        self.bytes = 0
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **_):
+        self._enter("PutObject")
+        with self._stats_lock:
+            self.objects += 1
+            self.bytes += len(Body)
+        return {"ETag": '"%08x"' % zlib.crc32(Body)}
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update(objects=self.objects, bytes=self.bytes)
+        return out
+
+# ---------- Shared embedding space ----------
+_TOKEN_SPLIT = str.maketrans({c: " " for c in ".,;:!?()[]{}\"'`/\\-_=+*&%$#@<>|~"})
+
+class TokenSpace:
+    """Deterministic bag-of-words embeddings: texts that share words get similar vectors."""
+
+    def __init__(self, dim: int, seed: int = 0):
+        self.dim, self.seed = dim, seed
+        self._vecs: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _token(self, tok: str) -> np.ndarray:
+        v = self._vecs.get(tok)
+        if v is None:
+            v = np.random.default_rng(zlib.crc32(tok.encode()) ^ self.seed).standard_normal(self.dim).astype(np.float32)
+            with self._lock:
+                self._vecs[tok] = v
+        return v
+
+    def embed(self, text: str) -> np.ndarray:
+        toks = (text or "").lower().translate(_TOKEN_SPLIT).split() or ["<empty>"]
+        v = np.sum([self._token(t) for t in toks], axis=0)
+        return v / (np.linalg.norm(v) or 1.0)
+
+# ---------- Bedrock runtime (embeddings + rerank converse) ----------
+class FakeBedrockRuntime(_Service):
+    """invoke_model returns Titan-style embeddings; converse answers the rerank prompt with JSON scores."""
+    name = "bedrock"
+
+    def __init__(self, fault: Fault, space: TokenSpace, converse_fault: Optional[Fault] = None, seed: int = 0):
+        super().__init__(fault, seed)
+        self.space = space
+        self.converse_fault = converse_fault or fault
+
+    def invoke_model(self, modelId: str, body: str, **_):
+        self._enter("InvokeModel")
+        text = json.loads(body).get("inputText", "")
+        return {"body": io.BytesIO(json.dumps({"embedding": self.space.embed(text).tolist()}).encode())}
+
+    def converse(self, modelId: str, messages: List[Dict[str, Any]], **_):
+        self._enter("Converse", self.converse_fault)
+        text = next((b["text"] for b in messages[-1]["content"] if "text" in b), "{}")
+        payload = json.loads(text)
+        q = self.space.embed(payload.get("query", ""))
+        ranked = sorted(
+            ({"doc_id": d["doc_id"],
+              "score": round(float((1 + q @ self.space.embed(f"{d.get('title', '')} {d.get('snippet', '')}")) / 2), 4)}
+             for d in payload.get("documents", [])),
+            key=lambda r: r["score"], reverse=True)
+        out = json.dumps(ranked)
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": out}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": len(text) // 4, "outputTokens": len(out) // 4, "totalTokens": (len(text) + len(out)) // 4},
+        }
+
+# ---------- OpenSearch ----------
+_WORDS = ("llc corporation sole proprietor partnership tax deduction payroll license permit insurance liability "
+          "marketing pricing customers revenue margin cash flow loan grant investor bookkeeping invoice contract "
+          "trademark website social media bakery cafe salon consulting landscaping retail ecommerce food truck "
+          "lease hiring employees contractor quarterly estimated sales inventory supplier wholesale budget").split()
+
+class _Indices:
+    def __init__(self, os_: "FakeOpenSearch"):
+        self._os = os_
+
+    def get_mapping(self, index: str, **_):
+        self._os._enter("GetMapping")
+        return {index: {"mappings": {"properties": {
+            "embedding": {"type": "knn_vector", "dimension": self._os.space.dim},
+            "title": {"type": "text"}, "body": {"type": "text"},
+        }}}}
+
+class _FakeOpenSearchError(Exception):
+    status_code = 503
+
+class FakeOpenSearch(_Service):
+    """Brute-force cosine k-NN over synthetic documents; accepts both k-NN request dialects."""
+    name = "opensearch"
+
+    def __init__(self, fault: Fault, space: TokenSpace, indexes: List[str], docs_per_index: int = 2000, seed: int = 0):
+        super().__init__(fault, seed)
+        self.space = space
+        self.indices = _Indices(self)
+        self._docs: Dict[str, List[Dict[str, Any]]] = {}
+        self._mats: Dict[str, np.ndarray] = {}
+        rng = random.Random(seed)
+        for index in indexes:
+            docs, vecs = [], []
+            for i in range(docs_per_index):
+                tags = rng.sample(_WORDS, 3)
+                title = " ".join(rng.sample(_WORDS, 4)).title()
+                body = " ".join(rng.choice(_WORDS) for _ in range(60))
+                docs.append({"_id": f"{index}-{i}", "title": title, "body": body, "url": f"https://example.com/{index}/{i}",
+                             "industry_tags": tags[:1], "theme_tags": tags[1:], "tags_text": " ".join(tags)})
+                vecs.append(space.embed(f"{title} {body} {' '.join(tags)}"))
+            self._docs[index] = docs
+            self._mats[index] = np.vstack(vecs).astype(np.float32)
+
+    def _error(self, op: str) -> Exception:
+        return _FakeOpenSearchError(f"injected opensearch failure in {op}")
+
+    def ping(self, **_):
+        self._enter("Ping")
+        return True
+
+    def _knn(self, index: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        if "query" in body:
+            spec = next(iter(body["query"]["knn"].values()))
+            vec, k = spec["vector"], spec["k"]
+        else:
+            vec, k = body["knn"]["query_vector"], body["knn"]["k"]
+        scores = (1 + self._mats[index] @ np.asarray(vec, dtype=np.float32)) / 2
+        top = np.argsort(-scores)[:min(k, body.get("size", k))]
+        fields = body.get("_source") or []
+        hits = [{"_id": self._docs[index][i]["_id"], "_index": index, "_score": float(scores[i]),
+                 "_source": {f: self._docs[index][i][f] for f in fields if f in self._docs[index][i]}} for i in top]
+        return {"took": int((time.perf_counter() - t0) * 1000), "hits": {"hits": hits}}
+
+    def search(self, index: str, body: Dict[str, Any], **_):
+        self._enter("Search")
+        return self._knn(index, body)
+
+    def msearch(self, body: List[Dict[str, Any]], **_):
+        self._enter("MSearch")
+        return {"responses": [self._knn(body[i]["index"], body[i + 1]) for i in range(0, len(body), 2)]}
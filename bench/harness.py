@@ -0,0 +1,144 @@
+# bench/harness.py
+import os, sys, json, time, platform, subprocess, threading, datetime as dt
+from typing import Any, Dict, List, Optional
+
+from .fakes import Fault, FakeTable, FakeS3, FakeBedrockRuntime, FakeOpenSearch, TokenSpace
+
+SERVICES = ("dynamodb", "s3", "embed", "converse", "opensearch", "model")
+
+# Latency presets in ms (median, p99) plus error rate per call.
+PROFILES: Dict[str, Dict[str, Fault]] = {
+    "zero": {s: Fault() for s in SERVICES},   # app overhead only
+    "default": {
+        "dynamodb": Fault(6, 25), "s3": Fault(25, 120), "embed": Fault(40, 150),
+        "converse": Fault(700, 2500), "opensearch": Fault(30, 120), "model": Fault(450, 1500),
+    },
+    "degraded": {
+        "dynamodb": Fault(12, 150, 0.01), "s3": Fault(60, 600, 0.02), "embed": Fault(80, 600, 0.01),
+        "converse": Fault(1200, 6000, 0.02), "opensearch": Fault(60, 900, 0.02), "model": Fault(700, 4000, 0.01),
+    },
+}
+
+def parse_faults(profile: str, overrides: List[str]) -> Dict[str, Fault]:
+    """Start from a preset and apply `service=median[:p99[:error_rate]]` overrides."""
+    if profile not in PROFILES:
+        raise SystemExit(f"unknown profile {profile!r}; choose from {', '.join(PROFILES)}")
+    faults = {k: Fault(v.median_ms, v.p99_ms, v.error_rate) for k, v in PROFILES[profile].items()}
+    for spec in overrides or []:
+        name, _, val = spec.partition("=")
+        if name not in SERVICES or not val:
+            raise SystemExit(f"bad --fault {spec!r}; expected one of {SERVICES} as name=median[:p99[:error_rate]]")
+        parts = val.split(":")
+        faults[name] = Fault(float(parts[0]), float(parts[1]) if len(parts) > 1 and parts[1] else None,
+                             float(parts[2]) if len(parts) > 2 else 0.0)
+    return faults
+
+def configure_env():
+    """Environment the app reads at import; call before anything under app/ is imported."""
+    os.environ.setdefault("AWS_REGION", "us-west-2")
+    os.environ.setdefault("LOG_S3_BUCKET", "bench-logs")
+    os.environ.setdefault("WARMUP", "")
+    os.environ.setdefault("OS_HEALTH_INTERVAL_SEC", "0")
+    os.environ.setdefault("EMBED_CACHE_PATH", "")          # memory only, so every run starts cold
+
+class Fakes:
+    def __init__(self, faults: Dict[str, Fault], docs_per_index: int = 2000, seed: int = 0):
+        from app import tools_rag
+        from .model import ScriptedModel
+        space = TokenSpace(tools_rag.VECTOR_DIM, seed)
+        self.table = FakeTable(faults["dynamodb"], seed)
+        self.s3 = FakeS3(faults["s3"], seed)
+        self.bedrock = FakeBedrockRuntime(faults["embed"], space, faults["converse"], seed)
+        self.opensearch = FakeOpenSearch(faults["opensearch"], space, tools_rag.RAG_INDEXES, docs_per_index, seed)
+        self.model = ScriptedModel(faults["model"], seed=seed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {f.name: f.stats() for f in (self.table, self.s3, self.bedrock, self.opensearch)}
+
+def install(faults: Dict[str, Fault], docs_per_index: int = 2000, seed: int = 0) -> Fakes:
+    """Point the app's lazily-built clients at the fakes (the getters return these from now on)."""
+    from app import agent, log_s3, tools_rag
+    fakes = Fakes(faults, docs_per_index, seed)
+    agent._TABLE = fakes.table
+    fakes.model.update_config(**agent.MODEL_CACHE_CONFIG)
+    agent._MODEL = agent.resilient_model(fakes.model)
+    log_s3._s3 = fakes.s3
+    tools_rag._BEDROCK = fakes.bedrock
+    tools_rag._OS_CLIENT = fakes.opensearch
+    tools_rag._OS_CREDS_AT = time.monotonic()
+    tools_rag.OS_CRED_TTL_SEC = float("inf")
+    return fakes
+
+class StageRecorder:
+    """Collects every finished turn trace (tool calls, RAG stages, model time) for the per-stage report."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def install(self):
+        from app import metrics
+        end_turn = metrics.end_turn
+
+        def recording_end_turn(trace):
+            end_turn(trace)
+            self.add_spans(trace.spans)
+        metrics.end_turn = recording_end_turn
+
+    def add(self, stage: str, ms: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(ms)
+
+    def add_spans(self, spans: List[Dict[str, Any]]):
+        for s in spans:
+            self.add(f"tool:{s['tool']}" if "tool" in s else s["stage"], s["duration_ms"])
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {k: summarize(v) for k, v in sorted(self.samples.items())}
+
+def percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = (len(sorted_vals) - 1) * q
+    lo, hi = int(i), min(int(i) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (i - lo)
+
+def summarize(vals: List[float]) -> Dict[str, float]:
+    s = sorted(vals)
+    return {
+        "count": len(s),
+        "mean": round(sum(s) / len(s), 2) if s else 0.0,
+        "p50": round(percentile(s, 0.50), 2),
+        "p95": round(percentile(s, 0.95), 2),
+        "p99": round(percentile(s, 0.99), 2),
+        "max": round(s[-1], 2) if s else 0.0,
+    }
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def environment() -> Dict[str, Any]:
+    return {"git": _git_rev(), "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "argv": sys.argv[1:]}
+
+def save(report: Dict[str, Any], out_dir: str, label: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(out_dir, f"{stamp}-{label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True, default=str)
+    return path
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None):
+    print(f"\n{title}")
+    print(f"  {'stage':<34}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}" + ("   p95 vs baseline" if baseline else ""))
+    for name, s in rows.items():
+        line = f"  {name:<34}{s['count']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}"
+        b = (baseline or {}).get(name)
+        if b and b.get("p95"):
+            line += f"   {(s['p95'] - b['p95']) / b['p95'] * 100:+7.1f}%"
+        print(line)
@@ -0,0 +1,120 @@
+# bench/model.py
+"""A Strands model that plays back plausible tool-call sequences instead of calling Bedrock."""
+import asyncio, datetime as dt, json, random, re, time, uuid
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+from strands.models import Model
+
+from .fakes import Fault
+
+_USER_ID = re.compile(r"USER_ID=(\S+)")
+_MESSAGE = re.compile(r"MESSAGE=(.*)", re.S)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+CACHE_MIN_TOKENS = 1024   # Bedrock ignores cache checkpoints on shorter prefixes (Claude Sonnet minimum)
+
+def _text_of(msg: Dict[str, Any]) -> str:
+    return "".join(b["text"] for b in msg.get("content", []) if isinstance(b, dict) and "text" in b)
+
+def _is_turn_start(msg: Dict[str, Any]) -> bool:
+    """A user message typed by the person (not a toolResult hand-back)."""
+    return msg.get("role") == "user" and not any("toolResult" in b for b in msg.get("content", []) if isinstance(b, dict))
+
+def plan(user_id: str, message: str, available: set) -> List[Dict[str, Any]]:
+    """Tool calls a coach would make for this message, restricted to the tools the agent exposes."""
+    m = message.lower()
+    nums = [float(n) for n in _NUMBER.findall(m)]
+    due = (dt.date.today() + dt.timedelta(days=7)).isoformat()
+    steps: List[Dict[str, Any]] = [{"name": "get_state", "input": {"user_id": user_id}}]
+    if any(w in m for w in ("business is", "idea", "i want to open", "i run", "starting a")):
+        steps.append({"name": "upsert_business_idea", "input": {
+            "user_id": user_id, "business_name": "Bench Co", "idea": message[:120], "market": "local"}})
+    if any(w in m for w in ("customers", "revenue", "cost", "charge", "price")) and len(nums) >= 3:
+        steps.append({"name": "upsert_budget_finance", "input": {
+            "user_id": user_id, "customer_count": int(nums[0]), "revenue_per_customer": nums[1], "cost_per_customer": nums[2]}})
+    if "tasks" in m or "to-dos" in m or "todos" in m:
+        steps.append({"name": "add_todos", "input": {"user_id": user_id, "todos": [
+            {"task": f"{message[:40]} ({i + 1})", "due_date": due} for i in range(3)]}})
+    elif any(w in m for w in ("remind", "todo", "to-do", "task")):
+        steps.append({"name": "add_todo", "input": {"user_id": user_id, "task": message[:80], "due_date": due}})
+    if "?" in m or any(w in m for w in ("how do", "what should", "should i", "explain")):
+        steps.append({"name": "rag_search", "input": {"user_id": user_id, "question": message}})
+    return [s for s in steps if s["name"] in available]
+
+class ScriptedModel(Model):
+    """Drives the real agent loop: each call either requests the next planned tool or streams a final answer.
+
+    Latency: `fault` is time-to-first-token per call; each further text chunk waits `chunk_ms`.
+    With cache_tools / cache_prompt in its config, usage reports the tools + system prefix as a cache
+    write the first time it is seen and as cache reads afterwards, the way Bedrock does.
+    """
+
+    def __init__(self, fault: Fault, chunk_ms: float = 15.0, reply_words: int = 120, seed: int = 0):
+        self.config: Dict[str, Any] = {"model_id": "bench-scripted"}
+        self.fault, self.chunk_ms, self.reply_words = fault, chunk_ms, reply_words
+        self._rng = random.Random(seed)
+        self._cached: set = set()
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("ScriptedModel does not support structured_output")
+        yield  # pragma: no cover
+
+    async def stream(self, messages: List[Dict[str, Any]], tool_specs: Optional[list] = None,
+                     system_prompt: Optional[str] = None, *, tool_choice=None, **kwargs: Any) -> AsyncIterable[Dict[str, Any]]:
+        start = max((i for i, m in enumerate(messages) if _is_turn_start(m)), default=0)
+        prompt = _text_of(messages[start])
+        user_id = (_USER_ID.search(prompt) or [None, "bench"])[1]
+        message = ((_MESSAGE.search(prompt) or [None, prompt])[1]).strip()
+        done = sum(1 for m in messages[start + 1:] if m.get("role") == "assistant")
+        steps = plan(user_id, message, {s["name"] for s in tool_specs or []})
+        input_tokens = (sum(len(json.dumps(m.get("content", []), default=str)) for m in messages)
+                        + len(system_prompt or "") + len(json.dumps(tool_specs or [], default=str))) // 4
+
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.fault.sample(self._rng))
+        if self.fault.fails(self._rng):
+            # What ConverseStream raises on a transient Bedrock fault (throttling would be ModelThrottledException).
+            raise ClientError({"Error": {"Code": "ServiceUnavailableException", "Message": "injected model failure"}},
+                              "ConverseStream")
+        yield {"messageStart": {"role": "assistant"}}
+        if done < len(steps):
+            step = steps[done]
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"tooluse_{uuid.uuid4().hex[:20]}", "name": step["name"]}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(step["input"])}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+            output = len(json.dumps(step["input"])) // 4
+        else:
+            words = [f"w{self._rng.randrange(1000)}" for _ in range(self.reply_words)]
+            for i in range(0, len(words), 8):
+                if i:
+                    await asyncio.sleep(self.chunk_ms / 1000)
+                yield {"contentBlockDelta": {"delta": {"text": " ".join(words[i:i + 8]) + " "}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            output = self.reply_words * 2
+        usage = {"inputTokens": input_tokens, "outputTokens": output}
+        usage.update(self._cache_usage(tool_specs, system_prompt, input_tokens))
+        usage["totalTokens"] = usage["inputTokens"] + output
+        yield {"metadata": {"usage": usage, "metrics": {"latencyMs": int((time.perf_counter() - t0) * 1000)}}}
+
+    def _cache_usage(self, tool_specs: Optional[list], system_prompt: Optional[str], input_tokens: int) -> Dict[str, int]:
+        parts = []
+        if self.config.get("cache_tools"):
+            parts.append(json.dumps(tool_specs or [], sort_keys=True, default=str))
+        if self.config.get("cache_prompt"):
+            parts.append(system_prompt or "")
+        prefix = sum(len(p) for p in parts) // 4
+        if prefix < CACHE_MIN_TOKENS:
+            return {}
+        key = hash(tuple(parts))
+        kind = "cacheReadInputTokens" if key in self._cached else "cacheWriteInputTokens"
+        self._cached.add(key)
+        # Bedrock's inputTokens counts only the uncached part of the prompt.
+        return {kind: prefix, "inputTokens": max(0, input_tokens - prefix)}
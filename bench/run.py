@@ -0,0 +1,245 @@
+# bench/run.py
+"""Offline load test / benchmark for the agent runtime, with every AWS dependency faked.
+
+    python -m bench.run invocations --concurrency 16 --requests 400 --users 40
+    python -m bench.run invocations --stream --profile degraded --fault opensearch=30:400:0.05
+    python -m bench.run search --requests 500 --concurrency 8
+    python -m bench.run log --requests 20000 --concurrency 16
+    python -m bench.run invocations --baseline bench/results/<earlier>.json
+
+`invocations` replays a JSONL corpus (one {"message": ..., "user_id"?: ...} per line; rows with
+title/body are accepted too) against /invocations in-process via httpx.ASGITransport, or against
+a running `python -m bench.serve` with --url. Reports land in bench/results/ as JSON.
+httpx.ASGITransport buffers whole responses, so --stream time-to-first-token is only
+meaningful together with --url.
+"""
+import argparse, asyncio, json, logging, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from . import harness
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            msg = r.get("message") or " ".join(x for x in (r.get("title"), r.get("body")) if x)
+            if msg:
+                rows.append({"message": msg, "user_id": r.get("user_id")})
+    if not rows:
+        raise SystemExit(f"no messages in {path}")
+    return rows
+
+def _work(corpus: List[Dict[str, Any]], n: int, users: int) -> List[Tuple[str, str]]:
+    return [(corpus[i % len(corpus)]["user_id"] or f"bench-{i % users}", corpus[i % len(corpus)]["message"]) for i in range(n)]
+
+def _app_stats() -> Dict[str, Any]:
+    from app import agent, rerank
+    from app.executor import executor
+    from app.log_s3 import shipper
+    return {"log_shipper": shipper.stats(), "rerank": rerank.stats(), "state_cache": agent.state_cache.stats(),
+            "sessions": agent.sessions.stats(), "executor": executor.stats()}
+
+# ---------- invocations ----------
+async def _replay(args, work: List[Tuple[str, str]]) -> Tuple[List[float], List[float], List[float], Dict[str, int], float]:
+    import httpx
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from app.agentcore_runtime import app, logger
+        if not args.verbose:
+            logger.setLevel(logging.WARNING)   # the runtime logs every request at INFO
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+    latencies: List[float] = []
+    ok_latencies: List[float] = []   # completed turns only; under overload fast 429s would flatter latency_ms
+    ttfts: List[float] = []
+    status: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in work:
+        queue.put_nowait(item)
+
+    async def one(user_id: str, message: str):
+        body = {"input": {"user_id": user_id, "message": message}}
+        t0 = time.perf_counter()
+        try:
+            if args.stream:
+                body["stream"] = True
+                code, first = "ok", None
+                async with client.stream("POST", "/invocations", json=body, headers={"Accept": "text/event-stream"}) as resp:
+                    async for line in resp.aiter_lines():
+                        if first is None and line == "event: token":
+                            first = time.perf_counter()
+                        elif line == "event: error":
+                            code = "error_event"
+                    code = str(resp.status_code) if resp.status_code != 200 else code
+                if first is not None:
+                    ttfts.append((first - t0) * 1000)
+            else:
+                for attempt in range(args.retry_after + 1):
+                    resp = await client.post("/invocations", json=body)
+                    code = str(resp.status_code)
+                    if resp.status_code not in (429, 503) or "retry-after" not in resp.headers or attempt == args.retry_after:
+                        break
+                    # Back off as told, like the mobile app; each rejection is counted, the final outcome too.
+                    status[f"{code}_retried"] = status.get(f"{code}_retried", 0) + 1
+                    await asyncio.sleep(float(resp.headers["retry-after"]))
+        except Exception as e:
+            code = type(e).__name__
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if code in ("200", "ok"):
+            ok_latencies.append(latencies[-1])
+        status[code] = status.get(code, 0) + 1
+
+    async def worker():
+        while not queue.empty():
+            await one(*queue.get_nowait())
+
+    t0 = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies, ok_latencies, ttfts, status, time.perf_counter() - t0
+
+def cmd_invocations(args, fakes, rec) -> Dict[str, Any]:
+    corpus = load_corpus(args.corpus)
+    if args.warmup:
+        asyncio.run(_replay(args, _work(corpus, args.warmup, args.users)))
+        rec.samples.clear()
+    latencies, ok_latencies, ttfts, status, wall = asyncio.run(_replay(args, _work(corpus, args.requests, args.users)))
+    report: Dict[str, Any] = {
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "goodput_rps": round(len(ok_latencies) / wall, 2) if wall else 0.0,
+        "status": status,
+        "latency_ms": harness.summarize(latencies),
+        "ok_latency_ms": harness.summarize(ok_latencies),
+    }
+    if args.stream:
+        report["ttft_ms"] = harness.summarize(ttfts)
+    if not args.url:
+        from app.log_s3 import shipper
+        t0 = time.perf_counter()
+        shipper.flush()
+        report["log_flush_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return report
+
+# ---------- search ----------
+def cmd_search(args, fakes, rec) -> Dict[str, Any]:
+    from app import tools_rag
+    queries = [m for _, m in _work(load_corpus(args.corpus), args.requests, 1)]
+    totals: List[float] = []
+    status: Dict[str, int] = {}
+
+    def one(q: str):
+        timings: Dict[str, int] = {}
+        t0 = time.perf_counter()
+        try:
+            out = tools_rag._search_orchestrate(q, None, timings)
+            code = "degraded" if (out.get("rerank") or {}).get("degraded") else "ok"
+        except Exception as e:
+            code = type(e).__name__
+        totals.append((time.perf_counter() - t0) * 1000)
+        status[code] = status.get(code, 0) + 1
+        for stage, ms in timings.items():
+            rec.add(stage, ms)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, queries))
+    wall = time.perf_counter() - t0
+    return {"wall_s": round(wall, 3), "throughput_rps": round(len(totals) / wall, 2), "status": status,
+            "latency_ms": harness.summarize(totals)}
+
+# ---------- log ----------
+def cmd_log(args, fakes, rec) -> Dict[str, Any]:
+    from app.agent import SYSTEM_PROMPT
+    from app.encoding import BACKEND
+    from app.log_s3 import put_json, shipper, _ts
+    payload = {"component": "bench", "answer_text": "x" * args.payload_bytes, "api_key": "redact-me",
+               "state_after": {"todos": [{"id": str(i), "task": "t", "progress": "open"} for i in range(10)]}}
+    prompt = {"component": "bench", "system_prompt": SYSTEM_PROMPT, "message": "x" * (args.payload_bytes // 10)}
+    per_call: List[float] = []
+
+    def one(i: int):
+        area = ("prompts", "answers", "reasoning", "code")[i % 4]
+        t0 = time.perf_counter()
+        put_json(f"bench-{i % args.users}", area, prompt if area == "prompts" else payload, ts=_ts())
+        per_call.append((time.perf_counter() - t0) * 1000)
+
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    t1 = time.perf_counter()
+    shipper.flush()
+    return {"wall_s": round(wall, 3), "throughput_rps": round(args.requests / wall, 2),
+            "latency_ms": harness.summarize(per_call), "log_flush_ms": round((time.perf_counter() - t1) * 1000, 1),
+            "cpu_us_per_event": round(cpu * 1e6 / args.requests, 1), "encoder": BACKEND}
+
+COMMANDS = {"invocations": cmd_invocations, "search": cmd_search, "log": cmd_log}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("command", nargs="?", default="invocations", choices=list(COMMANDS))
+    ap.add_argument("--corpus", default=os.path.join(HERE, "corpus.jsonl"))
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--warmup", type=int, default=0, help="requests replayed first and left out of the report")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--users", type=int, default=20, help="distinct user ids for corpus rows without one")
+    ap.add_argument("--stream", action="store_true", help="use the SSE path and report time to first token")
+    ap.add_argument("--url", help="benchmark a running `python -m bench.serve` instead of in-process")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--retry-after", type=int, default=3, metavar="N",
+                    help="re-send a 429/503 after its Retry-After, up to N times (0: report it as is)")
+    ap.add_argument("--profile", default="default", choices=list(harness.PROFILES))
+    ap.add_argument("--fault", action="append", default=[], metavar="SERVICE=MEDIAN[:P99[:ERR]]",
+                    help=f"override one service's latency/error rate; services: {', '.join(harness.SERVICES)}")
+    ap.add_argument("--docs-per-index", type=int, default=2000)
+    ap.add_argument("--payload-bytes", type=int, default=2000, help="log: size of each event's text field")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--verbose", action="store_true", help="keep the runtime's per-request INFO logging")
+    ap.add_argument("--label", help="results file suffix (default: command name)")
+    ap.add_argument("--out", default=os.path.join(HERE, "results"))
+    ap.add_argument("--baseline", help="earlier results JSON to compare p95s against")
+    args = ap.parse_args(argv)
+
+    harness.configure_env()
+    faults = harness.parse_faults(args.profile, args.fault)
+    fakes = None if args.url else harness.install(faults, args.docs_per_index, args.seed)
+    rec = harness.StageRecorder()
+    rec.install()
+
+    report = COMMANDS[args.command](args, fakes, rec)
+    report.update({
+        "command": args.command,
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "out")},
+        "faults": {k: vars(v) for k, v in faults.items()},
+        "env": harness.environment(),
+        "stages_ms": rec.summary(),
+    })
+    if fakes is not None:
+        report["services"] = fakes.stats()
+        report["app"] = _app_stats()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"{args.command}: {report['latency_ms']['count']} requests "
+          f"in {report['wall_s']}s -> {report['throughput_rps']} req/s" + (f"  status={report['status']}" if "status" in report else "")
+          + (f"  goodput={report['goodput_rps']} req/s" if "goodput_rps" in report else "")
+          + (f"  cpu={report['cpu_us_per_event']}us/event ({report['encoder']})" if "cpu_us_per_event" in report else ""))
+    e2e = ("latency_ms", "ok_latency_ms", "ttft_ms")
+    harness.print_table("end-to-end (ms)", {k: report[k] for k in e2e if k in report},
+                        {k: baseline[k] for k in e2e if baseline and k in baseline})
+    if report["stages_ms"]:
+        harness.print_table("stages (ms)", report["stages_ms"], (baseline or {}).get("stages_ms"))
+    path = harness.save(report, args.out, args.label or args.command)
+    print(f"\nsaved {path}")
+
+if __name__ == "__main__":
+    sys.exit(main())
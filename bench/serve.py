@@ -0,0 +1,27 @@
+# bench/serve.py
+"""Run the real runtime over HTTP with the benchmark fakes installed (for `bench.run --url`).
+
+    python -m bench.serve --port 8080 --profile default
+"""
+import argparse
+
+from . import harness
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--profile", default="default", choices=list(harness.PROFILES))
+    ap.add_argument("--fault", action="append", default=[], metavar="SERVICE=MEDIAN[:P99[:ERR]]")
+    ap.add_argument("--docs-per-index", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    harness.configure_env()
+    harness.install(harness.parse_faults(args.profile, args.fault), args.docs_per_index, args.seed)
+    import uvicorn
+    from app.agentcore_runtime import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,8 @@ import {
   Platform,
   SafeAreaView,
 } from 'react-native';
-import { ChatMessage } from '../types';
-import { AgentcoreService } from '../services/agentcoreService';
+import { ChatMessage, StreamEvent } from '../types';
+import { AgentcoreService, newIdempotencyKey } from '../services/agentcoreService';
 
 interface ChatWindowProps {
   isVisible: boolean;
@@ -61,17 +61,46 @@ const ChatWindow: React.FC<ChatWindowProps> = ({ isVisible, onClose }) => {
     setInputText('');
     setIsLoading(true);
 
+    const aiMessageId = (Date.now() + 1).toString();
+    const idempotencyKey = newIdempotencyKey();
+    let streamed = '';
+    const onEvent = (event: StreamEvent) => {
+      if (event.type !== 'token') return;
+      streamed += event.text;
+      const partial = streamed;
+      setMessages(prev => {
+        const existing = prev.find(m => m.id === aiMessageId);
+        if (existing) {
+          return prev.map(m => (m.id === aiMessageId ? { ...m, text: partial } : m));
+        }
+        return [...prev, { id: aiMessageId, text: partial, isUser: false, timestamp: new Date() }];
+      });
+    };
     try {
-      const response = await agentcore.sendMessage(userMessage.text);
-      
+      let response;
+      try {
+        response = await agentcore.sendMessageStream(userMessage.text, onEvent, idempotencyKey);
+      } catch (firstError) {
+        if (!(firstError instanceof Error) || !firstError.message.startsWith('Network error')) {
+          throw firstError;
+        }
+        // Resend once with the same key: the server attaches to (or replays) the turn it already started.
+        streamed = '';
+        response = await agentcore.sendMessageStream(userMessage.text, onEvent, idempotencyKey);
+      }
+
       const aiMessage: ChatMessage = {
-        id: (Date.now() + 1).toString(),
+        id: aiMessageId,
         text: response.reply,
         isUser: false,
         timestamp: new Date(),
       };
 
-      setMessages(prev => [...prev, aiMessage]);
+      setMessages(prev =>
+        prev.some(m => m.id === aiMessageId)
+          ? prev.map(m => (m.id === aiMessageId ? aiMessage : m))
+          : [...prev, aiMessage],
+      );
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMessage: ChatMessage = {
@@ -1,10 +1,16 @@
-import { AgentResponse } from '../types';
+import { AgentResponse, ScenarioRequest, ScenarioResponse, StateResponse, StreamEvent } from '../types';
 
 const AGENTCORE_BASE_URL = 'http://localhost:8080'; // Update this to your deployed agentcore URL
 
+// One key per user message. Resending the message (e.g. after a network error) with the same key
+// attaches to the turn already running, or replays its result, instead of running a second turn.
+export const newIdempotencyKey = (): string =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
 export class AgentcoreService {
   private static instance: AgentcoreService;
   private userId: string = 'mobile-user-123'; // Default user ID for mobile app
+  private stateCache: { etag: string; data: StateResponse } | null = null;
 
   static getInstance(): AgentcoreService {
     if (!AgentcoreService.instance) {
@@ -15,15 +21,17 @@ export class AgentcoreService {
 
   setUserId(userId: string): void {
     this.userId = userId;
+    this.stateCache = null;
   }
 
-  async sendMessage(message: string): Promise<AgentResponse> {
+  async sendMessage(message: string, idempotencyKey: string = newIdempotencyKey()): Promise<AgentResponse> {
     try {
       const response = await fetch(`${AGENTCORE_BASE_URL}/invoke`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'x-actor-id': this.userId,
+          'Idempotency-Key': idempotencyKey,
         },
         body: JSON.stringify({
           input: {
@@ -45,34 +53,163 @@ export class AgentcoreService {
     }
   }
 
-  async getState(): Promise<AgentResponse> {
-    return this.sendMessage('Get current state');
+  // Streams the reply as Server-Sent Events. XMLHttpRequest is used because React Native's
+  // fetch does not expose a readable body stream; onprogress hands us the text received so far.
+  sendMessageStream(
+    message: string,
+    onEvent: (event: StreamEvent) => void,
+    idempotencyKey: string = newIdempotencyKey(),
+  ): Promise<AgentResponse> {
+    return new Promise((resolve, reject) => {
+      const xhr = new XMLHttpRequest();
+      let consumed = 0;
+      let final: AgentResponse | null = null;
+
+      const drain = () => {
+        const text = xhr.responseText;
+        let boundary = text.indexOf('\n\n', consumed);
+        while (boundary !== -1) {
+          const frame = text.slice(consumed, boundary);
+          consumed = boundary + 2;
+          const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+          if (dataLine) {
+            const event: StreamEvent = JSON.parse(dataLine.slice(6));
+            if (event.type === 'done') {
+              final = { reply: event.reply, state: event.state };
+            } else if (event.type === 'error') {
+              reject(new Error(event.error));
+            }
+            onEvent(event);
+          }
+          boundary = text.indexOf('\n\n', consumed);
+        }
+      };
+
+      xhr.open('POST', `${AGENTCORE_BASE_URL}/invoke`);
+      xhr.setRequestHeader('Content-Type', 'application/json');
+      xhr.setRequestHeader('Accept', 'text/event-stream');
+      xhr.setRequestHeader('x-actor-id', this.userId);
+      xhr.setRequestHeader('Idempotency-Key', idempotencyKey);
+      xhr.onprogress = drain;
+      xhr.onload = () => {
+        if (xhr.status < 200 || xhr.status >= 300) {
+          reject(new Error(`HTTP error! status: ${xhr.status}`));
+          return;
+        }
+        drain();
+        if (final) {
+          resolve(final);
+        } else {
+          reject(new Error('Stream ended without a final response'));
+        }
+      };
+      xhr.onerror = () => reject(new Error('Network error while streaming from agentcore'));
+      xhr.send(
+        JSON.stringify({
+          input: {
+            user_id: this.userId,
+            message: message,
+          },
+          stream: true,
+        }),
+      );
+    });
+  }
+
+  // Reads state straight from the backend (no model call). The last response is kept with its
+  // ETag, so an unchanged state comes back as a body-less 304 and the cached copy is reused.
+  async getState(): Promise<StateResponse> {
+    const headers: { [key: string]: string } = { 'x-actor-id': this.userId };
+    if (this.stateCache) {
+      headers['If-None-Match'] = this.stateCache.etag;
+    }
+    try {
+      const response = await fetch(`${AGENTCORE_BASE_URL}/state`, { headers });
+      if (response.status === 304 && this.stateCache) {
+        return this.stateCache.data;
+      }
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return this.rememberState(response, await response.json());
+    } catch (error) {
+      console.error('Error loading state from agentcore:', error);
+      throw error;
+    }
+  }
+
+  private rememberState(response: Response, data: StateResponse): StateResponse {
+    const etag = response.headers.get('ETag');
+    this.stateCache = etag ? { etag, data } : null;
+    return data;
+  }
+
+  private async writeState(method: string, path: string, body: object): Promise<StateResponse> {
+    try {
+      const response = await fetch(`${AGENTCORE_BASE_URL}${path}`, {
+        method,
+        headers: {
+          'Content-Type': 'application/json',
+          'x-actor-id': this.userId,
+        },
+        body: JSON.stringify(body),
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return this.rememberState(response, await response.json());
+    } catch (error) {
+      console.error(`Error writing state (${method} ${path}):`, error);
+      throw error;
+    }
+  }
+
+  // What-if analysis computed server-side from the saved budget/finance figures (no model call).
+  async getScenarios(request: ScenarioRequest = {}): Promise<ScenarioResponse> {
+    try {
+      const response = await fetch(`${AGENTCORE_BASE_URL}/scenarios`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'x-actor-id': this.userId,
+        },
+        body: JSON.stringify(request),
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Error computing scenarios:', error);
+      throw error;
+    }
   }
 
   // Helper method to update business idea
-  async updateBusinessIdea(businessName: string, idea: string, market: string): Promise<AgentResponse> {
-    const message = `Update business idea: Name: ${businessName}, Idea: ${idea}, Market: ${market}`;
-    return this.sendMessage(message);
+  async updateBusinessIdea(businessName: string, idea: string, market: string): Promise<StateResponse> {
+    return this.writeState('PUT', '/state/business_idea', { business_name: businessName, idea, market });
   }
 
   // Helper method to update budget/finance
-  async updateBudgetFinance(customerCount: number, revenuePerCustomer: number, costPerCustomer: number): Promise<AgentResponse> {
-    const message = `Update budget finance: Customer count: ${customerCount}, Revenue per customer: $${revenuePerCustomer}, Cost per customer: $${costPerCustomer}`;
-    return this.sendMessage(message);
+  async updateBudgetFinance(customerCount: number, revenuePerCustomer: number, costPerCustomer: number): Promise<StateResponse> {
+    return this.writeState('PUT', '/state/budget_finance', {
+      customer_count: customerCount,
+      revenue_per_customer: revenuePerCustomer,
+      cost_per_customer: costPerCustomer,
+    });
   }
 
   // Helper method to add todo
-  async addTodo(task: string, dueDate: string, progress: string = 'not_started'): Promise<AgentResponse> {
-    const message = `Add todo: Task: ${task}, Due date: ${dueDate}, Progress: ${progress}`;
-    return this.sendMessage(message);
+  async addTodo(task: string, dueDate: string, progress: string = 'not_started'): Promise<StateResponse> {
+    return this.writeState('POST', '/state/todos', { task, due_date: dueDate, progress });
   }
 
   // Helper method to update todo
-  async updateTodo(todoId: string, task?: string, dueDate?: string, progress?: string): Promise<AgentResponse> {
-    let message = `Update todo ${todoId}`;
-    if (task) message += `, Task: ${task}`;
-    if (dueDate) message += `, Due date: ${dueDate}`;
-    if (progress) message += `, Progress: ${progress}`;
-    return this.sendMessage(message);
+  async updateTodo(todoId: string, task?: string, dueDate?: string, progress?: string): Promise<StateResponse> {
+    return this.writeState('PATCH', `/state/todos/${encodeURIComponent(todoId)}`, {
+      task,
+      due_date: dueDate,
+      progress,
+    });
   }
 }
@@ -22,6 +22,40 @@ export interface AgentResponse {
   state: BusinessState;
 }
 
+// Response of the direct state API (/state); `version` changes on every write.
+export interface StateResponse {
+  state: BusinessState;
+  version: number;
+  result?: { [key: string]: unknown };
+}
+
+export type StreamEvent =
+  | { type: 'token'; text: string }
+  | { type: 'tool_use'; tool: string; tool_use_id: string }
+  | { type: 'tool_result'; tool_use_id: string; status: string }
+  | { type: 'done'; reply: string; state: BusinessState; replayed?: boolean }
+  | { type: 'error'; error: string; retry_after?: number };
+
+export type ScenarioAnalysis = 'base' | 'grid' | 'growth' | 'break_even' | 'monte_carlo';
+
+export interface ScenarioRequest {
+  analyses?: ScenarioAnalysis[];
+  fixed_costs?: number;
+  overrides?: { customer_count?: number; revenue_per_customer?: number; cost_per_customer?: number };
+  options?: { [analysis: string]: { [key: string]: unknown } };
+}
+
+// Compact summaries from POST /scenarios; only the requested analyses are present.
+export interface ScenarioResponse {
+  inputs: { [key: string]: number };
+  base?: { [key: string]: number | null };
+  grid?: { [key: string]: unknown };
+  growth?: { [key: string]: unknown };
+  break_even?: { [key: string]: number | null };
+  monte_carlo?: { [key: string]: unknown };
+  took_ms: number;
+}
+
 export interface BusinessPlanSection {
   id: string;
   title: string;